@@ -26,8 +26,13 @@ write = data.write
 get_handler = data.get_handler
 get_reader = data.get_reader
 get_writer = data.get_writer
+preload = data.preload
 dict_merge = data.dict_merge
 DataError = data.DataError
+ReaderRecord = data.ReaderRecord
+ParseCache = data.ParseCache
+dump_jsonl = data.dump_jsonl
+load_jsonl = data.load_jsonl
 acquisition_properties_by_type_list = data.acquisition_properties_by_type_list
 session_properties_by_type_list = data.session_properties_by_type_list
 project_properties_by_type_list = data.project_properties_by_type_list
@@ -0,0 +1,8 @@
+"""
+scitran.data.bench
+==================
+
+Benchmarks that synthesize their own inputs, and so run without the testdata repository.
+Each module can be run with ``python -m scitran.data.bench.<module> --help``.
+
+"""
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Measure mr.adjust_bvecs on multi-shell dwi gradient tables, against the per-bvec loops it replaced.
+
+Builds a gradient table of --directions bvecs stored with 4 decimals, over b=0, 1000, 2000 and
+3000 shells, then times
+    - loop: scale_bvals and rotate_bvecs as they were, with a dot product per bvec, a full pass
+      over the bvecs per rounding precision, and a np.matrix rotation
+    - vectorized: mr.adjust_bvecs
+
+and checks that both give identical bvecs and bvals.
+
+"""
+
+import time
+import argparse
+import numpy as np
+
+from ..medimg.dcm.mr import mr
+
+
+def gradient_table(num_directions, decimals=4, seed=0):
+    """Return (bvecs, bvals) of num_directions, as stored in dicoms: 3xN bvecs scaled by shell."""
+    rng = np.random.RandomState(seed)
+    bvecs = rng.normal(size=(3, num_directions))
+    bvecs /= np.sqrt((bvecs ** 2).sum(axis=0))
+    bvals = np.repeat([0., 1000., 2000., 3000.], num_directions // 4 + 1)[:num_directions]
+    bvecs *= np.sqrt(bvals / bvals.max())   # scanners store the shell in the bvec magnitude
+    return bvecs.round(decimals), np.repeat(bvals.max(), num_directions)
+
+
+def scale_bvals_loop(bvecs, bvals):
+    """mr.scale_bvals, as it was before vectorization."""
+    if np.count_nonzero(bvecs) != 0 and np.count_nonzero(bvals) != 0:
+        sqmag = np.array([bv.dot(bv) for bv in bvecs.T])
+        try:
+            num_decimals = np.nonzero([np.max(np.abs(bvecs - bvecs.round(decimals=d))) for d in range(9)])[0][-1] + 1
+        except IndexError:
+            num_decimals = 1
+        sqmag = np.around(sqmag, decimals=num_decimals - 1)
+        bvals *= sqmag
+        sqmag[sqmag == 0] = np.inf
+        bvecs /= np.sqrt(sqmag)
+    return bvecs, bvals
+
+
+def rotate_bvecs_loop(bvecs, bvals, rotation):
+    """mr.rotate_bvecs, as it was before vectorization."""
+    bvecs = np.array(np.matrix(rotation) * bvecs)
+    norm = np.sqrt(np.array([bv.dot(bv) for bv in bvecs.T]))
+    norm[norm == 0] = np.inf
+    bvecs /= norm
+    return bvecs, bvals
+
+
+def adjust_bvecs_loop(bvecs, bvals, rotation):
+    """mr.adjust_bvecs of GE dwi, as it was before vectorization."""
+    bvecs, bvals = scale_bvals_loop(bvecs, bvals)
+    return rotate_bvecs_loop(bvecs, bvals, rotation)
+
+
+def rotation_matrix(seed=0):
+    """Return a random 3x3 rotation, as the image orientation of an oblique acquisition."""
+    q, _ = np.linalg.qr(np.random.RandomState(seed).normal(size=(3, 3)))
+    return q
+
+
+def best_of(func, bvecs, bvals, rotation, repeat):
+    times = []
+    for _ in range(repeat):
+        args = bvecs.copy(), bvals.copy(), rotation     # both scale in place
+        start = time.time()
+        result = func(*args)
+        times.append(time.time() - start)
+    return min(times), result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--directions', type=int, default=5000, help='number of bvecs [5000]')
+    ap.add_argument('--repeat', type=int, default=5, help='report the best of this many runs [5]')
+    args = ap.parse_args()
+
+    bvecs, bvals = gradient_table(args.directions)
+    rotation = rotation_matrix()
+    loop_sec, expected = best_of(adjust_bvecs_loop, bvecs, bvals, rotation, args.repeat)
+    vectorized_sec, result = best_of(lambda v, b, r: mr.adjust_bvecs(v, b, 'GE MEDICAL SYSTEMS', r),
+                                     bvecs, bvals, rotation, args.repeat)
+    if not all([np.array_equal(e, r) for e, r in zip(expected, result)]):
+        raise ValueError('vectorized bvecs or bvals differ from the loops')
+    print '%d directions' % args.directions
+    print '%-12s %10.2f ms' % ('loop', loop_sec * 1000)
+    print '%-12s %10.2f ms  (%.0fx)' % ('vectorized', vectorized_sec * 1000, loop_sec / vectorized_sec)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Measure the per-file overhead of resolving handlers, on small synthetic dicom archives.
+
+After preload(['dicom', 'nifti']), times
+    - get_reader: data.get_reader('dicom') and data.get_writer('nifti')
+    - parse: data.parse of one-image GE MR archives, which resolves the reader and the dicom
+      composer of every file
+
+"""
+
+import os
+import time
+import logging
+import argparse
+
+from .. import data
+from .. import tempdir as tempfile
+from .synth import write_dicom_zip
+
+
+def per_call(func, number, repeat):
+    """Return the best time of a call to func, over repeat runs of number calls."""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        for _ in xrange(number):
+            func()
+        times.append((time.time() - start) / number)
+    return min(times)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--number', type=int, default=200, help='calls per run [200]')
+    ap.add_argument('--repeat', type=int, default=3, help='report the best of this many runs [3]')
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    data.preload(['dicom', 'nifti'])
+    resolve_us = per_call(lambda: (data.get_reader('dicom'), data.get_writer('nifti')), args.number * 100, args.repeat) * 1e6
+    with tempfile.TemporaryDirectory() as dirpath:
+        path = os.path.join(dirpath, 'series.zip')
+        write_dicom_zip(path, 1, num_images=1)
+        parse_us = per_call(lambda: data.parse(path, cache=False), args.number, args.repeat) * 1e6
+    print '%-12s %10.1f us per reader and writer' % ('get_reader', resolve_us)
+    print '%-12s %10.1f us per file' % ('parse', parse_us)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Measure json lines export and import of reader metadata, against the util.datetime_* hooks.
+
+Builds synthetic ReaderRecords, then times
+    - hooks: json.dumps(default=util.datetime_encoder) per record, and
+      json.loads(object_hook=util.datetime_decoder) per line
+    - jsonl: data.dump_jsonl and data.load_jsonl
+
+"""
+
+import json
+import time
+import argparse
+import datetime
+import cStringIO
+
+from .. import data
+from .. import util
+
+
+def make_records(num_records):
+    """Return num_records ReaderRecords with realistic values."""
+    start = datetime.datetime(2015, 1, 1, 8, 0, 0, 123000)
+    records = []
+    for i in range(num_records):
+        values = {
+            'filepath': '/scratch/reap/ex%d/%d_1_dicom.zip' % (1000 + i // 20, i),
+            'failure_reason': None,
+            'nims_group_id': u'lab',
+            'nims_project': u'project',
+            'nims_session_id': u'1.2.840.113619.2.%d' % (i // 20),
+            'nims_session_label': u'2015-01-01 08:00',
+            'nims_session_subject': u'ex%d' % (1000 + i // 20),
+            'nims_acquisition_id': u'1.2.840.113619.2.%d.%d_1' % (i // 20, i),
+            'nims_acquisition_label': u'%d.1' % (i % 20),
+            'nims_acquisition_description': u'fMRI run %d' % (i % 20),
+            'nims_file_name': u'%d_1_dicom' % i,
+            'nims_file_ext': u'.zip',
+            'nims_file_domain': u'mr',
+            'nims_file_type': u'dicom',
+            'nims_file_kinds': [u'functional'],
+            'nims_file_state': [u'orig'],
+            'nims_metadata_status': u'complete',
+            'nims_timestamp': start + datetime.timedelta(minutes=i),
+            'nims_timezone': u'America/Los_Angeles',
+        }
+        records.append(data.ReaderRecord(**values))
+    return records
+
+
+def dump_with_hooks(records, fp):
+    for rec in records:
+        fp.write(json.dumps(data.export_fields(rec), default=util.datetime_encoder))
+        fp.write('\n')
+
+
+def load_with_hooks(fp):
+    return [json.loads(line, object_hook=util.datetime_decoder) for line in fp]
+
+
+def best_of(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        times.append(time.time() - start)
+    return min(times), result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--records', type=int, default=20000, help='number of records [20000]')
+    ap.add_argument('--repeat', type=int, default=3, help='report the best of this many runs [3]')
+    args = ap.parse_args()
+
+    records = make_records(args.records)
+
+    def dump(func):
+        buf = cStringIO.StringIO()
+        func(records, buf)
+        return buf.getvalue()
+
+    hooks_dump_sec, hooks_text = best_of(lambda: dump(dump_with_hooks), args.repeat)
+    jsonl_dump_sec, jsonl_text = best_of(lambda: dump(data.dump_jsonl), args.repeat)
+    hooks_load_sec, hooks_loaded = best_of(lambda: load_with_hooks(cStringIO.StringIO(hooks_text)), args.repeat)
+    jsonl_load_sec, jsonl_loaded = best_of(lambda: data.load_jsonl(cStringIO.StringIO(jsonl_text)), args.repeat)
+    if [json.loads(l) for l in hooks_text.splitlines()] != [json.loads(l) for l in jsonl_text.splitlines()]:
+        raise ValueError('dump_jsonl output differs from the hooks')
+    if hooks_loaded != jsonl_loaded:
+        raise ValueError('load_jsonl result differs from the hooks')
+
+    print '%d records' % args.records
+    for name, hooks_sec, jsonl_sec in [('dump', hooks_dump_sec, jsonl_dump_sec), ('load', hooks_load_sec, jsonl_load_sec)]:
+        print '%s  %-6s %10.0f records/s' % (name, 'hooks', args.records / hooks_sec)
+        print '%s  %-6s %10.0f records/s  (%.1fx)' % (name, 'jsonl', args.records / jsonl_sec, hooks_sec / jsonl_sec)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Benchmark reading mux_epi slice recon outputs with read_mat_vars, against scipy.io.loadmat.
+
+Writes one sl_NNN.mat per multiband slice group, as the mux recon does, then times
+    - loadmat: scipy.io.loadmat of every variable, then the previous merge, which allocated a
+      full size volume per file and added it into the output
+    - read_mat_vars: PFile.merge_imagedata_from_file, which reads only d, d_size and sl_loc,
+      and adds each slice into a preallocated float32 volume
+
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import scipy.io
+
+from .. import tempdir as tempfile
+from ..medimg import pfile
+
+
+def write_slice_files(dirpath, matrix, num_slices, num_bands, num_timepoints, extra_mb, compress):
+    """Write the slice files of a num_slices volume, each with num_bands slices."""
+    num_groups = num_slices // num_bands
+    paths = []
+    for group in range(num_groups):
+        mat = {
+            'd': np.random.rand(matrix, matrix, num_bands, num_timepoints),
+            'd_size': np.array([matrix, matrix, num_slices, num_timepoints], np.float64),
+            'sl_loc': np.arange(group, num_slices, num_groups)[:num_bands] + 1.,
+        }
+        if extra_mb:
+            mat['unused'] = np.random.rand(int(extra_mb * 1024 * 1024 / 8))
+        path = os.path.join(dirpath, 'sl_%03d.mat' % group)
+        scipy.io.savemat(path, mat, do_compression=compress)
+        paths.append(path)
+    return paths
+
+
+def merge_with_loadmat(paths):
+    """The merge as it was, with loadmat and a full size volume per file."""
+    img = None
+    for path in paths:
+        mat = scipy.io.loadmat(path)
+        sz = mat['d_size'].flatten().astype(int)
+        slice_locs = mat['sl_loc'].flatten().astype(int) - 1
+        new_img = np.zeros(sz, mat['d'].dtype)
+        new_img[:,:,slice_locs,...] = np.atleast_3d(mat['d'])[::-1,...]
+        if img is None:
+            img = new_img
+        else:
+            t = min(img.shape[-1], new_img.shape[-1])
+            img[...,0:t] += new_img[...,0:t]
+    return img.astype(np.float32)
+
+
+def merge_with_read_mat_vars(paths):
+    ds = pfile.PFile.__new__(pfile.PFile)       # merging does not need a parsed pfile
+    img = None
+    for path in paths:
+        img, _ = ds.merge_imagedata_from_file(path, img)
+    return img
+
+
+def best_of(func, paths, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        result = func(paths)
+        times.append(time.time() - start)
+    return min(times), result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--matrix', type=int, default=96, help='in-plane matrix size [96]')
+    ap.add_argument('--slices', type=int, default=64, help='number of slices [64]')
+    ap.add_argument('--bands', type=int, default=4, help='multiband factor, slices per file [4]')
+    ap.add_argument('--timepoints', type=int, default=50, help='number of timepoints [50]')
+    ap.add_argument('--extra-mb', type=float, default=0, help='MB of unused variables per file [0]')
+    ap.add_argument('--compress', action='store_true', help='write compressed mat files')
+    ap.add_argument('--repeat', type=int, default=3, help='report the best of this many runs [3]')
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as dirpath:
+        paths = write_slice_files(dirpath, args.matrix, args.slices, args.bands, args.timepoints, args.extra_mb, args.compress)
+        size_mb = sum([os.path.getsize(p) for p in paths]) / 1048576.
+        print '%d files, %.1f MB%s' % (len(paths), size_mb, ', compressed' if args.compress else '')
+        loadmat_sec, expected = best_of(merge_with_loadmat, paths, args.repeat)
+        direct_sec, result = best_of(merge_with_read_mat_vars, paths, args.repeat)
+        if not np.array_equal(result, expected):
+            raise ValueError('read_mat_vars result differs from loadmat')
+        print '%-14s %8.3f s' % ('loadmat', loadmat_sec)
+        print '%-14s %8.3f s  (%.1fx)' % ('read_mat_vars', direct_sec, loadmat_sec / direct_sec)
+
+
+if __name__ == '__main__':
+    main()
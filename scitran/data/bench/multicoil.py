@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Measure ge.stack_groups on a GE multicoil series, against stacking each coil and joining them.
+
+Synthesizes a 3dgrass series of --coils receive coils plus the combined image, at --slices slices
+of --matrix x --matrix, groups its dicoms by coil as ge.parse_all does, then times
+    - sequence: a DicomStack and NiftiWrapper per coil, joined by NiftiWrapper.from_sequence, as
+      multicoil_convert and fastcard_convert did
+    - stack_groups: ge.stack_groups, on --threads threads
+
+and checks that both give identical voxels and affines.  Pixel data is decoded before either is
+measured.  Each run is measured in a forked child.  Reports the best time of --repeat runs, and the
+peak RSS growth of each.
+
+"""
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+from ..medimg.dcm import dcm
+from ..medimg.dcm.mr import ge
+from . import synth
+from . import suite
+
+
+class Series(object):
+
+    """What stack_groups needs of a Dicom: num_slices and filepath."""
+
+    def __init__(self, num_slices):
+        self.num_slices = num_slices
+        self.filepath = 'multicoil'
+
+
+def coil_groups(num_coils, num_slices=24, matrix=64):
+    """Return the dicoms of a synthetic multicoil series, grouped by coil as ge.parse_all does."""
+    dcm_list = synth.mr_series(psd_name='3dgrass', matrix=matrix, num_slices=num_slices, num_coils=num_coils)
+    geometry = dcm.geometry_table(dcm_list)
+    return [(dcm_list[x::num_coils + 1], geometry[x::num_coils + 1]) for x in xrange(num_coils + 1)]
+
+
+def stack_groups_sequence(self, groups, label):
+    """ge.stack_groups, as multicoil_convert did it before the preallocated output."""
+    _, dcmstack = dcm.import_dicom_stack()
+    stacks = []
+    for group, geometry in groups:
+        stack = dcmstack.DicomStack()
+        for d in group:
+            stack.add_dcm(d, dcm.MetaExtractor(d))
+        stacks.append(stack.to_nifti_wrapper())
+    nii = dcmstack.dcmmeta.NiftiWrapper.from_sequence(stacks).nii_img
+    return nii.get_data(), nii.get_affine()
+
+
+def measure(func, series, groups):
+    """Run func in a forked child, so that the memory of one run does not hide that of the next; return its (seconds, peak MB)."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        suite.reset_peak()
+        before = suite.rss_mb()
+        start = time.time()
+        func(series, groups, 'coil')
+        output = json.dumps([time.time() - start, max(suite.peak_mb() - before, 0.)])
+        with os.fdopen(write_fd, 'w') as fp:
+            fp.write(output)
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as fp:
+        output = fp.read()
+    os.waitpid(pid, 0)
+    return json.loads(output)
+
+
+def best_of(func, series, groups, repeat):
+    runs = [measure(func, series, groups) for _ in range(repeat)]
+    return min([r[0] for r in runs]), min([r[1] for r in runs])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--coils', type=int, default=32, help='receive coils [32]')
+    ap.add_argument('--slices', type=int, default=24, help='slices per coil [24]')
+    ap.add_argument('--matrix', type=int, default=128, help='rows and columns of each slice [128]')
+    ap.add_argument('--threads', type=int, default=ge.STACK_THREADS, help='threads of stack_groups [%d]' % ge.STACK_THREADS)
+    ap.add_argument('--repeat', type=int, default=3, help='report the best of this many runs [3]')
+    args = ap.parse_args()
+
+    ge.STACK_THREADS = args.threads
+    series = Series(args.slices)
+    groups = coil_groups(args.coils, args.slices, args.matrix)
+    dcm.MetaExtractor.load()
+    for group, _ in groups:
+        for d in group:
+            d.pixel_array   # pydicom keeps the decoded pixels, so decode them before either is measured
+    sequence_sec, sequence_mb = best_of(stack_groups_sequence, series, groups, args.repeat)
+    stack_sec, stack_mb = best_of(ge.stack_groups, series, groups, args.repeat)
+    expected = stack_groups_sequence(series, groups, 'coil')
+    result = ge.stack_groups(series, groups, 'coil')
+    if not all([np.array_equal(e, r) for e, r in zip(expected, result)]):
+        raise ValueError('stack_groups voxels or affine differ from from_sequence')
+    print '%d coils + 1 combined, %d slices of %dx%d, %d threads' % (args.coils, args.slices, args.matrix, args.matrix, args.threads)
+    print '%-14s %10.1f ms %8.1f MB' % ('sequence', sequence_sec * 1000, sequence_mb)
+    print '%-14s %10.1f ms %8.1f MB  (%.1fx)' % ('stack_groups', stack_sec * 1000, stack_mb, sequence_sec / stack_sec)
+
+
+if __name__ == '__main__':
+    main()
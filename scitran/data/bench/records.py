@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Measure the memory held by parsed, not loaded, dicom readers against their ReaderRecords.
+
+Writes one synthetic GE MR dicom archive per series, each with a set of filler private tags to
+stand in for the vendor header, then parses every archive
+    - reader: parse(path), which keeps the Reader, its header and its per-instance __dict__
+    - record: parse(path, compact=True), which keeps only the ReaderRecord
+
+Sizes are the sum of sys.getsizeof over every object reachable from the result, counting shared
+objects once.
+
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+from .. import data
+from .. import tempdir as tempfile
+from .synth import write_dicom_zip
+
+
+def deep_sizeof(obj, seen=None):
+    """Sum sys.getsizeof over obj and every object reachable from it, counting each once."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, type):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum([deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.iteritems()])
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum([deep_sizeof(v, seen) for v in obj])
+    if hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--series', type=int, default=50, help='number of archives [50]')
+    ap.add_argument('--images', type=int, default=4, help='dicoms per archive [4]')
+    ap.add_argument('--tags', type=int, default=500, help='filler private tags per dicom [500]')
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as dirpath:
+        paths = [os.path.join(dirpath, '%03d.zip' % s) for s in range(args.series)]
+        for series, path in enumerate(paths):
+            write_dicom_zip(path, series + 1, args.images, args.tags)
+        readers = [data.parse(path) for path in paths]
+        records = [data.parse(path, compact=True) for path in paths]
+
+    reader_kb = deep_sizeof(readers) / 1024. / len(paths)
+    record_kb = deep_sizeof(records) / 1024. / len(paths)
+    print '%d archives, %d tags per dicom' % (len(paths), args.tags)
+    print '%-8s %10.1f KB per parsed file' % ('reader', reader_kb)
+    print '%-8s %10.1f KB per parsed file  (%.0fx smaller)' % ('record', record_kb, reader_kb / record_kb)
+
+
+if __name__ == '__main__':
+    main()
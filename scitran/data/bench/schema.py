@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Measure schema assembly for a 20 type list, with and without the memoized merge.
+
+Times, per call of each *_properties_by_type_list
+    - merge: module_by_type and dict_merge of every type, as each call did before memoization
+    - memoized: the memoized merge, which copies the cached schema with copy_schema
+
+"""
+
+import time
+import argparse
+
+from .. import data
+
+TIERS = ['acquisition_properties', 'session_properties', 'project_properties']
+
+
+def type_list(num_types):
+    """Return num_types (domain, kind) pairs, cycling through the types of modules.json."""
+    types = [tuple((t.split('.') + [None])[:2]) for t in sorted(data.MODULES)]
+    return [types[i % len(types)] for i in range(num_types)]
+
+
+def merge(tier, types):
+    """Merge as each call did before memoization."""
+    return data.dict_merge([getattr(data.module_by_type(t), tier) for t in types])
+
+
+def memoized(tier, types):
+    return getattr(data, '%s_by_type_list' % tier)(types)
+
+
+def per_call(func, types, number, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        for _ in xrange(number):
+            for tier in TIERS:
+                func(tier, types)
+        times.append((time.time() - start) / number)
+    return min(times)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--types', type=int, default=20, help='length of the type list [20]')
+    ap.add_argument('--number', type=int, default=200, help='calls per run [200]')
+    ap.add_argument('--repeat', type=int, default=3, help='report the best of this many runs [3]')
+    args = ap.parse_args()
+
+    types = type_list(args.types)
+    for tier in TIERS:
+        if memoized(tier, types) != merge(tier, sorted(set(types))):
+            raise ValueError('memoized %s differs from merge' % tier)
+    merge_us = per_call(merge, types, args.number, args.repeat) * 1e6
+    memoized_us = per_call(memoized, types, args.number, args.repeat) * 1e6
+    print '%d types, all three tiers per call' % len(types)
+    print '%-10s %10.1f us' % ('merge', merge_us)
+    print '%-10s %10.1f us  (%.0fx)' % ('memoized', memoized_us, merge_us / memoized_us)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Measure the import cost of scitran.data, and of resolving each reader and writer.
+
+Each target runs in a fresh interpreter, which times importing scitran.data and resolving the
+target, and reports which of the heavy dependencies (pydicom, dcmstack, nibabel, mne, PIL) were
+imported.  A target is over budget if it imports a heavy module that BUDGET does not allow it, or
+if it takes longer than --max-ms.
+
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+from .. import data
+
+HEAVY = ['dicom', 'dcmstack', 'nibabel', 'mne', 'PIL']
+
+# heavy modules each target may import; targets that are not listed may import none
+BUDGET = {
+    'reader nifti': ['dicom', 'nibabel'],
+    'writer nifti': ['dicom', 'nibabel'],
+    'writer montage': ['PIL'],
+    'writer png': ['PIL'],
+}
+
+_CHILD = """
+import sys, time, json
+start = time.time()
+import scitran.data
+%s
+seconds = time.time() - start
+print json.dumps({'seconds': seconds, 'modules': [m for m in %r if m in sys.modules]})
+"""
+
+
+def targets():
+    """Return (name, statement) of importing scitran.data, and of resolving each handler."""
+    result = [
+        ('import', 'pass'),
+        ('schema', 'scitran.data.acquisition_properties_by_type_list(%r)'
+                   % [tuple((t.split('.') + [None])[:2]) for t in sorted(data.MODULES)]),
+    ]
+    result += [('reader %s' % r, 'scitran.data.get_reader(%r)' % r) for r in sorted(data.READERS)]
+    result += [('writer %s' % w, 'scitran.data.get_writer(%r)' % w) for w in sorted(data.WRITERS)]
+    return result
+
+
+def measure(statement):
+    """Run statement after importing scitran.data in a fresh interpreter; return (seconds, modules)."""
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(data.__file__))))
+    env['PYTHONPATH'] = os.pathsep.join([root] + filter(None, [env.get('PYTHONPATH')]))
+    output = subprocess.check_output([sys.executable, '-c', _CHILD % (statement, HEAVY)], env=env)
+    result = json.loads(output.strip().splitlines()[-1])
+    return result['seconds'], result['modules']
+
+
+def over_budget(name, modules):
+    """Return the heavy modules that target name imported beyond its budget."""
+    return sorted(set(modules) - set(BUDGET.get(name, [])))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--repeat', type=int, default=3, help='report the best of this many runs [3]')
+    ap.add_argument('--max-ms', type=float, help='time budget of each target, in ms')
+    args = ap.parse_args()
+
+    failed = False
+    for name, statement in targets():
+        seconds, modules = min([measure(statement) for _ in range(args.repeat)])
+        over = over_budget(name, modules)
+        if args.max_ms and seconds * 1000 > args.max_ms:
+            over.append('time')
+        failed = failed or bool(over)
+        print '%-18s %8.1f ms  %-24s %s' % (name, seconds * 1000, ' '.join(modules), 'OVER: ' + ' '.join(over) if over else '')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+"""
+Time and memory-profile parse, load_data, convert and write, on synthetic inputs of every reader.
+
+Each case synthesizes its input with bench.synth, then runs its stages in order, in a forked
+child, so that the memory of one case does not count against the next
+    - parse: data.parse(path, filetype), without the parse cache
+    - load_data: ds.load_data(), without the dicom convert
+    - convert: the dicom composer's convert, which stacks the dicoms into voxels
+    - write: each writer, on the loaded MRVolume stand in
+
+A stage that raises is recorded with its error, and the later stages of its case are skipped.  A
+stage that cannot run here is recorded as skipped, with the reason; P-file data, for example,
+cannot be loaded without the proprietary gepfile module.
+
+Reports the best time of --repeat runs, and the peak RSS growth of the stage: the high water
+mark of the child during the stage, less its RSS before.  The high water mark is reset before
+each stage where linux allows it, and is otherwise that of the whole child.  Results are written as json with
+--output, and compared against an earlier run with --compare, which exits 1 if any stage is
+slower than --threshold times its earlier time.
+
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import datetime
+import resource
+import traceback
+
+from .. import data
+from .. import tempdir as tempfile
+from . import synth
+
+STAGES = ['parse', 'load_data', 'convert', 'write']
+
+
+class SkipStage(Exception):
+    """Raised by a stage that cannot run here, such as loading P-file data without gepfile."""
+
+
+def _dicom_case(name):
+    return 'dicom', 'dicom.zip', lambda path: synth.write_mr_zip(path, name)
+
+# (filetype, filename, make) by case name; make synthesizes the input at path, or returns the
+# MRVolume of a writer case
+CASES = dict([('dicom %s' % name, _dicom_case(name)) for name in synth.MR_SERIES])
+CASES.update({
+    'pfile': ('pfile', 'P12345.7', synth.write_pfile),
+    'nifti': ('nifti', 'bench.nii.gz', synth.write_nifti),
+    'meeg': ('meeg', 'meeg.zip', synth.write_meeg_zip),
+    'writer nifti': (None, None, lambda path: synth.MRVolume()),
+    'writer montage': (None, None, lambda path: synth.MRVolume()),
+    'writer png': (None, None, lambda path: synth.MRVolume(shape=(64, 64, 12))),
+})
+
+_PAGE_MB = resource.getpagesize() / 2. ** 20
+
+
+def rss_mb():
+    """Return the resident set size of this process, in MB."""
+    with open('/proc/self/statm') as fp:
+        return int(fp.read().split()[1]) * _PAGE_MB
+
+
+def reset_peak():
+    """Reset the high water mark of the resident set size to the current size, on linux 4.0 and up."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as fp:
+            fp.write('5')
+    except IOError:
+        pass
+
+
+def peak_mb():
+    """Return the high water mark of the resident set size of this process, in MB."""
+    try:
+        with open('/proc/self/status') as fp:
+            for line in fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def has_gepfile():
+    """Return whether the proprietary gepfile module, that PFile loads data with, can be imported."""
+    from ..medimg import pfile
+    try:
+        __import__('gepfile', vars(pfile))      # as PFile imports it
+    except ImportError:
+        return False
+    return True
+
+
+def stages(case, dirpath):
+    """Yield (stage, func) of case, in order; each func runs its stage on the results of the last."""
+    filetype, filename, make = CASES[case]
+    if filetype is None:
+        volume = make(None)
+        writer = case.split()[-1]
+        yield 'write', lambda: data.get_writer(writer).write(volume, volume.data, os.path.join(dirpath, 'out'))
+        return
+    path = make(os.path.join(dirpath, filename))
+    state = {}
+
+    def parse():
+        if filetype == 'nifti':     # parse only takes zips and pfiles
+            state['ds'] = data.get_reader(filetype)(path)
+        else:
+            state['ds'] = data.parse(path, filetype=filetype, ignore_json=filetype == 'pfile', cache=False)
+
+    def load_data():
+        if filetype == 'pfile' and not has_gepfile():
+            raise SkipStage('pfile data cannot be loaded without gepfile')
+        ds = state['ds']
+        if filetype == 'dicom':
+            state['convert'] = ds.convert
+            ds.convert = lambda: None
+        ds.load_data()
+        if getattr(ds, 'failure_reason', None):
+            raise ds.failure_reason
+
+    def convert():
+        if state['convert'].im_func is data.get_reader('dicom').convert.im_func:
+            raise data.DataError('no composer matched the dicoms of %s' % case)
+        state['convert']()
+
+    def write():
+        ds = state['ds']
+        return data.get_writer('nifti').write(ds, ds.data, os.path.join(dirpath, 'out'))
+
+    yield 'parse', parse
+    yield 'load_data', load_data
+    if filetype == 'dicom':
+        yield 'convert', convert
+        yield 'write', write
+
+
+def run_case(case):
+    """Run the stages of case in this process; return {stage: result}."""
+    results = {}
+    with tempfile.TemporaryDirectory() as dirpath:
+        for stage, func in stages(case, dirpath):
+            reset_peak()
+            before = rss_mb()
+            start = time.time()
+            try:
+                func()
+            except SkipStage as e:
+                results[stage] = {'skipped': str(e)}
+                break
+            except Exception as e:
+                results[stage] = {'error': '%s: %s' % (type(e).__name__, ' '.join(str(e).split()))}
+                logging.getLogger(__name__).debug(traceback.format_exc())
+                break
+            results[stage] = {'seconds': time.time() - start, 'peak_mb': max(peak_mb() - before, 0.)}
+    return results
+
+
+def fork_case(case):
+    """Run case in a forked child; return its results."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            output = json.dumps(run_case(case))
+        except Exception as e:
+            output = json.dumps({'setup': {'error': '%s: %s' % (type(e).__name__, e)}})
+        with os.fdopen(write_fd, 'w') as fp:
+            fp.write(output)
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as fp:
+        output = fp.read()
+    os.waitpid(pid, 0)
+    return json.loads(output)
+
+
+def best(runs):
+    """Merge repeated runs of a case, keeping the least time and memory of each stage."""
+    results = runs[0]
+    for run in runs[1:]:
+        for stage, result in run.iteritems():
+            if 'seconds' in result and 'seconds' in results.get(stage, {}):
+                results[stage]['seconds'] = min(results[stage]['seconds'], result['seconds'])
+                results[stage]['peak_mb'] = min(results[stage]['peak_mb'], result['peak_mb'])
+    return results
+
+
+def run(cases, repeat=3):
+    """Run each case repeat times; return the results, with the environment they ran in."""
+    return {
+        'created': datetime.datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'cases': dict([(case, best([fork_case(case) for _ in range(repeat)])) for case in cases]),
+    }
+
+
+def compare(old, new, threshold=1.2):
+    """Yield (case, stage, old seconds, new seconds, regressed) of each stage timed in both results."""
+    for case in sorted(new['cases']):
+        for stage in STAGES:
+            before = old['cases'].get(case, {}).get(stage, {}).get('seconds')
+            after = new['cases'][case].get(stage, {}).get('seconds')
+            if before and after:
+                yield case, stage, before, after, after > before * threshold
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('cases', nargs='*', help='cases to run [all]: %s' % ', '.join(sorted(CASES)))
+    ap.add_argument('--repeat', type=int, default=3, help='report the best of this many runs [3]')
+    ap.add_argument('-o', '--output', help='write the results as json to this file')
+    ap.add_argument('-c', '--compare', help='compare against the json results of an earlier run')
+    ap.add_argument('--threshold', type=float, default=1.2, help='slowdown that counts as a regression [1.2]')
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    os.environ.setdefault('MNE_LOGGING_LEVEL', 'ERROR')
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        ap.error('unknown cases: %s' % ', '.join(sorted(unknown)))
+    results = run(args.cases or sorted(CASES), args.repeat)
+    for case, stage_results in sorted(results['cases'].iteritems()):
+        for stage in ['setup'] + STAGES:
+            result = stage_results.get(stage)
+            if result is None:
+                continue
+            if 'error' in result or 'skipped' in result:
+                print '%-22s %-10s %s' % (case, stage, (result.get('error') or result['skipped'])[:80])
+            else:
+                print '%-22s %-10s %10.1f ms %8.1f MB' % (case, stage, result['seconds'] * 1000, result['peak_mb'])
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+    regressed = False
+    if args.compare:
+        with open(args.compare) as fp:
+            old = json.load(fp)
+        print
+        for case, stage, before, after, slower in compare(old, results, args.threshold):
+            regressed = regressed or slower
+            print '%-22s %-10s %10.1f ms %10.1f ms  (%.2fx)%s' % (case, stage, before * 1000, after * 1000, after / before, '  REGRESSED' if slower else '')
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,382 @@
+"""
+Synthesize inputs for the benchmarks, offline.
+
+    - dicom: zips of GE and Siemens MR series, with the geometry, timing and private tags the mr
+      composers read, as epi timeseries, dwi, multicoil, fastcard and mosaic series
+    - pfile: the minimum header that PFile._min_parse reads, followed by raw data
+    - nifti: a nifti1 volume
+    - meeg: a zip of a fif recording, as MEEGReader expects
+    - MRVolume: loaded MR metadata and voxels, as the medimg writers expect
+
+"""
+
+import gzip
+import json
+import struct
+import zipfile
+import datetime
+import cStringIO
+import numpy as np
+
+from ..medimg import pfile
+
+MR_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.4'
+EXPLICIT_VR_LITTLE_ENDIAN = '1.2.840.10008.1.2.1'
+
+VERSION_BYTES = {
+    24: '\x00\x00\xc0A',
+    23: 'V\x0e\xa0A',
+    22: 'J\x0c\xa0A',
+    12: '\x00\x000A',
+}
+
+HEADER_VALUES = {
+    'scan_date': '01/02/115\0',
+    'scan_time': '13:45\0\0\0',
+    'num_timepoints': 10,
+    'num_echos': 1,
+    'rec_user0': 0.,
+    'rec_user6': 3.,
+    'rec_user7': 2.,
+    'ileaves': 1,
+    'exam_no': 1234,
+    'exam_uid': '\x2b\x34',         # packed '1.23'
+    'patient_id': 'ex1234@scitran/scidata',
+    'series_no': 5,
+    'series_desc': 'mux3 epi',
+    'series_uid': '\x2b\x35',       # packed '1.24'
+    'im_datetime': 1420070400,
+    'tr': 2000000,
+    'acq_no': 1,
+    'psd_name': '/usr/g/bin/mux_epi2',
+}
+
+# keyword arguments of mr_series, by name of the series it synthesizes
+MR_SERIES = {
+    'ge_epi': dict(manufacturer='GE MEDICAL SYSTEMS', psd_name='epi', num_slices=12, num_timepoints=20),
+    'ge_dwi': dict(manufacturer='GE MEDICAL SYSTEMS', psd_name='epi2', num_slices=12, dwi_dirs=12),
+    'ge_multicoil': dict(manufacturer='GE MEDICAL SYSTEMS', psd_name='3dgrass', num_slices=24, num_coils=8),
+    'ge_multicoil32': dict(manufacturer='GE MEDICAL SYSTEMS', psd_name='3dgrass', num_slices=24, num_coils=32),
+    'ge_fastcard': dict(manufacturer='GE MEDICAL SYSTEMS', psd_name='fastcard', num_slices=4, cardiac_images=10),
+    'siemens_mosaic': dict(manufacturer='SIEMENS', psd_name='epfid2d1_64', num_slices=16, num_timepoints=20, mosaic=True),
+}
+
+
+def write_fake_pfile(path, version, values=HEADER_VALUES, compress=False, data_size=0):
+    """Write the minimum header needed to min parse a pfile of the given version."""
+    layout = pfile.MIN_PARSE_LAYOUTS[version]
+    buf = bytearray(layout.size)
+    buf[0:4] = VERSION_BYTES[version]
+    buf[34:44] = 'GE_MED_NMR'
+    for name, offset, st, _ in layout.fields:
+        st.pack_into(buf, offset, values[name])
+    with gzip.open(path, 'wb') if compress else open(path, 'wb') as fp:
+        fp.write(str(buf))
+        fp.write('\0' * data_size)
+    return path
+
+
+def dicom_dataset(series, instance, manufacturer='GE MEDICAL SYSTEMS'):
+    """Return a FileDataset of an MR image, with only the study and series identifiers set."""
+    from dicom.dataset import Dataset, FileDataset
+    meta = Dataset()
+    meta.MediaStorageSOPClassUID = MR_IMAGE_STORAGE
+    meta.MediaStorageSOPInstanceUID = '1.2.3.%d.%d' % (series, instance)
+    meta.TransferSyntaxUID = EXPLICIT_VR_LITTLE_ENDIAN
+    meta.ImplementationClassUID = '1.2.3.4'
+    dcm = FileDataset('%04d.dcm' % instance, {}, file_meta=meta, preamble='\0' * 128)
+    dcm.is_little_endian = True
+    dcm.is_implicit_VR = False
+    dcm.SOPClassUID = meta.MediaStorageSOPClassUID
+    dcm.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    dcm.Manufacturer = manufacturer
+    dcm.ImageType = ['ORIGINAL', 'PRIMARY', 'OTHER']
+    dcm.PatientID = 'ex1234@bench/records'
+    dcm.StudyID = '1234'
+    dcm.StudyInstanceUID = '1.2.3'
+    dcm.StudyDate = '20150101'
+    dcm.StudyTime = '101010'
+    dcm.SeriesInstanceUID = '1.2.3.%d' % series
+    dcm.SeriesNumber = str(series)
+    dcm.SeriesDescription = 'series %d' % series
+    dcm.InstanceNumber = str(instance)
+    return dcm
+
+
+def write_dicom_zip(path, series, num_images=4, num_tags=0):
+    """Write a zip of num_images GE MR dicoms of series, with num_tags filler private tags each."""
+    dcms = []
+    for i in range(num_images):
+        dcm = dicom_dataset(series, i + 1)
+        for tag in range(num_tags):
+            dcm.add_new((0x0043, 0x1000 + tag), 'LO', 'filler %d' % tag)
+        dcms.append(dcm)
+    write_dicoms(path, dcms)
+
+
+def write_dicoms(path, dcms):
+    """Write dcms to a zip at path, with the archive comment that identifies dicom zips."""
+    with zipfile.ZipFile(path, 'w') as archive:
+        for i, dcm in enumerate(dcms):
+            buf = cStringIO.StringIO()
+            dcm.save_as(buf)
+            archive.writestr('%04d.dcm' % i, buf.getvalue())
+        archive.comment = json.dumps({'filetype': 'dicom'})
+    return path
+
+
+def mr_series(series=1, manufacturer='GE MEDICAL SYSTEMS', psd_name='epi', matrix=64, num_slices=12,
+              num_timepoints=1, dwi_dirs=0, num_coils=0, cardiac_images=0, mosaic=False):
+    """
+    Return the dicoms of a synthetic MR series.
+
+    Slices are axial, 2 mm in plane and 3 mm apart.  Instances are ordered as the scanner writes
+    them: GE multicoil series interleave the combined image and each coil at every slice, and GE
+    fastcard series write 5 groups of cardiac_images x num_slices images.
+
+    Parameters
+    ----------
+    series : int
+        series number.
+    manufacturer : str
+        'GE MEDICAL SYSTEMS' or 'SIEMENS'.
+    psd_name : str
+        pulse sequence name.
+    matrix : int
+        rows and columns of each slice.
+    num_slices : int
+        slices per volume.
+    num_timepoints : int
+        volumes of a timeseries.
+    dwi_dirs : int
+        diffusion directions; a dwi series has one b=0 volume and dwi_dirs b=1000 volumes.
+    num_coils : int
+        receive coils of a multicoil series.
+    cardiac_images : int
+        cardiac phases of a fastcard series.
+    mosaic : bool
+        tile the slices of each volume into one mosaic image, as Siemens does.
+
+    Returns
+    -------
+    dcms : list of pydicom.dataset.FileDataset
+        dicoms in instance order.
+
+    """
+    rng = np.random.RandomState(series)
+    is_ge = manufacturer == 'GE MEDICAL SYSTEMS'
+    if dwi_dirs:
+        num_timepoints = dwi_dirs + 1
+        bvecs = rng.normal(size=(dwi_dirs + 1, 3))
+        bvecs /= np.sqrt((bvecs ** 2).sum(axis=1))[:, np.newaxis]
+        bvecs[0] = 0.
+    if num_coils:
+        # (volume, slice, coil) of each instance; volume 0 holds the combined image and each coil
+        order = [(0, s, c) for s in range(num_slices) for c in range(num_coils + 1)]
+        images_in_acquisition = num_slices * (num_coils + 1)
+    elif cardiac_images:
+        order = [(t, s, 0) for _ in range(5) for t in range(cardiac_images) for s in range(num_slices)]
+        images_in_acquisition = len(order)
+        num_timepoints = 5 * cardiac_images     # a temporal position per image of a slice, not extra coils
+    elif mosaic:
+        order = [(t, None, 0) for t in range(num_timepoints)]
+        images_in_acquisition = num_timepoints
+    else:
+        order = [(t, s, 0) for t in range(num_timepoints) for s in range(num_slices)]
+        images_in_acquisition = len(order)
+    tiles = int(np.ceil(np.sqrt(num_slices)))
+    rows = columns = matrix * tiles if mosaic else matrix
+
+    dcms = []
+    for i, (volume, slice_, coil) in enumerate(order):
+        dcm = dicom_dataset(series, i + 1, manufacturer)
+        dcm.SeriesDescription = '%s %d' % (psd_name, series)
+        dcm.ProtocolName = dcm.SeriesDescription
+        dcm.AcquisitionDate = dcm.StudyDate
+        dcm.AcquisitionTime = '101500'
+        dcm.AcquisitionNumber = '1'
+        dcm.TemporalPositionIdentifier = str(volume + 1)
+        dcm.NumberOfTemporalPositions = str(num_timepoints)
+        dcm.ImagesInAcquisition = str(images_in_acquisition)
+        dcm.MRAcquisitionType = '3D' if num_coils else '2D'
+        dcm.InPlanePhaseEncodingDirection = 'COL'
+        dcm.RepetitionTime = '2000'
+        dcm.EchoTime = '30'
+        dcm.EchoNumbers = '1'
+        dcm.FlipAngle = '77'
+        dcm.NumberOfAverages = '1'
+        dcm.PixelBandwidth = '7812.5'
+        dcm.PercentPhaseFieldOfView = '100'
+        dcm.AcquisitionMatrix = [0, matrix, matrix, 0]
+        dcm.ReconstructionDiameter = str(2. * matrix)
+        dcm.PixelSpacing = ['2', '2']
+        dcm.SliceThickness = '3'
+        dcm.SpacingBetweenSlices = '3'
+        dcm.ImageOrientationPatient = ['1', '0', '0', '0', '1', '0']
+        z = 3. * (slice_ or 0) - 1.5 * num_slices
+        dcm.ImagePositionPatient = [str(-matrix), str(-matrix), str(z)]
+        dcm.SliceLocation = str(z)
+        if slice_ is not None:
+            # interleaved acquisition: even slices, then odd slices
+            acquired = slice_ // 2 + (slice_ % 2) * ((num_slices + 1) // 2)
+            dcm.TriggerTime = str(2000. * acquired / num_slices)
+        if cardiac_images:
+            dcm.CardiacNumberOfImages = str(cardiac_images)
+        dcm.Rows = rows
+        dcm.Columns = columns
+        dcm.SamplesPerPixel = 1
+        dcm.PhotometricInterpretation = 'MONOCHROME2'
+        dcm.BitsAllocated = 16
+        dcm.BitsStored = 16
+        dcm.HighBit = 15
+        dcm.PixelRepresentation = 1
+        dcm.add_new((0x7fe0, 0x0010), 'OW', rng.randint(0, 1000, size=(rows, columns)).astype('<i2').tostring())
+        if is_ge:
+            dcm.add_new((0x0019, 0x0010), 'LO', 'GEMS_ACQU_01')
+            dcm.add_new((0x0019, 0x109c), 'LO', psd_name)
+            dcm.add_new((0x0019, 0x109e), 'LO', psd_name.upper())
+            dcm.add_new((0x0021, 0x0010), 'LO', 'GEMS_RELA_01')
+            dcm.add_new((0x0021, 0x104f), 'SS', num_slices)
+            dcm.add_new((0x0043, 0x0010), 'LO', 'GEMS_PARM_01')
+            dcm.add_new((0x0043, 0x107d), 'US', int(coil > 0))
+            if dwi_dirs:
+                dcm.add_new((0x0019, 0x10e0), 'DS', str(dwi_dirs))
+                dcm.add_new((0x0043, 0x1039), 'IS', ['1000' if volume else '0', '0', '0', '0'])
+                for elem, value in zip([0x10bb, 0x10bc, 0x10bd], bvecs[volume]):
+                    dcm.add_new((0x0019, elem), 'DS', '%.6f' % value)
+        else:
+            dcm.SoftwareVersions = 'syngo MR B17'
+            dcm.SequenceName = psd_name
+            csa_image = [('ImaCoilString', 'LO', ['HEA;HEP']),
+                         ('SliceMeasurementDuration', 'DS', [2000. / num_slices * 1000]),
+                         ('SliceNormalVector', 'FD', [0., 0., 1.])]
+            if mosaic:
+                dcm.ImageType = ['ORIGINAL', 'PRIMARY', 'M', 'ND', 'MOSAIC']
+                dcm.add_new((0x0019, 0x0010), 'LO', 'SIEMENS MR HEADER')
+                dcm.add_new((0x0019, 0x100a), 'US', num_slices)
+                csa_image += [('AcquisitionMatrixText', 'SH', ['%dp*%ds' % (matrix, matrix)]),
+                              ('NumberOfImagesInMosaic', 'US', [num_slices])]
+            dcm.add_new((0x0029, 0x0010), 'LO', 'SIEMENS CSA HEADER')
+            dcm.add_new((0x0029, 0x1010), 'OB', csa_header(csa_image))
+            dcm.add_new((0x0029, 0x1020), 'OB', csa_header([('MrPhoenixProtocol', 'UN', [phoenix_protocol(
+                psd_name, num_slices, 2. * matrix)])]))
+        dcms.append(dcm)
+    return dcms
+
+
+def csa_header(tags):
+    """Pack tags, a list of (name, vr, values), as the CSA2 sub header of a Siemens dicom."""
+    buf = ['SV10\4\3\2\1', struct.pack('<2I', len(tags), 77)]
+    for name, vr, values in tags:
+        buf.append(struct.pack('<64si4s3i', name, len(values), vr, 0, len(values), 77))
+        for value in values:
+            item = '%s\0' % value
+            buf.append(struct.pack('<4i', len(item), len(item), 77, len(item)))
+            buf.append(item + '\0' * (-len(item) % 4))
+    return ''.join(buf)
+
+
+def phoenix_protocol(psd_name, num_slices, fov):
+    """Return the MrPhoenixProtocol of a Siemens CSA series header, with the fields the composer reads."""
+    return '\n'.join([
+        '### ASCCONV BEGIN ###',
+        'tSequenceFileName = ""%%SiemensSeq%%\\%s""' % psd_name,
+        'sSliceArray.lSize = %d' % num_slices,
+        'sSliceArray.asSlice[0].dPhaseFOV = %s' % fov,
+        'sSliceArray.asSlice[0].dReadoutFOV = %s' % fov,
+        'sSliceArray.ucMode = 0x4',
+        'lScanTimeSec = 40',
+        '### ASCCONV END ###',
+    ])
+
+
+def write_mr_zip(path, name, series=1, **kwargs):
+    """Write the MR_SERIES series name to a dicom zip at path, overriding its arguments with kwargs."""
+    return write_dicoms(path, mr_series(series, **dict(MR_SERIES[name], **kwargs)))
+
+
+def write_pfile(path, version=24, num_timepoints=10, data_mb=16):
+    """Write a pfile with a min parse header of version, followed by data_mb MB of raw data."""
+    values = dict(HEADER_VALUES, num_timepoints=num_timepoints)
+    return write_fake_pfile(path, version, values, data_size=int(data_mb * 2 ** 20))
+
+
+def write_nifti(path, shape=(64, 64, 12, 20)):
+    """Write an int16 nifti1 volume of shape, with 2 mm x 2 mm x 3 mm voxels."""
+    import nibabel
+    voxels = np.random.RandomState(0).randint(0, 1000, size=shape).astype(np.int16)
+    nibabel.save(nibabel.Nifti1Image(voxels, np.diag([2., 2., 3., 1.])), path)
+    return path
+
+
+def write_meeg_zip(path, num_channels=64, num_samples=10000, sfreq=1000.):
+    """Write a zip of a fif recording of num_channels eeg channels, as MEEGReader reads them."""
+    import os
+    import shutil
+    import tempfile
+    import warnings
+    import mne
+    info = mne.create_info(['EEG%03d' % c for c in range(num_channels)], sfreq, 'eeg')
+    info['meas_date'] = (1420103700, 0)
+    info['experimenter'] = 'neuromag'
+    info['proj_name'] = 'bench'
+    info['description'] = 'resting state'
+    info['subject_info'] = {
+        'his_id': 'ex1234', 'first_name': 'first', 'last_name': 'last',
+        'birthday': (1980, 1, 2), 'hand': 1, 'sex': 2,
+    }
+    raw = mne.io.RawArray(np.random.RandomState(0).normal(scale=1e-5, size=(num_channels, num_samples)), info, verbose=False)
+    dirpath = tempfile.mkdtemp()
+    try:
+        fif = os.path.join(dirpath, 'bench_raw.fif')
+        with warnings.catch_warnings(record=True):
+            raw.save(fif, verbose=False)
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.write(fif, 'reap/bench_raw.fif')
+            archive.comment = json.dumps({'filetype': 'meeg'})
+    finally:
+        shutil.rmtree(dirpath)
+    return path
+
+
+class MRVolume(object):
+
+    """
+    Loaded MR metadata and voxels, with the attributes that the nifti, montage and png writers read.
+
+    Parameters
+    ----------
+    shape : tuple
+        shape of the int16 voxel data.
+    dwi_dirs : int
+        if set, the volume is a dwi series with bvals and bvecs of shape[3] volumes.
+
+    """
+
+    def __init__(self, shape=(64, 64, 12, 20), dwi_dirs=0):
+        rng = np.random.RandomState(0)
+        self.data = {'': rng.randint(0, 1000, size=shape).astype(np.int16)}
+        self.qto_xyz = np.diag([-2., -2., 3., 1.])
+        self.qto_xyz[:3, 3] = [64., 64., -18.]
+        self.is_dwi = bool(dwi_dirs)
+        self.bvals = np.array([0.] + [1000.] * (shape[3] - 1)) if dwi_dirs else None
+        self.bvecs = rng.normal(size=(3, shape[3])) if dwi_dirs else None
+        self.is_fastcard = False
+        self.phase_encode = 1
+        self.phase_encode_direction = None
+        self.slice_duration = 2. / shape[2]
+        self.slice_order = 1
+        self.tr = 2.
+        self.te = .03
+        self.ti = None
+        self.flip_angle = 77.
+        self.effective_echo_spacing = .0005
+        self.acquisition_matrix = (shape[0], shape[1])
+        self.acquisition_type = '2D'
+        self.mt_offset_hz = None
+        self.phase_encode_undersample = 1
+        self.slice_encode_undersample = 1
+        self.velocity_encode_scale = None
+        self.velocity_encoding = None
+        self.timestamp = datetime.datetime(2015, 1, 1, 10, 15)
+        self._dcm_list = [None] * shape[2]  # one image per slice, as png writes them
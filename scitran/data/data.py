@@ -33,13 +33,20 @@ import abc
 import copy
 import json
 import pytz
+import shutil
+import hashlib
 import logging
+import operator
+import tempfile
+import cStringIO
+import collections
 import zipfile
 import warnings
 import datetime
 import traceback
 
 import util
+import spans
 
 
 log = logging.getLogger(__name__)
@@ -49,6 +56,11 @@ READERS = json.load(open(os.path.join(os.path.dirname(os.path.abspath(__file__))
 WRITERS = json.load(open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'writers.json')))
 MODULES = json.load(open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modules.json')))
 
+# parse results are cached here if $SCITRAN_PARSE_CACHE is set; see ParseCache
+PARSE_CACHE_DIR = os.environ.get('SCITRAN_PARSE_CACHE', '')
+PARSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+PARSE_CACHE_HASH_BYTES = 256 * 1024         # covers a pfile header, the largest header parsed
+
 
 project_properties = {
         'gid': {
@@ -235,6 +247,54 @@ def dict_merge(a, b=None, in_place=False):
     return result
 
 
+def copy_schema(schema):
+    """
+    Copy a schema of nested dicts and lists.
+
+    Much cheaper than copy.deepcopy, because schema leaves are immutable strings, numbers and
+    booleans, and need not be copied.
+
+    Parameters
+    ----------
+    schema : dict
+        schema, such as a merged acquisition properties dict.
+
+    Returns
+    -------
+    schema : dict
+        copy of schema, which shares only its leaves.
+
+    """
+    if isinstance(schema, dict):
+        return dict([(k, copy_schema(v)) for k, v in schema.iteritems()])
+    elif isinstance(schema, list):
+        return [copy_schema(v) for v in schema]
+    return schema
+
+
+def _properties_by_type_list(tier, type_list):
+    """
+    Merge the tier properties of the modules of type_list, memoized on the set of types.
+
+    Types are merged in sorted order, and each module once, so the result does not depend on the
+    order of type_list.  Callers get a copy, and cannot change the memoized schema.
+
+    """
+    key = (tier, tuple(sorted(set([(t[0], t[1]) for t in type_list]))))
+    merged = _schemas.get(key)
+    if merged is None:
+        modules = []
+        for t in key[1]:
+            mod = module_by_type(t)
+            if mod not in modules:
+                modules.append(mod)
+        merged = dict_merge([getattr(m, tier) for m in modules])
+        _schemas[key] = merged
+    return copy_schema(merged)
+
+_schemas = {}  # merged properties, by (tier, sorted tuple of (domain, kind))
+
+
 def acquisition_properties_by_type_list(type_list):
     """
     Assemble acquisition properties from list of types.
@@ -250,7 +310,7 @@ def acquisition_properties_by_type_list(type_list):
         merged acquisition properties for items in type_list.
 
     """
-    return dict_merge([module_by_type(t).acquisition_properties for t in type_list])
+    return _properties_by_type_list('acquisition_properties', type_list)
 
 
 def session_properties_by_type_list(type_list):
@@ -268,7 +328,7 @@ def session_properties_by_type_list(type_list):
         merged session properties for items in type_list.
 
     """
-    return dict_merge([module_by_type(t).session_properties for t in type_list])
+    return _properties_by_type_list('session_properties', type_list)
 
 
 def project_properties_by_type_list(type_list):
@@ -286,7 +346,7 @@ def project_properties_by_type_list(type_list):
         merged project properties for items in type_list.
 
     """
-    return dict_merge([module_by_type(t).project_properties for t in type_list])
+    return _properties_by_type_list('project_properties', type_list)
 
 
 def get_handler(filetype, handlerdict):
@@ -311,13 +371,19 @@ def get_handler(filetype, handlerdict):
         The specified handler does not exist, or cannot be imported
 
     """
-    try:
-        mod, klass = map(str, handlerdict.get(filetype).rsplit('.', 1))
-        handler = getattr(__import__(mod, globals(), fromlist=[klass]), klass)
-    except (ImportError, AttributeError):
-        raise DataError('no handler for filetype %s' % filetype, log_level=logging.ERROR)
+    name = handlerdict.get(filetype)
+    handler = _handlers.get(name)
+    if handler is None:
+        try:
+            mod, klass = map(str, name.rsplit('.', 1))
+            handler = getattr(__import__(mod, globals(), fromlist=[klass]), klass)
+        except (ImportError, AttributeError):
+            raise DataError('no handler for filetype %s' % filetype, log_level=logging.ERROR)
+        _handlers[name] = handler
     return handler
 
+_handlers = {}  # resolved handler classes, by their dotted name in READERS or WRITERS
+
 
 def get_reader(filetype):
     return get_handler(filetype, READERS)
@@ -327,7 +393,46 @@ def get_writer(filetype):
     return get_handler(filetype, WRITERS)
 
 
-def parse(path, filetype=None, load_data=False, ignore_json=False, debug=False, **kwargs):
+def preload(filetypes=None):
+    """
+    Resolve readers and writers, and import what they need, before any file is handled.
+
+    A process that preloads before forking its workers passes the imported modules and resolved
+    handlers on to every worker, so that no worker pays for them.  Handlers with a preload
+    classmethod, such as Dicom, are asked to import their own dependencies as well.
+
+    Parameters
+    ----------
+    filetypes : list [default None]
+        reader and writer names, such as ['dicom', 'nifti'].  None preloads every reader and writer.
+
+    Returns
+    -------
+    handlers : list
+        the resolved Reader and Writer subclasses.
+
+    Raises
+    ------
+    DataError
+        a filetype is neither a reader nor a writer, or its handler cannot be imported.
+
+    """
+    if filetypes is None:
+        filetypes = sorted(set(READERS) | set(WRITERS))
+    handlers = []
+    for filetype in filetypes:
+        if filetype not in READERS and filetype not in WRITERS:
+            raise DataError('no handler for filetype %s' % filetype, log_level=logging.ERROR)
+        for handlerdict in [READERS, WRITERS]:
+            if filetype in handlerdict:
+                handler = get_handler(filetype, handlerdict)
+                if hasattr(handler, 'preload'):
+                    handler.preload()
+                handlers.append(handler)
+    return handlers
+
+
+def parse(path, filetype=None, load_data=False, ignore_json=False, debug=False, compact=False, cache=None, **kwargs):
     """
     Parse the file at path with a filetype-specific parser.
 
@@ -361,6 +466,13 @@ def parse(path, filetype=None, load_data=False, ignore_json=False, debug=False,
     debug : bool [default False]
         developer option, False masks all exceptions as DataError.  debug=True does not
         mask exceptions.
+    compact : bool [default False]
+        return a ReaderRecord of the nims_* metadata instead of the Reader, so that the headers
+        held by the Reader can be freed.  cannot be combined with load_data.
+    cache : ParseCache [default None]
+        cache of parse results, used only if load_data is False.  None uses the cache in
+        $SCITRAN_PARSE_CACHE, if set.  False does not use a cache.  on a hit, parse returns a
+        CachedReader, which cannot load data.
     kwargs : dict
         keyword arguments passed to reader.
 
@@ -368,7 +480,8 @@ def parse(path, filetype=None, load_data=False, ignore_json=False, debug=False,
     -------
     parser_class : obj
         Reader populated with data and metadata attributes. this Reader object can be
-        passed to any compatible writer to complete the conversion process.
+        passed to any compatible writer to complete the conversion process.  if compact is True,
+        a ReaderRecord, which cannot be passed to a writer.
 
     Raises
     ------
@@ -402,6 +515,18 @@ def parse(path, filetype=None, load_data=False, ignore_json=False, debug=False,
 
     if ignore_json and not filetype:   # if ignore_json=True, filetype MUST be set
         raise DataError('filetype must be specified if ignore_json=True')
+    if compact and load_data:
+        raise DataError('compact=True cannot be combined with load_data=True')
+
+    if cache is None:
+        cache = PARSE_CACHE
+    cache_key = None
+    if cache and not load_data:
+        cache_key = cache.key(path, filetype, ignore_json, kwargs)
+    if cache_key:
+        ds = cache.get(cache_key)
+        if ds is not None:
+            return ReaderRecord.from_reader(ds) if compact else ds
 
     timezone = None
     if not ignore_json:  # if ignore_json=False, read json
@@ -418,7 +543,9 @@ def parse(path, filetype=None, load_data=False, ignore_json=False, debug=False,
 
 
     parser = get_reader(filetype)  # at this point filetype is set, or an exception was raised
-    ds = parser(path, load_data, timezone, **kwargs)  # parser should try to always return a dataset
+    with spans.span('parse', filetype=filetype, load_data=load_data) as stats:
+        ds = parser(path, load_data, timezone, **kwargs)  # parser should try to always return a dataset
+        stats.attrs['size'] = os.path.getsize(path)  # bytes read are reported by the nested spans
     if ds.failure_reason:
         if not debug:
             log.warning('parse error: %s' % str(ds.failure_reason))
@@ -429,6 +556,10 @@ def parse(path, filetype=None, load_data=False, ignore_json=False, debug=False,
         for key, value in json_data.get('overwrite', {}).iteritems():  # FIXME: handle NESTED information
             setattr(ds, key, value)
 
+    if cache_key and not ds.failure_reason:
+        cache.add(cache_key, ds)
+    if compact:
+        return ReaderRecord.from_reader(ds)
     return ds
 
 
@@ -485,7 +616,9 @@ def write(metadata, data, outbase, filetype, debug=False, **kwargs):
     else:
         try:
             writer = get_writer(filetype)  # raises exception if no handler
-            output_list = writer.write(metadata, data, outbase, **kwargs)  # writer checks if data is present
+            with spans.span('write', filetype=filetype) as stats:
+                output_list = writer.write(metadata, data, outbase, **kwargs)  # writer checks if data is present
+                stats.bytes = sum([os.path.getsize(p) for p in output_list if isinstance(p, basestring) and os.path.isfile(p)])
         except Exception as e:
             if not debug:
                 log.warning('WRITE ERR: %s could not be written to %s. %s' % (metadata.filepath, filetype, str(e)))
@@ -543,18 +676,52 @@ class Reader(object):
     session_properties = session_properties
     acquisition_properties = acquisition_properties
 
-    def _schema_init(self, schema):
-        for k, v in schema.iteritems():
-            if isinstance(v, dict):
-                    self._schema_init(v)
-            elif k == 'field' and not v.startswith('nims_'):
-                setattr(self, v, None)
+    @classmethod
+    def _class_schema(cls):
+        """Return the ReaderSchema of cls, built at the first call for each class."""
+        schema = _reader_schemas.get(cls)
+        if schema is None:
+            fields = []
+            for tier in ['project', 'session', 'acquisition']:
+                _schema_fields(getattr(cls, '%s_properties' % tier), (tier,), fields)
+            nims = tuple(sorted(name for name in dir(cls) if name.startswith('nims_') and name != 'nims_dict'))
+            schema = ReaderSchema(tuple(fields), tuple(f for _, f in fields if not f.startswith('nims_')),
+                                  nims, operator.attrgetter(*nims))
+            _reader_schemas[cls] = schema
+        return schema
+
+    @classmethod
+    def schema_fields(cls):
+        """
+        Return the fields of the class's project, session and acquisition properties.
+
+        Returns
+        -------
+        fields : tuple
+            (path, field) pairs, where path is the dotted schema path without 'properties', such as
+            'session.subject.code', and field is the Reader attribute that holds its value, such as
+            'nims_session_subject'.
+
+        """
+        return cls._class_schema().fields
+
+    def nims_dict(self):
+        """
+        Return the value of every nims_* property, by name, for json export.
+
+        Properties that raise AttributeError are None.
+
+        """
+        schema = self._class_schema()
+        try:
+            return dict(zip(schema.nims, schema.nims_getter(self)))
+        except AttributeError:
+            return dict([(name, getattr(self, name, None)) for name in schema.nims])
 
     @abc.abstractmethod
     def __init__(self, path, load_data=False, timezone=None):
-        self._schema_init(self.project_properties)
-        self._schema_init(self.session_properties)
-        self._schema_init(self.acquisition_properties)
+        for field in self._class_schema().attrs:
+            setattr(self, field, None)
         self.filepath = os.path.abspath(path)
         self.timezone = timezone
         self.timestamp = None
@@ -686,13 +853,7 @@ class Reader(object):
 
         properties.sort()
 
-        for prop in dir(self):
-            value = None
-            if prop in ['data', 'imagedata']:
-                continue
-            if not prop.startswith('nims'):
-                continue
-            value = getattr(self, prop)
+        for prop, value in sorted(self.nims_dict().iteritems()):
             if value is None:
                 value = ''
             properties.append((prop, str(value)))
@@ -700,6 +861,405 @@ class Reader(object):
         return '\n'.join(['%-30s: %s' % (p, v) for p, v in properties])
 
 
+# per Reader class: schema (path, field) pairs, fields initialized to None, nims_* property names,
+# and an attrgetter of those properties
+ReaderSchema = collections.namedtuple('ReaderSchema', ['fields', 'attrs', 'nims', 'nims_getter'])
+_reader_schemas = {}
+
+
+def _schema_fields(schema, path, fields):
+    """Append the (path, field) of each 'field' in schema to fields, depth first."""
+    for k, v in sorted(schema.iteritems()):
+        if isinstance(v, dict):
+            _schema_fields(v, path if k == 'properties' else path + (k,), fields)
+        elif k == 'field':
+            fields.append(('.'.join(path), v))
+
+
+NIMS_FIELDS = tuple(sorted(name for name in Reader.__abstractmethods__ if name.startswith('nims_'))) + ('nims_file_kinds',)
+
+
+class ReaderRecord(collections.namedtuple('ReaderRecord', ('filepath', 'failure_reason') + NIMS_FIELDS)):
+
+    """
+    Immutable record of the nims_* metadata of a parsed Reader.
+
+    A Reader keeps its full headers, such as a dicom MetaExtractor, for as long as it is alive.
+    A ReaderRecord holds only the filepath, the failure_reason and the value of each nims_*
+    property, without a per-instance __dict__, for callers that hold many parsed files but never
+    load their data.  See parse(..., compact=True).
+
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_reader(cls, ds):
+        """
+        Evaluate the nims_* properties of ds into a new ReaderRecord.
+
+        Properties that the Reader does not define, or that raise AttributeError, are None.
+
+        """
+        return cls(ds.filepath, ds.failure_reason, *[getattr(ds, name, None) for name in NIMS_FIELDS])
+
+    def __str__(self):
+        return '\n'.join(['%-30s: %s' % (p, '' if v is None else v) for p, v in sorted(self._asdict().iteritems())])
+
+
+class CachedReader(object):
+
+    """
+    Metadata of a parsed Reader, restored from a ParseCache.
+
+    Has the nims_* properties and the json serializable public attributes of the Reader it was
+    cached from, but not its headers, so it cannot load data.
+
+    Parameters
+    ----------
+    fields : dict
+        attribute names and values, including the nims_* properties.
+
+    """
+
+    def __init__(self, fields):
+        self.__dict__.update(fields)
+        self.failure_reason = None
+
+    def load_data(self):
+        raise DataError('%s was restored from the parse cache, and cannot load data' % self.filepath)
+
+    def nims_dict(self):
+        """Return the value of every cached nims_* property, by name, for json export."""
+        return dict([(name, value) for name, value in vars(self).iteritems() if name.startswith('nims_')])
+
+    def __str__(self):
+        properties = [(p, '' if v is None else v) for p, v in vars(self).iteritems() if not p.startswith('_')]
+        return '\n'.join(['%-30s: %s' % (p, v) for p, v in sorted(properties)])
+
+
+class ParseCache(object):
+
+    """
+    On-disk cache of parse results.
+
+    Each entry is a json file of the nims_* properties and the json serializable public attributes
+    of a parsed Reader, encoded with util.datetime_encoder.  Entries are keyed by the input's path,
+    size, mtime and content hash, and by the parse arguments, so a changed input is re-parsed.  The
+    content hash of a zip covers its comment and the name, size and crc of each member, which are
+    read from the central directory without decompressing the archive.  The content hash of any
+    other file covers only its first PARSE_CACHE_HASH_BYTES, which hold the header that is parsed;
+    a change beyond them is caught by the size and mtime.
+
+    When the cache grows beyond max_bytes, the least recently used entries are removed until it is
+    within 90% of max_bytes.
+
+    Parameters
+    ----------
+    dirpath : str [default PARSE_CACHE_DIR]
+        cache directory, created if it does not exist
+    max_bytes : int [default PARSE_CACHE_MAX_BYTES]
+        size bound of the cache
+
+    """
+
+    def __init__(self, dirpath=PARSE_CACHE_DIR, max_bytes=PARSE_CACHE_MAX_BYTES):
+        self.dirpath = dirpath
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._total_bytes = None                    # computed at the first add
+
+    def __nonzero__(self):
+        return bool(self.dirpath)
+
+    @staticmethod
+    def content_hash(path):
+        """Return the sha1 of a zip's comment and member list, or of any other file's header bytes."""
+        sha1 = hashlib.sha1()
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                sha1.update(archive.comment)
+                for info in archive.infolist():
+                    sha1.update('%s\0%d\0%d\0' % (info.filename, info.file_size, info.CRC))
+        else:
+            with open(path, 'rb') as fp:
+                sha1.update(fp.read(PARSE_CACHE_HASH_BYTES))
+        return sha1.hexdigest()
+
+    def key(self, path, filetype=None, ignore_json=False, kwargs=None):
+        """
+        Return the cache key of parsing path with the given parse arguments.
+
+        Parameters
+        ----------
+        path : str
+            path to the input file.
+        filetype, ignore_json, kwargs :
+            the arguments of parse, which change the parse result.
+
+        Returns
+        -------
+        key : str or None
+            sha1 hexdigest, or None if path cannot be hashed, such as a corrupt zip, in which case
+            the parse is not cached.
+
+        """
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+            content_hash = self.content_hash(path)
+        except (IOError, OSError, zipfile.BadZipfile, zipfile.LargeZipFile) as e:
+            log.warning('parse cache: cannot hash %s, not caching it: %s' % (path, e))
+            return None
+        parts = [path, stat.st_size, repr(stat.st_mtime), content_hash,
+                 filetype, ignore_json, sorted((kwargs or {}).iteritems())]
+        return hashlib.sha1(repr(parts)).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.dirpath, key[:2], key + '.json')
+
+    def _entries(self):
+        if not os.path.isdir(self.dirpath):
+            return []
+        return [os.path.join(self.dirpath, d, e)
+                for d in os.listdir(self.dirpath) if os.path.isdir(os.path.join(self.dirpath, d))
+                for e in os.listdir(os.path.join(self.dirpath, d)) if not e.startswith('.')]
+
+    def get(self, key):
+        """
+        Return the CachedReader of key, or None.
+
+        Parameters
+        ----------
+        key : str
+            cache key, from ParseCache.key.
+
+        Returns
+        -------
+        ds : CachedReader or None
+
+        """
+        entry = self._entry(key)
+        try:
+            with open(entry) as fp:
+                fields = json.load(fp, object_hook=util.datetime_decoder)
+        except (IOError, OSError, ValueError) as e:
+            if os.path.exists(entry):               # unreadable or corrupt, rather than not cached
+                log.warning('parse cache: cannot read %s: %s' % (entry, e))
+            self.misses += 1
+            return None
+        try:
+            os.utime(entry, None)                   # most recently used
+        except OSError:                             # evicted concurrently
+            pass
+        self.hits += 1
+        log.debug('parse cache hit: %s' % fields.get('filepath'))
+        return CachedReader(fields)
+
+    def add(self, key, ds):
+        """
+        Cache the metadata of a parsed Reader under key.
+
+        A cache that cannot be written, such as a dirpath that is not a writable directory, is
+        logged and otherwise ignored.
+
+        Parameters
+        ----------
+        key : str
+            cache key, from ParseCache.key.
+        ds : Reader
+            parsed Reader.
+
+        """
+        fields = {}
+        for name, value in vars(ds).iteritems():
+            if name.startswith('_') or name in ['data', 'imagedata', 'failure_reason']:
+                continue
+            try:
+                json.dumps(value, default=util.datetime_encoder)
+            except (TypeError, ValueError):
+                continue
+            fields[name] = value
+        for name in NIMS_FIELDS:
+            fields[name] = getattr(ds, name, None)
+        encoded = json.dumps(fields, default=util.datetime_encoder)
+
+        entry = self._entry(key)
+        if not os.path.isdir(os.path.dirname(entry)):
+            try:
+                os.makedirs(os.path.dirname(entry))
+            except OSError:                         # created concurrently, or not writable
+                pass
+        try:
+            replaced = os.path.getsize(entry)
+        except OSError:
+            replaced = 0
+        staging = None
+        try:
+            fd, staging = tempfile.mkstemp(prefix='.', dir=os.path.dirname(entry))
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(encoded)
+            os.rename(staging, entry)
+        except (IOError, OSError) as e:
+            log.warning('parse cache: cannot write %s: %s' % (entry, e))
+            if staging and os.path.exists(staging):
+                os.remove(staging)
+            return
+
+        if self._total_bytes is None:
+            self._total_bytes = sum([os.path.getsize(other) for other in self._entries()])
+        else:
+            self._total_bytes += len(encoded) - replaced
+        if self._total_bytes > self.max_bytes:
+            self.evict(keep=entry)
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache is within 90% of max_bytes.
+
+        Parameters
+        ----------
+        keep : str [default None]
+            entry file that must not be removed
+
+        """
+        entries = []
+        for entry in self._entries():
+            try:
+                entries.append((os.path.getmtime(entry), os.path.getsize(entry), entry))
+            except OSError:                         # evicted concurrently
+                pass
+        total = sum([size for _, size, _ in entries])
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes * 0.9:
+                break
+            if entry != keep:
+                try:
+                    os.remove(entry)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+        self._total_bytes = total
+
+    def clear(self):
+        """Remove every entry, and reset the counters."""
+        if os.path.isdir(self.dirpath):
+            shutil.rmtree(self.dirpath)
+        self.hits = self.misses = self.evictions = 0
+        self._total_bytes = None
+
+    def stats(self):
+        """Return a dict of the hit, miss and eviction counters."""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+PARSE_CACHE = ParseCache() if PARSE_CACHE_DIR else None
+
+
+# exported fields that hold datetimes, and so are {"$date": ms} in json
+DATE_FIELDS = ('nims_timestamp',)
+
+
+def export_fields(ds):
+    """
+    Return the filepath and nims_* values of a Reader, ReaderRecord or CachedReader.
+
+    Parameters
+    ----------
+    ds : Reader, ReaderRecord or CachedReader
+
+    Returns
+    -------
+    fields : dict
+        filepath and nims_* values, by name.
+
+    """
+    if isinstance(ds, ReaderRecord):
+        fields = dict(zip(ds._fields, ds))
+        del fields['failure_reason']
+    elif isinstance(ds, Reader):
+        fields = ds.nims_dict()
+        fields['filepath'] = ds.filepath
+    else:
+        fields = dict([(name, getattr(ds, name, None)) for name in NIMS_FIELDS])
+        fields['filepath'] = ds.filepath
+    return fields
+
+
+def dump_jsonl(readers, fp, date_fields=DATE_FIELDS):
+    """
+    Write the metadata of many readers as json lines, one object per reader.
+
+    Each object holds export_fields(ds).  The datetimes of date_fields are converted to
+    {"$date": ms}, the same value util.datetime_encoder gives, before encoding, so the json encoder
+    does not call back into python for them.  Datetimes in other fields still go through
+    util.datetime_encoder.
+
+    Parameters
+    ----------
+    readers : iterable
+        Readers, ReaderRecords or CachedReaders.
+    fp : file
+        writable file object.
+    date_fields : sequence [default DATE_FIELDS]
+        names of the fields that hold datetimes.
+
+    Returns
+    -------
+    count : int
+        number of lines written.
+
+    """
+    encoder = json.JSONEncoder(default=util.datetime_encoder)
+    count = 0
+    for ds in readers:
+        fields = export_fields(ds)
+        for name in date_fields:
+            value = fields.get(name)
+            if isinstance(value, datetime.datetime):
+                fields[name] = {'$date': util.epoch_ms(value)}
+        fp.write(encoder.encode(fields) + '\n')
+        count += 1
+    return count
+
+
+def load_jsonl(fp, date_fields=DATE_FIELDS):
+    """
+    Read json lines written by dump_jsonl.
+
+    Only the top level date_fields are converted back to datetimes, rather than checking every
+    object for "$date" with util.datetime_decoder as an object_hook.
+
+    Parameters
+    ----------
+    fp : file
+        readable file object.
+    date_fields : sequence [default DATE_FIELDS]
+        names of the fields that hold {"$date": ms}.
+
+    Returns
+    -------
+    records : list
+        one dict per line.
+
+    """
+    decoder = json.JSONDecoder()
+    records = []
+    for line in fp:
+        if not line.strip():
+            continue
+        record = decoder.decode(line)
+        for name in date_fields:
+            value = record.get(name)
+            if isinstance(value, dict) and '$date' in value:
+                record[name] = util.from_epoch_ms(value['$date'])
+        records.append(record)
+    return records
+
+
 class abstractclassmethod(classmethod):
 
     """
@@ -772,6 +1332,98 @@ class Writer(object):
             metadata.failure_reason = DataError('write error, no data')
 
 
+COMPOSED = ('parse_one', 'parse_all', 'convert')
+
+
+def composed_functions(ds):
+    """
+    Return the functions that a composer gave ds, such as the parse_one of dicom.mr.ge.
+
+    Parameters
+    ----------
+    ds : Reader
+        a parsed reader.
+
+    Returns
+    -------
+    functions : list of (str, function)
+        name and function of each of parse_one, parse_all and convert that ds was composed with.
+
+    """
+    return [(name, ds.__dict__[name].im_func) for name in COMPOSED if hasattr(ds.__dict__.get(name), 'im_func')]
+
+
+def profile_report(stats, ds, top=25):
+    """
+    Report the time of each composed function of ds, then the top functions by cumulative time.
+
+    Parameters
+    ----------
+    stats : pstats.Stats
+        profile of parsing, loading and writing ds.
+    ds : Reader
+        the parsed reader.
+    top : int [default 25]
+        number of functions to report by cumulative time.
+
+    Returns
+    -------
+    report : str
+
+    """
+    lines = ['%-10s %-48s %8s %10s %10s' % ('composed', 'function', 'calls', 'tottime', 'cumtime')]
+    for name, func in composed_functions(ds):
+        key = (func.func_code.co_filename, func.func_code.co_firstlineno, func.func_name)
+        calls, _, tottime, cumtime, _ = stats.stats.get(key, (0, 0, 0., 0., {}))
+        lines.append('%-10s %-48s %8d %10.3f %10.3f' % (name, '%s.%s' % (func.__module__, func.func_name), calls, tottime, cumtime))
+    buf = cStringIO.StringIO()
+    stats.stream = buf
+    stats.sort_stats('cumulative').print_stats(top)
+    return '\n'.join(lines) + '\n' + buf.getvalue()
+
+
+def memory_report(stage_spans, ds, snapshot=None, top=25):
+    """
+    Report the peak RSS growth of each stage, then the top allocations of a tracemalloc snapshot.
+
+    Stages are the spans of scitran.data.spans, in the order they finished; those of the composed
+    functions are marked with their module.  Allocations are only reported with a snapshot, which
+    needs tracemalloc, and so python 3 or the pytracemalloc backport.
+
+    Parameters
+    ----------
+    stage_spans : list of spans.Span
+        spans of parsing, loading and writing ds.
+    ds : Reader
+        the parsed reader.
+    snapshot : tracemalloc.Snapshot [default None]
+        snapshot taken after writing ds.
+    top : int [default 25]
+        number of allocation sites to report, overall and in the composer modules.
+
+    Returns
+    -------
+    report : str
+
+    """
+    composed = dict(composed_functions(ds))
+    lines = ['%-14s %10s %10s %12s %14s  %s' % ('stage', 'wall ms', 'cpu ms', 'bytes', 'peak rss KB', 'composed')]
+    for s in stage_spans:
+        func = composed.get(s.name)
+        lines.append('%-14s %10.1f %10.1f %12d %+14d  %s' % (s.name, s.wall * 1000, s.cpu * 1000, s.bytes, s.peak_rss_kb,
+                     '%s.%s' % (func.__module__, func.func_name) if func else ''))
+    if snapshot is not None:
+        import tracemalloc
+        lines += ['', 'top allocations']
+        lines += [str(stat) for stat in snapshot.statistics('lineno')[:top]]
+        filenames = set([f.func_code.co_filename for f in composed.itervalues()])
+        if filenames:
+            lines += ['', 'top allocations in %s' % ', '.join(sorted(filenames))]
+            traces = snapshot.filter_traces([tracemalloc.Filter(True, filename) for filename in filenames])
+            lines += [str(stat) for stat in traces.statistics('lineno')[:top]]
+    return '\n'.join(lines) + '\n'
+
+
 if __name__ == '__main__':
     import sys
     import argparse
@@ -790,6 +1442,9 @@ if __name__ == '__main__':
     parser.add_argument('-v', '--verbose', help='enable verbose logging', dest='verbose', action='store_true', default=False)
     parser.add_argument(      '--parser_kwarg', action='append', help='keyword arguments to pass directly to the parser')
     parser.add_argument(      '--writer_kwarg', action='append', help='keyword arguments to pass directly to the writer')
+    parser.add_argument(      '--profile', metavar='PSTATS', help='profile parse, load and write with cProfile, and save the stats to PSTATS')
+    parser.add_argument(      '--trace-memory', metavar='REPORT', help='write the peak rss of each stage, and the top allocations where tracemalloc is installed, to REPORT')
+    parser.add_argument(      '--top', type=int, default=25, help='number of entries in the profile and memory reports (default: 25)')
     args = parser.parse_args()
 
     if args.verbose:
@@ -822,11 +1477,43 @@ if __name__ == '__main__':
             w_kwargs[kw] = cast_if_number(val)
     log.debug(w_kwargs)
 
-    ds = data.parse(args.input, load_data=True, ignore_json=args.ignore_json, filetype=args.parser, **p_kwargs)
+    def parse_and_write():
+        ds = data.parse(args.input, load_data=True, ignore_json=args.ignore_json, filetype=args.parser, **p_kwargs)
+
+        if not ds:
+            raise DataError('%s could not be parsed' % args.input)
+        if ds.data is None:
+            raise DataError('%s has no data' % args.input)
 
-    if not ds:
-        raise DataError('%s could not be parsed' % args.input)
-    if ds.data is None:
-        raise DataError('%s has no data' % args.input)
+        data.write(ds, ds.data, outbase, filetype=args.writer, **w_kwargs)
+        return ds
 
-    data.write(ds, ds.data, outbase, filetype=args.writer, **w_kwargs)
+    stage_spans = []
+    if args.trace_memory:
+        data.spans.add_sink(stage_spans.append)
+        try:
+            import tracemalloc
+        except ImportError:
+            tracemalloc = None
+            log.info('tracemalloc is not installed; reporting the peak rss of each stage only')
+        else:
+            tracemalloc.start()
+
+    if args.profile:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        ds = profiler.runcall(parse_and_write)
+        profiler.dump_stats(args.profile)
+        print data.data.profile_report(pstats.Stats(args.profile), ds, args.top)
+    else:
+        ds = parse_and_write()
+
+    if args.trace_memory:
+        snapshot = None
+        if tracemalloc:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        with open(args.trace_memory, 'w') as fp:
+            fp.write(data.data.memory_report(stage_spans, ds, snapshot, args.top))
+        log.info('wrote memory report to %s' % args.trace_memory)
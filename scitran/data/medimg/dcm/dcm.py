@@ -11,18 +11,16 @@ nimsdicom uses a composer design pattern to dynamically incoporate functions bas
 the input data.
 
 """
-import dicom
 import types
 import logging
 import zipfile
 import datetime
-import dcmstack
 import cStringIO
 import collections
-import dcmstack.extract
-import nibabel.nicom.csareader
+import numpy as np
 
 from .. import medimg
+from ... import spans
 parse_patient_name = medimg.parse_patient_name
 parse_patient_id = medimg.parse_patient_id
 parse_patient_dob = medimg.parse_patient_dob
@@ -34,14 +32,59 @@ def timestamp(date, time):
     return date and time and datetime.datetime.strptime(date + time[:6], '%Y%m%d%H%M%S')
 
 
-dicom.config.auto_convert_VR_mismatch = True
-nibabel.nicom.csareader.MAX_CSA_ITEMS = 300
-dcmstack.DicomStack.sort_guesses.append('CsaImage.ImaCoilString')
-try:
-    dcmstack.DicomStack.sort_guesses.remove('InversionTime')
-    dcmstack.DicomStack.minimal_keys.remove('PixelSpacing')
-except ValueError:
-    pass
+_dicom_stack = None
+
+
+def import_dicom_stack():
+    """
+    Import pydicom and dcmstack, and configure them and nibabel's csareader for scitran.
+
+    These take most of a second to import, so they are imported when the first dicom is read,
+    rather than when this module is, which readers that only share its mr helpers, such as
+    PFile, would otherwise pay for.
+
+    Returns
+    -------
+    dicom, dcmstack : module
+        the pydicom and dcmstack modules.
+
+    """
+    global _dicom_stack
+    if _dicom_stack is None:
+        import dicom
+        import dcmstack
+        import dcmstack.extract
+        import nibabel.nicom.csareader
+        dicom.config.auto_convert_VR_mismatch = True
+        nibabel.nicom.csareader.MAX_CSA_ITEMS = 300
+        dcmstack.DicomStack.sort_guesses.append('CsaImage.ImaCoilString')
+        try:
+            dcmstack.DicomStack.sort_guesses.remove('InversionTime')
+            dcmstack.DicomStack.minimal_keys.remove('PixelSpacing')
+        except ValueError:
+            pass
+        _dicom_stack = (dicom, dcmstack)
+    return _dicom_stack
+
+
+_uids_by_name = None
+
+
+def dotted_uid(uid):
+    """
+    Return uid as its dotted number.
+
+    pydicom 0.9 gives the str of a known UID as its name, such as 'MR Image Storage', and that name
+    is what dcmstack's MetaExtractor records; other versions give the dotted number, which is
+    returned as is.
+
+    """
+    global _uids_by_name
+    if _uids_by_name is None:
+        import dicom.UID
+        _uids_by_name = dict([(entry[0], number) for number, entry in dicom.UID.UID_dictionary.iteritems()])
+    return _uids_by_name.get(uid, uid)
+
 
 MAX_LOC_DCMS = 150  # maximum number of dicoms allowed in a "localizer"
 
@@ -60,38 +103,9 @@ SUPPORTED_SOP = {
     }
 
 
-# XXX; not compatible with dcmstack.extract.MetaExtractor warn_on_ex parameter.
-# catching the error prevents error from getting to MetaExtractor class where
-# it was being converted to a warning.
-# this change is necessary because some of the DTI from Davis and UI have a badly
-# formed header field.  The raised exception prevents the remaining
-# sections of mr phoenix protocol to not get parsed.
-# this problem is located in Csa Series Header, 'sWiPMemBlock.tFree'
-class Extractor(dcmstack.extract.MetaExtractor):
-
-    """
-    Override the default dcmstack.extract.MetaExtractor.
-
-    If an elements value cannot be translated using the supplied Value Representation (VR),
-    then return an empty string.  dcmstack.extract.MetaExtractor would normally raise a ValueError
-    upon value-VR mismatch.
-
-    """
-    def _get_elem_value(self, elem):
-        """
-        Get the value for any non-translated elements.
-
-        If element is not translateable with its own VR, then return value=None.
-        """
-        try:
-            value = super(Extractor, self)._get_elem_value(elem)
-        except ValueError:
-            value = ''
-        return value
-
-
 def _parse_phoenix_prot(prot_key, prot_val):
     """Parse a siemens MrProtocol or MrPhoenixProtocol string."""
+    import dcmstack.extract
     if prot_key == 'MrPhoenixProtocol':         # syngo B
         str_delim = '""'
     elif prot_key == 'MrProtocol':              # syngo A
@@ -116,6 +130,8 @@ def _parse_phoenix_prot(prot_key, prot_val):
 
 def _csa_series_trans_func(elem):
     """Function for parsing the CSA series sub header element by element."""
+    import dcmstack.extract
+    import nibabel.nicom.csareader
     csa_dict = dcmstack.extract.simplify_csa_dict(nibabel.nicom.csareader.read(elem.value))
     # If there is a phoenix protocol, parse it and dump it into the csa_dict
     phx_src = None
@@ -167,24 +183,151 @@ def _simplify_csa_dict(csa_dict):
 
 
 def _csa_image_trans_func(elem):
+    import nibabel.nicom.csareader
     return _simplify_csa_dict(nibabel.nicom.csareader.read(elem.value))
 
-_csa_series_trans = dcmstack.extract.Translator(
-        'CsaSeries',
-        dicom.tag.Tag(0x29, 0x1020),
-        'SIEMENS CSA HEADER',
-        _csa_series_trans_func)
 
-_csa_image_trans = dcmstack.extract.Translator(
-        'CsaImage',
-        dicom.tag.Tag(0x29, 0x1010),
-        'SIEMENS CSA HEADER',
-        _csa_image_trans_func)
+def _build_extractor():
+    """Build the MetaExtractor, which needs dcmstack, and so is built at its first use."""
+    dicom, dcmstack = import_dicom_stack()
+
+    # XXX; not compatible with dcmstack.extract.MetaExtractor warn_on_ex parameter.
+    # catching the error prevents error from getting to MetaExtractor class where
+    # it was being converted to a warning.
+    # this change is necessary because some of the DTI from Davis and UI have a badly
+    # formed header field.  The raised exception prevents the remaining
+    # sections of mr phoenix protocol to not get parsed.
+    # this problem is located in Csa Series Header, 'sWiPMemBlock.tFree'
+    class Extractor(dcmstack.extract.MetaExtractor):
+
+        """
+        Override the default dcmstack.extract.MetaExtractor.
+
+        If an elements value cannot be translated using the supplied Value Representation (VR),
+        then return an empty string.  dcmstack.extract.MetaExtractor would normally raise a ValueError
+        upon value-VR mismatch.
+
+        """
+        def _get_elem_value(self, elem):
+            """
+            Get the value for any non-translated elements.
+
+            If element is not translateable with its own VR, then return value=None.
+            """
+            try:
+                value = super(Extractor, self)._get_elem_value(elem)
+            except ValueError:
+                value = ''
+            return value
+
+    _csa_series_trans = dcmstack.extract.Translator(
+            'CsaSeries',
+            dicom.tag.Tag(0x29, 0x1020),
+            'SIEMENS CSA HEADER',
+            _csa_series_trans_func)
+
+    _csa_image_trans = dcmstack.extract.Translator(
+            'CsaImage',
+            dicom.tag.Tag(0x29, 0x1010),
+            'SIEMENS CSA HEADER',
+            _csa_image_trans_func)
+
+    return Extractor(
+            ignore_rules=[dcmstack.extract.ignore_non_ascii_bytes],
+            translators=[_csa_image_trans, _csa_series_trans]
+            )
+
+
+class _LazyExtractor(object):
+
+    """Stand-in for the MetaExtractor that builds it at its first call."""
+
+    _extractor = None
+
+    def load(self):
+        if _LazyExtractor._extractor is None:
+            _LazyExtractor._extractor = _build_extractor()
+        return _LazyExtractor._extractor
+
+    def __call__(self, dcm, *args, **kwargs):
+        return self.load()(dcm, *args, **kwargs)
+
+
+MetaExtractor = _LazyExtractor()
+
 
-MetaExtractor = Extractor(
-        ignore_rules=[dcmstack.extract.ignore_non_ascii_bytes],
-        translators=[_csa_image_trans, _csa_series_trans]
-        )
+_composers = {}  # composer modules, or None, by 'sop.mfr'
+
+
+def get_composer(composer):
+    """
+    Import the composer module of a 'sop.mfr' pair, once per process.
+
+    Parameters
+    ----------
+    composer : str
+        'sop.mfr', such as 'mr.ge'.
+
+    Returns
+    -------
+    module : module or None
+        the module that defines parse_one, parse_all and convert for composer, or None if there is
+        no such module.
+
+    """
+    if composer not in _composers:
+        try:
+            _composers[composer] = __import__(composer, globals(), fromlist=['parse_one', 'parse_all', 'convert'])
+        except (ImportError, AttributeError):
+            _composers[composer] = None
+    return _composers[composer]
+
+
+# per-instance fields of a series, gathered once into a table by Dicom.load_data; nan where missing
+GEOMETRY_DTYPE = np.dtype([
+    ('orientation', 'f8', (6,)),        # ImageOrientationPatient
+    ('position', 'f8', (3,)),           # ImagePositionPatient
+    ('trigger_time', 'f8'),             # TriggerTime
+    ('slice_location', 'f8'),           # SliceLocation
+    ('instance_number', 'f8'),          # InstanceNumber
+])
+
+
+def _floats(value, n):
+    try:
+        values = [float(x) for x in value]
+    except (TypeError, ValueError):
+        values = []
+    return values if len(values) == n else [np.nan] * n
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def geometry_table(dcm_list):
+    """
+    Gather the geometry of each dicom of a series into a structured array.
+
+    Parameters
+    ----------
+    dcm_list : list of pydicom.dataset
+        dicoms of one series
+
+    Returns
+    -------
+    geometry : np.array
+        structured array of GEOMETRY_DTYPE, one row per dicom
+
+    """
+    return np.array([(_floats(d.get('ImageOrientationPatient'), 6),
+                      _floats(d.get('ImagePositionPatient'), 3),
+                      _float(d.get('TriggerTime')),
+                      _float(d.get('SliceLocation')),
+                      _float(d.get('InstanceNumber'))) for d in dcm_list], dtype=GEOMETRY_DTYPE)
 
 
 class DicomError(medimg.MedImgError):
@@ -225,6 +368,15 @@ class Dicom(medimg.MedImgReader):
     parse_priority = 9
     state = ['orig']
 
+    @classmethod
+    def preload(cls):
+        """Import pydicom and dcmstack, build the MetaExtractor and import every composer."""
+        import_dicom_stack()
+        MetaExtractor.load()
+        for sop in set(SUPPORTED_SOP.itervalues()):
+            for mfr in set(SUPPORTED_MFR.itervalues()):
+                get_composer('%s.%s' % (sop, mfr))
+
     def __init__(self, path, load_data=False, timezone=None):
         """
         Parse a single file from the input.
@@ -235,11 +387,17 @@ class Dicom(medimg.MedImgReader):
 
         """
         super(Dicom, self).__init__(path, load_data, timezone)
-        with zipfile.ZipFile(path) as zip_dicom:
+        dicom, _ = import_dicom_stack()
+        with spans.span('zip open') as stats:
+            zip_dicom = zipfile.ZipFile(path)
+            stats.attrs['members'] = len(zip_dicom.namelist())
+        with zip_dicom:
             for filename in zip_dicom.namelist():
-                with zip_dicom.open(filename) as zip_content:
+                with spans.span('header decode', filename=filename) as stats, zip_dicom.open(filename) as zip_content:
+                    content = zip_content.read()
+                    stats.bytes = len(content)
                     try:
-                        self._hdr = MetaExtractor(dicom.read_file(cStringIO.StringIO(zip_content.read()), stop_before_pixels=True))
+                        self._hdr = MetaExtractor(dicom.read_file(cStringIO.StringIO(content), stop_before_pixels=True))
                     except (dicom.filereader.InvalidDicomError, AttributeError, ValueError):
                         # dicom.filereader.InvalidDicomError, not a dicom
                         # AttributeError,
@@ -258,6 +416,8 @@ class Dicom(medimg.MedImgReader):
                     self.manufacturer = 'SIEMENS'
                     break
         self.sop_class_uid = self.getelem(self._hdr, 'SOPClassUID', str)
+        if self.sop_class_uid:
+            self.sop_class_uid = dotted_uid(self.sop_class_uid)
 
         if not self.manufacturer:
             log.warning('could not determine manufacturer from dicom header')
@@ -267,9 +427,8 @@ class Dicom(medimg.MedImgReader):
         mfr = SUPPORTED_MFR.get(self.manufacturer)
         sop = SUPPORTED_SOP.get(self.sop_class_uid)
         composer = '%s.%s' % (sop, mfr)
-        try:
-            _temp = __import__(composer, globals(), fromlist=['parse_one', 'parse_all', 'convert'])
-        except (ImportError, AttributeError):
+        _temp = get_composer(composer)
+        if _temp is None:
             log.warning('no composer matches %s. parsing basic info only.' % composer)
         else:
             self.parse_one = types.MethodType(_temp.parse_one, self)  # types.MethodType(fxn, i), turn fxn into method of instance
@@ -314,7 +473,8 @@ class Dicom(medimg.MedImgReader):
         self.phase_encode_direction = None  # FIXME: how do diff mfr's store phase_encode_direction??
 
         self.metadata_status = 'pending'
-        self.parse_one()  # COMPOSED; parses mfr sop specific data
+        with spans.span('parse_one', composer=composer):
+            self.parse_one()  # COMPOSED; parses mfr sop specific data
 
         if load_data:
             self.load_data()
@@ -350,11 +510,14 @@ class Dicom(medimg.MedImgReader):
         """
         super(Dicom, self).load_data()
         self._dcm_list = []
-        with zipfile.ZipFile(self.filepath) as zip_dicom:
+        dicom, _ = import_dicom_stack()
+        with spans.span('member decode') as stats, zipfile.ZipFile(self.filepath) as zip_dicom:
             for filename in zip_dicom.namelist():
                 with zip_dicom.open(filename) as zip_content:
+                    content = zip_content.read()
+                    stats.bytes += len(content)
                     try:
-                        dcm = dicom.read_file(cStringIO.StringIO(zip_content.read()), stop_before_pixels=False)
+                        dcm = dicom.read_file(cStringIO.StringIO(content), stop_before_pixels=False)
                         if self.getelem(dcm, 'SOPClassUID') != self.sop_class_uid:  # mismatch SOP, do not attempt recon
                             log.error('dicoms have inconsistent SOP Class UIDs')  # XXX expected error
                             self.is_non_image = True
@@ -364,16 +527,21 @@ class Dicom(medimg.MedImgReader):
 
         if self._dcm_list == []:
             raise DicomError('no dicoms loaded?')  # XXX FAIL! unexpected for no dicoms to be loaded
-        try:
-            self._dcm_list.sort(key=lambda dcm: dcm.InstanceNumber)
-        except AttributeError:
+        self._geometry = geometry_table(self._dcm_list)    # consumed by parse_all and convert
+        if np.isnan(self._geometry['instance_number']).any():
             log.debug('dicoms do not have InstanceNumber. cannot pre-sort')
+        else:
+            order = np.argsort(self._geometry['instance_number'], kind='mergesort')
+            self._dcm_list = [self._dcm_list[i] for i in order]
+            self._geometry = self._geometry[order]
 
-        self.parse_all()  # COMPOSED; parses mfr sop specifics
+        with spans.span('parse_all', dicoms=len(self._dcm_list)):
+            self.parse_all()  # COMPOSED; parses mfr sop specifics
         self.metadata_status = 'complete'  # if parse_all completes, metadata is assumed to be completed
 
         try:
-            self.convert()  # COMPOSED; converts mfr sop specific, may also do last round of metadata touch ups
+            with spans.span('convert', dicoms=len(self._dcm_list)):
+                self.convert()  # COMPOSED; converts mfr sop specific, may also do last round of metadata touch ups
         except Exception as e:
             log.debug('%s pixel data could not be loaded: %s' % (self.filepath, str(e)))
             self.data = None
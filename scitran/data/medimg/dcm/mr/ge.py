@@ -14,9 +14,11 @@ attempt to ensure correctness.
 
 """
 
+import os
 import logging
-import dcmstack
 import numpy as np
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
 import mr
 from .. import dcm
@@ -31,7 +33,9 @@ TAG_BVALUE = (0x0043, 0x1039)                                       # CSA_BVALUE
 TAG_BVEC = [(0x0019, 0x10bb), (0x0019, 0x10bc), (0x0019, 0x10bd)]   # CSA_BVEC = ['UserData20', 'UserData21', 'UserData22']
 MAX_LOC_DCMS = dcm.MAX_LOC_DCMS
 MetaExtractor = dcm.MetaExtractor
+import_dicom_stack = dcm.import_dicom_stack
 DicomError = dcm.DicomError
+STACK_THREADS = int(os.environ.get('SCITRAN_STACK_THREADS', 0)) or min(multiprocessing.cpu_count(), 8)  # threads of stack_groups
 
 def infer_psd_type(self):
     """
@@ -158,9 +162,7 @@ def parse_all(self):
 
     """
     if self.total_num_slices < MAX_LOC_DCMS:
-        slice_norms = [np.cross(np.matrix(d.get('ImageOrientationPatient')[0:3]), np.matrix(d.get('ImageOrientationPatient')[3:6]))[0] for d in self._dcm_list]
-        norm_diff = [np.abs(np.dot(slice_norms[0], n)).round(2) for n in slice_norms]
-        self.is_localizer = bool(len(set(norm_diff)) > 1)
+        self.is_localizer = mr.is_localizer(self._geometry['orientation'])
 
     if self.is_dwi:
         # DTI scans could have 1+ non-DTI volume. num vols will be >= dwi_dirs + 1
@@ -171,27 +173,23 @@ def parse_all(self):
     recon_mode_flag = np.unique([self.getelem(d, TAG_RECON_FLAG, int, 0) for d in self._dcm_list])
     if not self.is_dwi and self.psd_type not in ['fieldmap']:
         log.debug('might be multicoil')
-        vol_counter = 0
-        ref_position = self.getelem(self._hdr, 'ImagePositionPatient')
-        for d in self._dcm_list:
-            if np.allclose(self.getelem(d, 'ImagePositionPatient'), ref_position):
-                vol_counter += 1
+        vol_counter = mr.count_at_position(self._geometry['position'], self.getelem(self._hdr, 'ImagePositionPatient'))
         log.debug('found %d volumes; expected %d' % (vol_counter, (self.num_timepoints or 1) * (self.num_echos or 1)))
         if vol_counter > (self.num_timepoints or 1) * (self.num_echos or 1):
             self.is_multicoil = True
             self.num_receivers = (self.total_num_slices / self.num_slices) - 1   # actual #recv = -1 of num volumes
-            self._dcm_groups = [self._dcm_list[x::self.num_receivers + 1] for x in xrange(0, self.num_receivers + 1)]
+            self._dcm_groups = [(self._dcm_list[x::self.num_receivers + 1], self._geometry[x::self.num_receivers + 1]) for x in xrange(0, self.num_receivers + 1)]
             log.debug('groups: %3d; %3d coils + 1 combined' % (len(self._dcm_groups), self.num_receivers))
 
     # attempt to calculate trigger times and slice duration, if the first dicom reports trigger time
     self.slice_duration = None
-    if self.total_num_slices >= self.num_slices and self.getelem(self._dcm_list[0], 'TriggerTime', float) is not None:
+    if self.total_num_slices >= self.num_slices and not np.isnan(self._geometry['trigger_time'][0]):
         log.debug('using trigger times to calculate slice order and slice duration')
-        trigger_times = np.array([self.getelem(d, 'TriggerTime', float) for d in self._dcm_list[0:self.num_slices]])
+        trigger_times = self._geometry['trigger_time'][0:self.num_slices]
         if self.reverse_slice_order:
             trigger_times = trigger_times[::-1]
-        # if trigger_times is mixed float and None, then dtype = 'O'
-        if self.num_slices > 2 and len(trigger_times) > 2 and trigger_times.dtype == 'float64':
+        # missing trigger times are nan
+        if self.num_slices > 2 and len(trigger_times) > 2 and not np.isnan(trigger_times).any():
             trigger_times_from_first_slice = trigger_times[0] - trigger_times
             self.slice_duration = float(min(abs(trigger_times_from_first_slice[1:]))) / 1000    # msec to sec
             if trigger_times_from_first_slice[1] < 0:
@@ -213,33 +211,83 @@ def parse_all(self):
     log.debug(self.psd_name)
     log.debug(self.psd_type)
 
-def fastcard_convert(self):
-    """GE fast card conversion."""
-    log.debug('fast card')
-    stacks = []
-    group_id = 0
-    def _split_list(l, size):
-        return [l[i:i+size] for i in range(0, len(l), size)]
-    dcm_groups = _split_list(self._dcm_list, self.total_num_slices / 5)
-
-    for group in dcm_groups:
-        group_id += 1
-        num_positions = len(set([d.SliceLocation for d in group]))
+def stack_groups(self, groups, label):
+    """
+    Reconstruct each group of dicoms into one volume of a preallocated array.
+
+    Each group, such as one receive coil, is stacked with dcmstack on a pool of STACK_THREADS
+    threads, and written into its volume of the output as soon as it is stacked, rather than
+    stacking every group and then joining them with NiftiWrapper.from_sequence, which holds every
+    group and their joined copy at once.  The first group is stacked before the pool starts, to
+    size the output.
+
+    Parameters
+    ----------
+    groups : list of (list, np.recarray)
+        dicoms of each group, and their geometry table.
+    label : str
+        what a group is, such as 'coil', for error messages.
+
+    Returns
+    -------
+    data : np.ndarray
+        voxels of every group, with the group as their last dimension.
+    affine : np.ndarray
+        affine of the first group.
+
+    Raises
+    ------
+    DicomError
+        a group does not have num_slices unique positions, cannot be stacked, or does not match the
+        shape, data type and orientation of the first group.
+
+    """
+    _, dcmstack = import_dicom_stack()
+
+    def _stack(group_id):
+        group, geometry = groups[group_id]
+        log.debug('%s %2d, %d dicoms' % (label, group_id + 1, len(group)))
+        num_positions = len(np.unique(geometry['slice_location']))
         if num_positions != self.num_slices:
-            raise DicomError('volume %s has %s unique positions; expected %s' % (group_id, num_positions, self.num_slices))
+            raise DicomError('%s %s has %s unique positions; expected %s' % (label, group_id + 1, num_positions, self.num_slices))
         stack = dcmstack.DicomStack()
         for d in group:
-            meta = MetaExtractor(d)
-            stack.add_dcm(d, meta)
-        nii_wrp = stack.to_nifti_wrapper()
-        stacks.append(nii_wrp)
-    try:
-        nii_wrp = dcmstack.dcmmeta.NiftiWrapper.from_sequence(stacks)
-    except dcmstack.InvalidStackError as e:
-        raise DicomError('cannot reconstruct %s: %s' % (self.filepath, str(e)))
-    nii = nii_wrp.nii_img
-    self.data = {'': nii.get_data()}
-    self.qto_xyz = nii.get_affine()
+            stack.add_dcm(d, MetaExtractor(d))
+        try:
+            return stack.get_data(), stack.get_affine()
+        except dcmstack.InvalidStackError as e:
+            raise DicomError('cannot reconstruct %s: %s' % (self.filepath, e))
+
+    first, affine = _stack(0)
+    data = np.empty(first.shape + (len(groups),), first.dtype)
+    data[..., 0] = first
+    del first
+
+    def _fill(group_id):
+        group_data, group_affine = _stack(group_id)
+        if group_data.shape != data.shape[:-1] or not np.can_cast(group_data.dtype, data.dtype):
+            raise DicomError('cannot reconstruct %s: %s %d is %s %s; expected %s %s' % (self.filepath, label, group_id + 1,
+                             group_data.dtype, group_data.shape, data.dtype, data.shape[:-1]))
+        if not np.allclose(group_affine[:3, :3], affine[:3, :3], atol=5e-4):
+            raise DicomError('cannot reconstruct %s: %s %d has a different orientation' % (self.filepath, label, group_id + 1))
+        data[..., group_id] = group_data
+
+    if len(groups) > 1:
+        pool = ThreadPool(max(min(STACK_THREADS, len(groups) - 1), 1))
+        try:
+            pool.map(_fill, range(1, len(groups)))
+        finally:
+            pool.terminate()
+    return data, affine
+
+
+def fastcard_convert(self):
+    """GE fast card conversion."""
+    log.debug('fast card')
+    group_size = self.total_num_slices / 5
+    dcm_groups = [(self._dcm_list[i:i + group_size], self._geometry[i:i + group_size]) for i in range(0, len(self._dcm_list), group_size)]
+    data, self.qto_xyz = stack_groups(self, dcm_groups, 'volume')
+    self.data = {'': data}
     mr.post_convert(self)
 
 def multicoil_convert(self):
@@ -247,30 +295,10 @@ def multicoil_convert(self):
     log.debug('multicoil recon')
     mr.partial_vol_check(self)
 
-    stacks = []
-    group_id = 0
-    for group in self._dcm_groups:
-        group_id += 1
-        log.debug('multicoil - %2s, %s dicom' % (str(group_id), str(len(group))))
-        num_positions = len(set([d.SliceLocation for d in group]))
-        if num_positions != self.num_slices:
-            raise DicomError('coil %s has %s unique positions; expected %s' % (group_id, num_positions, self.num_slices))
-        stack = dcmstack.DicomStack()
-        for dcm in group:
-            meta = MetaExtractor(dcm)
-            stack.add_dcm(dcm, meta)
-        nii_wrp = stack.to_nifti_wrapper()
-        stacks.append(nii_wrp)
-    try:
-        nii_wrp = dcmstack.dcmmeta.NiftiWrapper.from_sequence(stacks)
-    except dcmstack.InvalidStackError as e:
-        raise DicomError('cannot reconstruct %s: %s' % (self.filepath, e))      # XXX FAIL! unexpected for recon to fail
-        # raise NIMSDicomError('cannot reconstruct %s: %s' % (self.filepath, e), log_level=logging.ERROR)
-    del self._dcm_groups, self._dcm_list, stacks, stack, dcm
-    nii = nii_wrp.nii_img
-    self.data = {'': nii.get_data()}
-    self.qto_xyz = nii.get_affine()
-    del nii_wrp, nii
+    data, self.qto_xyz = stack_groups(self, self._dcm_groups, 'coil')
+    del self._dcm_groups, self._dcm_list
+    self.data = {'': data}
+    del data
 
     mr.post_convert(self)
 
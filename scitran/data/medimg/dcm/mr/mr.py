@@ -13,7 +13,6 @@ note: direct usage of these functions is an "advanced" topic.
 """
 
 import logging
-import dcmstack
 import numpy as np
 
 from .. import dcm
@@ -25,6 +24,7 @@ log = logging.getLogger(__name__)
 
 DicomError = dcm.DicomError
 MetaExtractor = dcm.MetaExtractor
+import_dicom_stack = dcm.import_dicom_stack
 MAX_LOC_DCMS = dcm.MAX_LOC_DCMS
 
 # NIFITI1-style slice order codes:
@@ -125,7 +125,7 @@ def adjust_bvecs(bvecs, bvals, vendor, rotation=None):
     """
     bvecs, bvals = scale_bvals(bvecs, bvals)
     # TODO: Uncomment the following when we are ready to fix the bvec flip issue:
-    if vendor.lower().startswith('ge') and rotation != None:
+    if vendor.lower().startswith('ge') and rotation is not None:
         log.debug('rotating bvecs with image orientation matrix')
         bvecs,bvals = rotate_bvecs(bvecs, bvals, rotation)
     else:
@@ -133,6 +133,59 @@ def adjust_bvecs(bvecs, bvals, vendor, rotation=None):
     return bvecs, bvals
 
 
+def squared_norms(bvecs):
+    """
+    Compute the squared magnitude of each bvec.
+
+    Sums the squares of the x, y and z rows in that order, as the dot product of each column did.
+
+    Parameters
+    ----------
+    bvecs : 3xN np.array
+        b-vectors, one per column
+
+    Returns
+    -------
+    sqmag : np.array
+        squared magnitude of each of the N bvecs
+
+    """
+    return (bvecs * bvecs).sum(axis=0)
+
+
+def count_decimals(values, max_decimals=9):
+    """
+    Guess the number of decimals that values were stored with.
+
+    Rounds every value to 0 through max_decimals - 1 decimals in one (max_decimals, N) array, as
+    np.around does, and returns one more than the most decimals at which rounding changes any value.
+    A nan or inf value counts as changed at every number of decimals, as it did in the per-decimal
+    loop this replaced, without a RuntimeWarning.
+
+    Parameters
+    ----------
+    values : np.array
+        floats, such as bvecs
+    max_decimals : int [default 9]
+        number of decimal counts to try
+
+    Returns
+    -------
+    num_decimals : int
+        1 if the values have no decimals.
+
+    """
+    scale = 10. ** np.arange(max_decimals)
+    flat = values.ravel()
+    rounded = np.multiply.outer(scale, flat)
+    np.rint(rounded, out=rounded)
+    rounded /= scale[:, np.newaxis]
+    with np.errstate(invalid='ignore'):     # inf - inf is nan, which counts as changed
+        rounded -= flat
+    changed = np.flatnonzero((rounded != 0).any(axis=1))
+    return changed[-1] + 1 if changed.size else 1
+
+
 def scale_bvals(bvecs, bvals):
     """
     Scale the b-values given non-unit-lengh bvecs.
@@ -155,17 +208,11 @@ def scale_bvals(bvecs, bvals):
     """
     if np.count_nonzero(bvecs) != 0 and np.count_nonzero(bvals) != 0:
         # if bvecs and bvals are all zeros, then there is no need to scale or rotate
-        sqmag = np.array([bv.dot(bv) for bv in bvecs.T])
+        sqmag = squared_norms(bvecs)
         # The bvecs are generally stored with 3 decimal values. So, we get significant fluctuations in the
         # sqmag due to rounding error. To avoid spurious adjustments to the bvals, we round the sqmag based
         # on the number of decimal values.
-        # TODO: is there a more elegant way to determine the number of decimals used?
-        try:
-            num_decimals = np.nonzero([np.max(np.abs(bvecs - bvecs.round(decimals=d))) for d in range(9)])[0][-1] + 1
-        except IndexError:
-            # the bvecs don't have ANY decimals, and thus a rounding threshold cannot be set
-            # log.debug('there are no decimals, cannot intelligently scale bvecs/bvals')
-            num_decimals = 1
+        num_decimals = count_decimals(bvecs)
         sqmag = np.around(sqmag, decimals=num_decimals - 1)
         bvals *= sqmag            # Scale each bval by the squared magnitude of the corresponding bvec
         sqmag[sqmag == 0] = np.inf  # Avoid divide-by-zero
@@ -193,14 +240,54 @@ def rotate_bvecs(bvecs, bvals, rotation):
     (bvecs, bvals) : tuple(list of floats, list of floats)
 
     """
-    bvecs = np.array(np.matrix(rotation) * bvecs)
+    bvecs = np.dot(rotation, bvecs)
     # Normalize each bvec to unit length
-    norm = np.sqrt(np.array([bv.dot(bv) for bv in bvecs.T]))
+    norm = np.sqrt(squared_norms(bvecs))
     norm[norm == 0] = np.inf  # Avoid divide-by-zero
     bvecs /= norm
     return bvecs, bvals
 
 
+def is_localizer(orientations):
+    """
+    Determine if the slices of a series are not all parallel, as in a 3-plane localizer.
+
+    Parameters
+    ----------
+    orientations : np.array
+        (N,6) ImageOrientationPatient of each dicom
+
+    Returns
+    -------
+    is_localizer : bool
+        True if the slice normals are not all parallel to the first slice normal.
+
+    """
+    slice_norms = np.cross(orientations[:, 0:3], orientations[:, 3:6])
+    norm_diff = np.abs(slice_norms.dot(slice_norms[0])).round(2)
+    return bool(len(np.unique(norm_diff)) > 1)
+
+
+def count_at_position(positions, ref_position):
+    """
+    Count the dicoms at the reference position, one per volume of a single slice stack.
+
+    Parameters
+    ----------
+    positions : np.array
+        (N,3) ImagePositionPatient of each dicom
+    ref_position : list of floats
+        ImagePositionPatient to count
+
+    Returns
+    -------
+    count : int
+        number of dicoms whose position is within np.allclose tolerance of ref_position
+
+    """
+    return int(np.count_nonzero(np.isclose(positions, np.asarray(ref_position, dtype=float)).all(axis=1)))
+
+
 # TODO: infer_scan_type should be broken down by manufacturer for maintainability
 def infer_scan_type(self):
     """
@@ -386,7 +473,7 @@ def localizer_convert(self):
     """
 
     log.debug('localizer recon')
-    num_ornts = len(set([tuple(d.get('ImageOrientationPatient', [0.] * 6)) for d in self._dcm_list]))
+    num_ornts = len(set(map(tuple, np.nan_to_num(self._geometry['orientation']))))
     self.num_timepoints = num_ornts
     self.num_slices = self.total_num_slices / self.num_timepoints
     # determine cosines, slice norm and rotation
@@ -396,8 +483,7 @@ def localizer_convert(self):
     slice_norm = np.cross(row_cosines, col_cosines)
     rot = compute_rotation(row_cosines, col_cosines, slice_norm)
     # determine origin
-    image_position = [tuple(self.getelem(d, 'ImagePositionPatient', float, [0., 0., 0.])) for d in self._dcm_list]
-    origin = image_position[0] * np.array([-1, -1, 1])
+    origin = np.nan_to_num(self._geometry['position'][0]) * np.array([-1, -1, 1])
     self.qto_xyz = build_affine(rot, self.mm_per_vox, origin)
     # recon
     self.data = np.dstack([np.swapaxes(d.pixel_array, 0, 1) for d in self._dcm_list])
@@ -427,6 +513,7 @@ def partial_vol_check(self):        # AKA _pre_convert.
         if partial_vol_dcms:
             log.debug('number of dicoms is not a integer multiple of number of unique slices positions. trimming.')
             self._dcm_list = self._dcm_list[:-1 * partial_vol_dcms]
+            self._geometry = self._geometry[:-1 * partial_vol_dcms]
             # TODO: add comment notes
 
 
@@ -442,6 +529,7 @@ def standard_convert(self):
     log.debug('standard recon')
     partial_vol_check(self)
 
+    _, dcmstack = import_dicom_stack()
     stack = dcmstack.DicomStack()
     for dcm in self._dcm_list:
         stack.add_dcm(dcm, MetaExtractor(dcm))
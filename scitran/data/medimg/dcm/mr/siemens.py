@@ -179,9 +179,7 @@ def parse_all(self):
     self.num_receivers = len([self._hdr[key] for key in self._hdr if key.endswith('sCoilElementID.tCoilID')])
 
     if self.total_num_slices < MAX_LOC_DCMS:
-        slice_norms = [np.cross(np.matrix(d.get('ImageOrientationPatient')[0:3]), np.matrix(d.get('ImageOrientationPatient')[3:6]))[0] for d in self._dcm_list]
-        norm_diff = [np.abs(np.dot(slice_norms[0], n)).round(2) for n in slice_norms]
-        self.is_localizer = bool(len(set(norm_diff)) > 1)
+        self.is_localizer = mr.is_localizer(self._geometry['orientation'])
 
     if self.is_dwi:
         self.bvals = np.array([MetaExtractor(d).get(TAG_BVALUE, 0.) for d in self._dcm_list[:]])
@@ -20,11 +20,11 @@ import abc
 import string
 import logging
 import datetime
-import dcmstack
 import numpy as np
 
 from .. import data
 from .. import util
+from .. import spans
 
 log = logging.getLogger(__name__)
 
@@ -660,7 +660,10 @@ class MedImgWriter(data.Writer):
 
         """
         log.debug('reorienting to voxel order %s' % voxel_order)
-        new_data, new_qto_xyz, _, _ = dcmstack.reorder_voxels(imagedata, qto_xyz, voxel_order)
+        import dcmstack
+        with spans.span('reorient', voxel_order=voxel_order) as stats:
+            new_data, new_qto_xyz, _, _ = dcmstack.reorder_voxels(imagedata, qto_xyz, voxel_order)
+            stats.bytes = imagedata.nbytes
         return new_data, new_qto_xyz
 
     @data.abstractclassmethod
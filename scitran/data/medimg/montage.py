@@ -22,6 +22,7 @@ import numpy as np
 from PIL import Image
 
 import medimg
+from .. import spans
 
 log = logging.getLogger(__name__)
 
@@ -37,7 +38,7 @@ def generate_montage(imagedata, timepoints=[], bits16=False):
 
     # This transpose (usually) makes the resulting images come out in a more standard orientation.
     # TODO: we could look at the qto_xyz to infer the optimal transpose for any dataset.
-    data = imagedata.transpose(np.concatenate(([1, 0], range(2, imagedata.ndim))))
+    data = imagedata.transpose([1, 0] + range(2, imagedata.ndim))
     num_images = np.prod(data.shape[2:])
 
     if data.ndim < 2:
@@ -53,7 +54,7 @@ def generate_montage(imagedata, timepoints=[], bits16=False):
     elif data.ndim >= 4:
         # timeseries (x, y, z, t) or more
         num_cols = data.shape[2]
-        data = data.transpose(np.concatenate(([0, 1, 3, 2], range(4, data.ndim)))).reshape(data.shape[0], data.shape[1], num_images)
+        data = data.transpose([0, 1, 3, 2] + range(4, data.ndim)).reshape(data.shape[0], data.shape[1], num_images)
         if len(timepoints) > 0:
             data = data[..., timepoints]
 
@@ -259,17 +260,20 @@ class Montage(medimg.MedImgReader, medimg.MedImgWriter):
 
             if voxel_order:
                 data, _ = cls.reorder_voxels(data, metadata.qto_xyz, voxel_order)
-            if mtype == 'png':
-                log.debug('type: flat png')
-                result = generate_flat(data, outname + '.png')
-            elif mtype == 'dir':
-                log.debug('type: directory')
-                result = generate_dir_pyr(data, outname, tilesize)
-            elif mtype == 'zip':
-                log.debug('type: zip of tiles')
-                result = generate_zip_pyr(data, outname, tilesize)
-            else:
-                raise MontageError('montage mtype must be sqlite, dir or png. not %s' % mtype)
+            with spans.span('encode', mtype=mtype) as stats:
+                if mtype == 'png':
+                    log.debug('type: flat png')
+                    result = generate_flat(data, outname + '.png')
+                elif mtype == 'dir':
+                    log.debug('type: directory')
+                    result = generate_dir_pyr(data, outname, tilesize)
+                elif mtype == 'zip':
+                    log.debug('type: zip of tiles')
+                    result = generate_zip_pyr(data, outname, tilesize)
+                else:
+                    raise MontageError('montage mtype must be sqlite, dir or png. not %s' % mtype)
+                if isinstance(result, basestring) and os.path.isfile(result):
+                    stats.bytes = os.path.getsize(result)
 
             results.append(result)
         return results
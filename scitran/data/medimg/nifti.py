@@ -21,6 +21,7 @@ import numpy as np
 import medimg
 
 from .. import util
+from .. import spans
 
 log = logging.getLogger(__name__)
 
@@ -79,19 +80,15 @@ class Nifti(medimg.MedImgReader, medimg.MedImgWriter):
         # self.metadata._hdr = get header
         # first simple parse of _hdr
 
-    def load_data(self, preloaded):
-        super(Nifti, self).load_data(preloaded)
-        if not preloaded:
-            try:
-                nifti = nibabel.load(self.filepath)
-            except Exception as e:
-                raise NiftiError(e)
+    def load_data(self):
+        super(Nifti, self).load_data()
+        nifti = self.nifti      # loaded by __init__
 
         # TODO: nibabel nifti header reader
         # self.metadata.group
         # self.metadata.project
         # self.metadata.exam_uid
-        self.data = nifti.imagedata.squeeze()
+        self.data = {'': nifti.get_data().squeeze()}
         self.qto_xyz = nifti.get_affine()
         self.sform = nifti.get_sform()
         self.qform = nifti.get_qform()
@@ -260,7 +257,9 @@ class Nifti(medimg.MedImgReader, medimg.MedImgWriter):
             nii_header['pixdim'][4] = metadata.tr   # XXX pixdim[4] = TR, even when non-timeseries. not nifti compliant
 
             filepath = outname + '.nii.gz'
-            nibabel.save(nifti, filepath)
+            with spans.span('compress', filename=os.path.basename(filepath)) as stats:
+                nibabel.save(nifti, filepath)
+                stats.bytes = os.path.getsize(filepath)
             log.debug('generated %s' % os.path.basename(filepath))
             results.append(filepath)
 
@@ -15,16 +15,24 @@ full parsing of pfiles, spiral reconstruction, and mux_epi reconstruction.
 """
 
 import os
-import glob
 import gzip
 import json
 import time
 import shlex
+import shutil
 import struct
+import hashlib
 import logging
+import zlib
+import Queue
+import fnmatch
+import functools
 import zipfile
 import datetime
+import threading
+import weakref
 import subprocess
+import distutils.spawn
 import numpy as np
 
 import medimg
@@ -32,10 +40,25 @@ import dcm.mr.ge
 import dcm.mr.mr
 
 from .. import util
+from .. import spans
 from .. import tempdir as tempfile
 
 log = logging.getLogger(__name__)
 
+HEADER_READ_BLOCK = 16384   # pfile headers are read, and decompressed, in blocks of this many bytes
+UNCOMPRESS_CHUNK_SIZE = 4 * 1024 * 1024  # bytes per read/write when uncompressing in-process
+
+# auxiliary files, by suffix, that each recon reads in addition to the pfile
+RECON_AUX_SUFFIXES = {
+    'muxepi': ['_ref.dat', '_vrgf.dat'],
+}
+TENSOR_SUFFIX = '_tensor.dat'   # read for diffusion scans, regardless of recon
+
+# set $SCITRAN_CAL_CACHE to a directory, such as ~/.cache/scitran/calibration, to cache extracted
+# muxepi calibration files there; off by default
+CAL_CACHE_DIR = os.environ.get('SCITRAN_CAL_CACHE', '')
+CAL_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
 
 def unpack_uid(uid):
     """
@@ -73,16 +96,21 @@ def is_gzip(filepath):
     return compressed
 
 
-def uncompress(filepath, tempdir):
+def uncompress(filepath, tempdir, chunk_size=UNCOMPRESS_CHUNK_SIZE):
     """
     Uncompress a gzip file into the tempdir location.
 
+    Uses pigz if it can be found in $PATH, otherwise decompresses in-process, reading and
+    writing in fixed size chunks.  Logs the decompression throughput.
+
     Parameters
     ----------
     filepath : str
         path to gzip file to unpack
     tempdir : str
         where to unzip the file to
+    chunk_size : int [default UNCOMPRESS_CHUNK_SIZE]
+        number of bytes per read and write, when decompressing in-process
 
     Returns
     -------
@@ -90,19 +118,301 @@ def uncompress(filepath, tempdir):
         full path to uncompressed file
 
     """
-    newpath = os.path.join(tempdir, os.path.basename(filepath)[:-3])
-    # the following with pigz is ~4x faster than in python
-    if os.path.isfile('/usr/bin/pigz'):
-        subprocess.call('pigz -d -c %s > %s' % (filepath, newpath), shell=True)
-    elif os.path.isfile('/usr/bin/gzip') or os.path.isfile('/bin/gzip'):
-        subprocess.call('gzip -d -c %s > %s' % (filepath, newpath), shell=True)
-    else:
-        with open(newpath, 'wb') as fd:
+    basename = os.path.basename(filepath)
+    newpath = os.path.join(tempdir, basename[:-3] if basename.endswith('.gz') else basename)
+    start_sec = time.time()
+    pigz = distutils.spawn.find_executable('pigz')
+    with open(newpath, 'wb') as fd:
+        if pigz:
+            # pigz is ~4x faster than python; no shell, so odd filenames are safe
+            subprocess.check_call([pigz, '-d', '-c', filepath], stdout=fd)
+        else:
             with gzip.open(filepath, 'rb') as gzfile:
-                fd.writelines(gzfile)
+                shutil.copyfileobj(gzfile, fd, chunk_size)
+    elapsed = max(time.time() - start_sec, 1e-6)
+    size_mb = os.path.getsize(newpath) / 1048576.
+    log.info('uncompressed %s with %s: %.1f MB in %.2f s (%.1f MB/s)'
+             % (basename, 'pigz' if pigz else 'python', size_mb, elapsed, size_mb / elapsed))
     return newpath
 
 
+def run_jobs(jobs, num_jobs, on_complete=None):
+    """
+    Run commands as child processes, at most num_jobs at a time.
+
+    A job is started as soon as a running job exits; each running job is waited on by its
+    own thread, so free slots are refilled without polling.  The wall time of each job is
+    logged.  If a job exits with a non-zero status, the remaining running jobs are terminated,
+    no further jobs are started, and a PFileError is raised.
+
+    Parameters
+    ----------
+    jobs : list
+        list of (key, args) tuples, in the order they should be started.  args is passed to
+        subprocess.Popen; key identifies the job in logs, errors and on_complete.
+    num_jobs : int
+        maximum number of simultaneous jobs
+    on_complete : callable [default None]
+        called as on_complete(key) in the calling thread, as soon as each job has exited
+        successfully, while the remaining jobs are still running.
+
+    Raises
+    ------
+    PFileError : Exception
+        a job exited with a non-zero status
+
+    """
+    pending = list(jobs)
+    running = {}
+    finished = Queue.Queue()
+
+    def _wait(key, proc, start_sec):
+        proc.wait()
+        finished.put((key, proc, start_sec))
+
+    with open(os.devnull, 'w') as devnull:
+        try:
+            while pending or running:
+                while pending and len(running) < max(num_jobs, 1):
+                    key, args = pending.pop(0)
+                    log.debug('starting job %s: %s' % (key, ' '.join(args)))
+                    proc = subprocess.Popen(args=args, stdout=devnull)
+                    running[key] = proc
+                    waiter = threading.Thread(target=_wait, args=(key, proc, time.time()))
+                    waiter.daemon = True
+                    waiter.start()
+                try:
+                    # a get without a timeout cannot be interrupted by Ctrl-C on python 2
+                    key, proc, start_sec = finished.get(timeout=1)
+                except Queue.Empty:
+                    continue
+                del running[key]
+                if proc.returncode != 0:
+                    raise PFileError('job %s exited with status %d' % (key, proc.returncode))
+                log.debug('job %s finished in %.1f seconds' % (key, time.time() - start_sec))
+                if on_complete:
+                    on_complete(key)
+        finally:
+            for proc in running.itervalues():
+                if proc.poll() is None:
+                    proc.terminate()
+
+
+def pfile_prefix(filepath):
+    """
+    Return the P?????.7 prefix that a pfile shares with its auxiliary files.
+
+    Auxiliary files are named after their pfile, e.g. P12345.7_ref.dat, P12345.7_vrgf.dat and
+    P12345.7_tensor.dat.
+
+    Parameters
+    ----------
+    filepath : str
+        path to a pfile.7 or pfile.7.gz
+
+    Returns
+    -------
+    prefix : str
+        basename of filepath up to and including '.7'
+
+    """
+    basename = os.path.basename(filepath)
+    idx = basename.find('.7')
+    return basename[:idx + 2] if idx >= 0 else basename
+
+
+def related_files(filepath):
+    """
+    List the pfile at filepath, and the auxiliary files that belong to it.
+
+    Files in the same directory that belong to other pfiles are skipped, since a recon
+    will never read them.
+
+    Parameters
+    ----------
+    filepath : str
+        path to a pfile.7 or pfile.7.gz
+
+    Returns
+    -------
+    paths : list
+        sorted list of paths, including filepath.
+
+    """
+    dirpath = os.path.dirname(filepath)
+    prefix = pfile_prefix(filepath)
+    return [os.path.join(dirpath, f) for f in sorted(os.listdir(dirpath)) if f.startswith(prefix)]
+
+
+def find_pfile_member(archive):
+    """
+    Return the name of the pfile within a zip archive.
+
+    Parameters
+    ----------
+    archive : zipfile.ZipFile
+        open zip archive of a pfile, and its auxiliary files
+
+    Returns
+    -------
+    member : str
+        name of the P?????.7 or P?????.7.gz member
+
+    Raises
+    ------
+    PFileError : Exception
+        the archive does not contain a pfile
+
+    """
+    for member in archive.namelist():
+        basename = os.path.basename(member)
+        if fnmatch.fnmatch(basename, 'P?????.7') or fnmatch.fnmatch(basename, 'P?????.7.gz'):
+            return member
+    raise PFileError('no pfile found in %s' % archive.filename)
+
+
+class _GunzipStream(object):
+
+    """Forward-only reader that decompresses a gzip stream that cannot seek, such as a zip member."""
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._pending = ''
+
+    def read(self, size):
+        while len(self._pending) < size:
+            chunk = self._fileobj.read(HEADER_READ_BLOCK)
+            if not chunk:
+                self._pending += self._z.flush()
+                break
+            self._pending += self._z.decompress(chunk)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def close(self):
+        self._fileobj.close()
+
+
+class PFileHeader(object):
+
+    """
+    Read-only, seekable view of the start of a pfile, shared by all header parsing.
+
+    Bytes are read, and decompressed for .7.gz, only as far as the furthest position that has
+    been requested, and are kept in memory.  Version detection, _min_parse and _full_parse can
+    then share one pass over the header, and decompression of a .7.gz stops at the end of the
+    POOL_HEADER instead of restarting from the beginning of the file for each step.
+
+    The pfile can also be a member of a zip archive, in which case the header is read directly
+    from the zip stream, without extracting the pfile.
+
+    The underlying file is only held open while reading; see close().
+
+    Parameters
+    ----------
+    filepath : str
+        path to a pfile.7 or pfile.7.gz, or to a zip that contains one
+    member : str [default None]
+        name of the pfile.7 or pfile.7.gz within the zip at filepath
+
+    """
+
+    def __init__(self, filepath, member=None):
+        self.filepath = filepath
+        self.member = member
+        self.name = filepath if member is None else os.path.join(filepath, member)
+        self._archive = None
+        self._fileobj = None
+        self._buf = ''
+        self._pos = 0
+        if member is None:
+            self.compressed = is_gzip(filepath)
+        else:
+            self.compressed = False             # until the first two bytes have been checked
+            self.compressed = (self._open().read(2) == '\x1f\x8b')
+            self.close()
+
+    def _open(self):
+        """Open the underlying file, positioned after the buffered bytes."""
+        if self.member is None:
+            self._fileobj = gzip.open(self.filepath, 'rb') if self.compressed else open(self.filepath, 'rb')
+            self._fileobj.seek(len(self._buf))
+        else:
+            self._archive = zipfile.ZipFile(self.filepath)
+            self._fileobj = self._archive.open(self.member)
+            if self.compressed:
+                self._fileobj = _GunzipStream(self._fileobj)
+            skip = len(self._buf)               # zip streams can't seek
+            while skip > 0:
+                data = self._fileobj.read(min(skip, HEADER_READ_BLOCK))
+                if not data:
+                    break
+                skip -= len(data)
+        return self._fileobj
+
+    def _fill(self, size):
+        """Extend the buffer to at least size bytes, or to the end of the file."""
+        if size <= len(self._buf):
+            return
+        if self._fileobj is None:
+            self._open()
+        want = size - len(self._buf)
+        chunk = self._fileobj.read(want + (-want % HEADER_READ_BLOCK))    # round up to whole blocks
+        self._buf += chunk
+
+    def _fill_all(self):
+        while True:
+            size = len(self._buf)
+            self._fill(size + HEADER_READ_BLOCK)
+            if len(self._buf) == size:
+                break
+
+    def head(self, size):
+        """Return the first size bytes of the file, or fewer if the file is shorter."""
+        self._fill(size)
+        return self._buf[:size]
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            self._fill_all()
+            end = len(self._buf)
+        else:
+            end = self._pos + size
+            self._fill(end)
+        data = self._buf[self._pos:end]
+        self._pos += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            self._fill_all()
+            offset += len(self._buf)
+        if offset < 0:
+            raise IOError('negative seek position %d' % offset)
+        self._pos = offset
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        """Close the underlying file.  The buffered bytes remain readable."""
+        if self._fileobj is not None:
+            self._fileobj.close()
+            self._fileobj = None
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def get_version(filepath):
     """
     Determine the pfile version of the file at filepath.
@@ -111,8 +421,8 @@ def get_version(filepath):
 
     Parameters
     ----------
-    filepath : str
-        filepath of file to check
+    filepath : str or PFileHeader
+        filepath of file to check, or the PFileHeader of that file
 
     Returns
     -------
@@ -125,10 +435,15 @@ def get_version(filepath):
         error if the file is not a valid PFile
 
     """
-    fileobj = gzip.open(filepath, 'rb') if is_gzip(filepath) else open(filepath, 'rb')
+    if isinstance(filepath, PFileHeader):
+        header = filepath
+        buf = header.head(44)
+    else:
+        with PFileHeader(filepath) as header:
+            buf = header.head(44)
 
-    version_bytes = fileobj.read(4)
-    fileobj.seek(34); logo = (struct.unpack("10s", fileobj.read(struct.calcsize("10s")))[0]).split('\0', 1)[0]
+    version_bytes = buf[0:4]
+    logo = buf[34:44].split('\0', 1)[0]
     if version_bytes == '\x00\x00\xc0A':
         version = 24
     elif version_bytes == 'V\x0e\xa0A':
@@ -138,17 +453,574 @@ def get_version(filepath):
     elif version_bytes == '\x00\x000A':
         version = 12
     else:
-        raise PFileError(fileobj.name + ' is not a valid PFile or of an unsupported version')
+        raise PFileError(header.name + ' is not a valid PFile or of an unsupported version')
     if logo != 'GE_MED_NMR' and logo != 'INVALIDNMR':
-        raise PFileError(fileobj.name + ' is not a valid PFile')
-    fileobj.close()
+        raise PFileError(header.name + ' is not a valid PFile')
     return version
 
 
+def _cstr(value):
+    """Strip the NUL padding from a fixed-width header string."""
+    return value.split('\0', 1)[0]
+
+
+def _psd_name(value):
+    """Return the lowercase psd name, without the psd path."""
+    return os.path.basename(value).split('\0', 1)[0].lower()
+
+
+class HeaderLayout(object):
+
+    """
+    Precompiled table of header fields that can be unpacked from a single buffer.
+
+    Each field is described by an attribute name, a byte offset from the start of the file,
+    a struct format and a converter that is applied to the unpacked value. The formats are
+    compiled into struct.Struct objects once, and the size of the header region spanned by the
+    fields is precomputed, so a pfile header can be parsed with one read.
+
+    Parameters
+    ----------
+    fields : list
+        list of (name, offset, fmt, converter) tuples. converter can be None.
+
+    """
+
+    def __init__(self, fields):
+        self.fields = [(name, offset, struct.Struct(fmt), converter) for name, offset, fmt, converter in fields]
+        self.size = max([offset + st.size for _, offset, st, _ in self.fields])
+
+    def unpack(self, buf):
+        """
+        Unpack all fields from buf.
+
+        Parameters
+        ----------
+        buf : str
+            header bytes, starting at byte 0 of the pfile.
+
+        Returns
+        -------
+        values : dict
+            field values, keyed by field name.
+
+        Raises
+        ------
+        PFileError : Exception
+            buf is shorter than the header region.
+
+        """
+        if len(buf) < self.size:
+            raise PFileError('pfile header truncated; expected %d bytes, got %d' % (self.size, len(buf)))
+        values = {}
+        for name, offset, st, converter in self.fields:
+            value = st.unpack_from(buf, offset)[0]
+            values[name] = converter(value) if converter else value
+        return values
+
+
+# fields read by PFile._min_parse, as (attribute, offset, format, converter)
+_MIN_PARSE_COMMON = [
+    ('scan_date', 16, '10s', str),
+    ('scan_time', 26, '8s', str),
+    ('num_timepoints', 64, 'h', None),
+    ('num_echos', 70, 'h', None),
+    ('rec_user0', 216, 'f', None),
+    ('rec_user6', 240, 'f', None),
+    ('rec_user7', 244, 'f', None),
+    ('ileaves', 914, 'h', None),
+]
+_MIN_PARSE_V22_V24 = [
+    ('exam_no', 143516, 'H', str),
+    ('series_no', 145622, 'h', None),
+    ('series_desc', 145762, '65s', _cstr),
+    ('series_uid', 145875, '32s', unpack_uid),
+    ('im_datetime', 148388, 'i', None),
+    ('tr', 148396, 'i', lambda v: v / 1e6),
+    ('acq_no', 148834, 'h', None),
+    ('psd_name', 148972, '33s', _psd_name),
+]
+MIN_PARSE_FIELDS = {
+    24: _MIN_PARSE_COMMON + _MIN_PARSE_V22_V24 + [
+        ('exam_uid', 144248, '32s', unpack_uid),
+        ('patient_id', 144409, '65s', _cstr),
+    ],
+    23: _MIN_PARSE_COMMON + _MIN_PARSE_V22_V24 + [
+        ('exam_uid', 144248, '32s', unpack_uid),
+        ('patient_id', 144409, '65s', _cstr),
+    ],
+    22: _MIN_PARSE_COMMON + _MIN_PARSE_V22_V24 + [
+        ('exam_uid', 144240, '32s', unpack_uid),
+        ('patient_id', 144401, '65s', _cstr),
+    ],
+    12: _MIN_PARSE_COMMON + [
+        ('exam_no', 61576, 'H', str),
+        ('exam_uid', 61966, '32s', unpack_uid),
+        ('patient_id', 62127, '65s', _cstr),
+        ('series_no', 62710, 'h', None),
+        ('series_desc', 62786, '65s', _cstr),
+        ('series_uid', 62899, '32s', unpack_uid),
+        ('im_datetime', 65016, 'i', None),
+        ('tr', 65024, 'i', lambda v: v / 1e6),
+        ('acq_no', 65328, 'h', None),
+        ('psd_name', 65374, '33s', _psd_name),
+    ],
+}
+MIN_PARSE_LAYOUTS = dict((version, HeaderLayout(fields)) for version, fields in MIN_PARSE_FIELDS.iteritems())
+
+
 class PFileError(medimg.MedImgError):
     pass
 
 
+def calibration_key(filepath):
+    """
+    Identify the scan of a pfile, or of the pfile in a zip, from its header.
+
+    Parameters
+    ----------
+    filepath : str
+        path to a pfile.7 or pfile.7.gz, or to a zip that contains one
+
+    Returns
+    -------
+    key : tuple
+        (exam_uid, series_uid, psd_name)
+
+    """
+    member = None
+    if zipfile.is_zipfile(filepath):
+        with zipfile.ZipFile(filepath) as archive:
+            member = find_pfile_member(archive)
+    with PFileHeader(filepath, member) as header:
+        version = get_version(header)
+        layout = MIN_PARSE_LAYOUTS.get(version)
+        if layout is None:
+            raise PFileError('calibration_key() does not support v%s' % version)
+        values = layout.unpack(header.head(layout.size))
+    return (values['exam_uid'], values['series_uid'], values['psd_name'])
+
+
+def extract_calibration(aux_file, dirpath):
+    """
+    Place the muxepi calibration files of aux_file in dirpath.
+
+    Parameters
+    ----------
+    aux_file : str
+        path to a pfile.zip that contains ref.dat and vrgf.dat files, or to a pfile.7 or
+        pfile.7.gz that has them alongside
+    dirpath : str
+        directory to place the calibration files in
+
+    Returns
+    -------
+    cal_file : str or None
+        path that, suffixed with '_ref.dat' and '_vrgf.dat', names the calibration files. None if
+        aux_file does not have both.
+
+    """
+    suffixes = RECON_AUX_SUFFIXES['muxepi']
+    if zipfile.is_zipfile(aux_file):
+        with zipfile.ZipFile(aux_file) as aux_archive:
+            log.debug('inspecting aux file: %s' % aux_file)
+            members = [m for m in aux_archive.namelist() if m.endswith(tuple(suffixes))]
+            for member in members:
+                with aux_archive.open(member) as src, open(os.path.join(dirpath, os.path.basename(member)), 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+        found = [os.path.basename(m) for m in members]
+    else:
+        found = []
+        for fname in related_files(aux_file):
+            if fname.endswith(tuple(suffixes)):
+                os.symlink(fname, os.path.join(dirpath, os.path.basename(fname)))
+                found.append(os.path.basename(fname))
+    for f in found:
+        log.debug('%s found, %s' % (f.rsplit('_', 1)[-1], os.path.join(dirpath, f)))
+    prefixes = set([f[:-len(suffix)] for f in found for suffix in suffixes if f.endswith(suffix)])
+    for prefix in sorted(prefixes):
+        if all([(prefix + suffix) in found for suffix in suffixes]):
+            return os.path.join(dirpath, prefix)
+    return None
+
+
+class CalibrationCache(object):
+
+    """
+    On-disk cache of extracted muxepi calibration files.
+
+    Each entry holds the ref.dat and vrgf.dat of one calibration scan, in a directory named by
+    the sha1 of the scan's (exam_uid, series_uid, psd_name), so the calibration of a session is
+    extracted once, not once per dependent acquisition.  When the cache grows beyond max_bytes,
+    the least recently used entries are removed.
+
+    Parameters
+    ----------
+    dirpath : str [default CAL_CACHE_DIR]
+        cache directory, created if it does not exist
+    max_bytes : int [default CAL_CACHE_MAX_BYTES]
+        size bound of the cache
+
+    """
+
+    def __init__(self, dirpath=CAL_CACHE_DIR, max_bytes=CAL_CACHE_MAX_BYTES):
+        self.dirpath = dirpath
+        self.max_bytes = max_bytes
+
+    def _entry(self, key):
+        return os.path.join(self.dirpath, hashlib.sha1('\0'.join(key)).hexdigest())
+
+    def _entries(self):
+        if not os.path.isdir(self.dirpath):
+            return []
+        return [os.path.join(self.dirpath, e) for e in os.listdir(self.dirpath) if not e.startswith('.')]
+
+    @staticmethod
+    def _read_meta(entry):
+        try:
+            with open(os.path.join(entry, 'calibration.json')) as fp:
+                return json.load(fp)
+        except (IOError, ValueError):
+            return None
+
+    def get(self, key):
+        """
+        Return the cached cal_file of key, or None.
+
+        Parameters
+        ----------
+        key : tuple
+            (exam_uid, series_uid, psd_name) of the calibration scan
+
+        Returns
+        -------
+        cal_file : str or None
+            path that, suffixed with '_ref.dat' and '_vrgf.dat', names the calibration files.
+
+        """
+        entry = self._entry(key)
+        meta = self._read_meta(entry)
+        if meta is None or (meta['exam_uid'], meta['series_uid'], meta['psd_name']) != tuple(key):
+            return None
+        os.utime(entry, None)                       # most recently used
+        return os.path.join(entry, meta['prefix'])
+
+    def add(self, key, aux_file):
+        """
+        Extract the calibration files of aux_file into the cache, under key.
+
+        Parameters
+        ----------
+        key : tuple
+            (exam_uid, series_uid, psd_name) of the calibration scan
+        aux_file : str
+            path to the calibration pfile.zip, pfile.7 or pfile.7.gz
+
+        Returns
+        -------
+        cal_file : str or None
+            path that, suffixed with '_ref.dat' and '_vrgf.dat', names the cached calibration files.
+            None if aux_file does not have both.
+
+        """
+        if not os.path.isdir(self.dirpath):
+            os.makedirs(self.dirpath)
+        staging = tempfile.mkdtemp(prefix='.', dir=self.dirpath)
+        try:
+            cal_file = extract_calibration(aux_file, staging)
+            if cal_file is None:
+                return None
+            for f in os.listdir(staging):             # the cache must not depend on aux_file
+                path = os.path.join(staging, f)
+                if os.path.islink(path):
+                    target = os.path.realpath(path)
+                    os.remove(path)
+                    shutil.copyfile(target, path)
+            meta = {'exam_uid': key[0], 'series_uid': key[1], 'psd_name': key[2], 'prefix': os.path.basename(cal_file)}
+            with open(os.path.join(staging, 'calibration.json'), 'w') as fp:
+                json.dump(meta, fp)
+            entry = self._entry(key)
+            try:
+                os.rename(staging, entry)
+            except OSError:                         # added concurrently
+                pass
+        finally:
+            if os.path.exists(staging):
+                shutil.rmtree(staging)
+        log.debug('cached calibration of %s in %s' % (aux_file, entry))
+        self.evict(keep=entry)
+        return self.get(key)
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache is within max_bytes.
+
+        Parameters
+        ----------
+        keep : str [default None]
+            entry directory that must not be removed
+
+        """
+        entries = []
+        for entry in self._entries():
+            size = sum([os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry)])
+            entries.append((os.path.getmtime(entry), size, entry))
+        total = sum([s for _, s, _ in entries])
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry != keep:
+                log.debug('evicting cached calibration %s' % entry)
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+
+# MATLAB v5 data types, and the numpy dtypes of their data
+_MI_DTYPES = {1: 'i1', 2: 'u1', 3: 'i2', 4: 'u2', 5: 'i4', 6: 'u4', 7: 'f4', 9: 'f8', 12: 'i8', 13: 'u8'}
+_MX_DTYPES = {6: 'f8', 7: 'f4', 8: 'i1', 9: 'u1', 10: 'i2', 11: 'u2', 12: 'i4', 13: 'u4', 14: 'i8', 15: 'u8'}
+_MI_MATRIX = 14
+_MI_COMPRESSED = 15
+_MAT_NAME_BYTES = 512   # enough of a matrix element to hold its flags, dims and name
+
+
+def _mat_subelements(buf, bo):
+    """Yield (mdtype, offset, nbytes) of the padded subelements in buf, stopping where buf is truncated."""
+    pos = 0
+    while pos + 8 <= len(buf):
+        mdtype, nbytes = struct.unpack_from(bo + 'II', buf, pos)
+        if mdtype >> 16:                            # small data element, packed into the tag
+            mdtype, nbytes, start, pos = mdtype & 0xffff, mdtype >> 16, pos + 4, pos + 8
+        else:
+            start, pos = pos + 8, pos + 8 + (nbytes + 7) // 8 * 8
+        if start + nbytes > len(buf):
+            return
+        yield mdtype, start, nbytes
+
+
+def _mat_matrix_name(buf, bo):
+    """Return the name of the miMATRIX element in buf, or None if buf is too short to tell."""
+    for i, (mdtype, start, nbytes) in enumerate(_mat_subelements(buf, bo)):
+        if i == 2:
+            return buf[start:start + nbytes]
+    return None
+
+
+def _mat_matrix_array(buf, bo):
+    """Return the numeric array of the miMATRIX element in buf."""
+    elements = list(_mat_subelements(buf, bo))
+    flags = struct.unpack_from(bo + 'I', buf, elements[0][1])[0]
+    dtype = _MX_DTYPES.get(flags & 0xff)
+    if dtype is None:
+        raise PFileError('mat array class %d is not numeric' % (flags & 0xff))
+    dims = np.frombuffer(buf, bo + 'i4', elements[1][2] // 4, elements[1][1])
+    parts = []
+    for mdtype, start, nbytes in elements[3:5 if flags & 0x800 else 4]:
+        # numeric data may be stored in a smaller type than its class.  astype always copies, so
+        # the array is writable, rather than a read-only view of buf
+        stored = np.dtype(bo + _MI_DTYPES[mdtype])
+        part = np.frombuffer(buf, stored, nbytes // stored.itemsize, start).reshape(dims, order='F')
+        parts.append(part.astype(dtype))
+    return parts[0] + 1j * parts[1] if len(parts) == 2 else parts[0]
+
+
+def read_mat_vars(filepath, names):
+    """
+    Read only the named numeric arrays from a MATLAB .mat file.
+
+    Level 5 files are read directly; the tag of each variable is read, and unwanted variables
+    are skipped without being read, or decompressed past their name.  Arrays are returned as
+    writable copies of the bytes read, without the squeezing of scipy.io.loadmat.  Other
+    formats, and variables that are not plain numeric arrays, are read with scipy.io.loadmat.
+
+    Parameters
+    ----------
+    filepath : str
+        path to *.mat
+    names : list
+        names of variables to read
+
+    Returns
+    -------
+    arrays : dict
+        arrays, keyed by name, in MATLAB's dimensions; names not in the file are absent.
+
+    """
+    try:
+        return _read_mat5_vars(filepath, names)
+    except (PFileError, KeyError, IndexError, struct.error, zlib.error) as e:
+        log.debug('reading %s with scipy.io.loadmat; %s' % (filepath, e))
+        import scipy.io
+        mat = scipy.io.loadmat(filepath, variable_names=names)
+        return dict((name, mat[name]) for name in names if name in mat)
+
+
+def _read_mat5_vars(filepath, names):
+    arrays = {}
+    with open(filepath, 'rb') as fp:
+        header = fp.read(128)
+        if len(header) < 128 or '\0' in header[:4] or header[124:126] not in ('\x00\x01', '\x01\x00'):
+            raise PFileError('not a level 5 mat file')
+        bo = {'IM': '<', 'MI': '>'}.get(header[126:128])
+        if bo is None:
+            raise PFileError('not a level 5 mat file')
+        while len(arrays) < len(names):
+            tag = fp.read(8)
+            if len(tag) < 8:
+                break
+            mdtype, nbytes = struct.unpack(bo + 'II', tag)
+            next_pos = fp.tell() + nbytes
+            if mdtype == _MI_COMPRESSED:
+                # decompress just far enough to see the name, and the rest only if it is wanted
+                decomp = zlib.decompressobj()
+                buf = ''
+                name = None
+                while name is None and fp.tell() < next_pos:
+                    buf += decomp.decompress(fp.read(min(_MAT_NAME_BYTES, next_pos - fp.tell())))
+                    if len(buf) >= 8:
+                        name = _mat_matrix_name(buf[8:], bo)
+                if name in names:
+                    buf += decomp.decompress(fp.read(next_pos - fp.tell())) + decomp.flush()
+                    mdtype, nbytes = struct.unpack_from(bo + 'II', buf)
+                    buf = buf[8:8 + nbytes]
+            elif mdtype == _MI_MATRIX:
+                buf = fp.read(min(_MAT_NAME_BYTES, nbytes))
+                name = _mat_matrix_name(buf, bo)
+                if name in names:
+                    buf += fp.read(nbytes - len(buf))
+            else:
+                name = None
+            if name in names:
+                if mdtype != _MI_MATRIX:
+                    raise PFileError('mat variable %s is not a matrix' % name)
+                arrays[name] = _mat_matrix_array(buf, bo)
+            fp.seek(next_pos)
+    return arrays
+
+
+_streamed = {}  # weakrefs to the arrays of stream_array, by directory; released arrays remove theirs
+
+
+def stream_array(shape, dtype, tempdir=None):
+    """
+    Return a writable np.memmap of shape and dtype, backed by a file in a new directory in tempdir.
+
+    The directory is removed once the array, and every view of it, has been released, so the file
+    stays in place while the data is in use.  Removing it earlier only works on POSIX, where an
+    unlinked file stays mapped.
+
+    Parameters
+    ----------
+    shape : tuple
+        shape of the array
+    dtype : np.dtype
+        type of the array
+    tempdir : str [default None]
+        directory to create the backing file's directory in.  None uses the system default.
+
+    Returns
+    -------
+    data : np.memmap
+        uninitialized array
+
+    """
+    dirpath = tempfile.mkdtemp(dir=tempdir)
+    try:
+        data = np.memmap(os.path.join(dirpath, 'stream.raw'), dtype=dtype, mode='w+', shape=shape)
+    except Exception:
+        shutil.rmtree(dirpath, ignore_errors=True)
+        raise
+
+    def remove(ref):
+        del _streamed[dirpath]
+        shutil.rmtree(dirpath, ignore_errors=True)
+    _streamed[dirpath] = weakref.ref(data, remove)
+    return data
+
+
+RECONS = json.load(open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'recons.json')))
+
+
+# package that recon backend names are relative to: scitran.data, or data when data.py is run as
+# a script, so that backends resolve to the same PFile class as the reader that calls them
+_PACKAGE = __name__.rsplit('.', 2)[0]
+
+
+def _resolve(name):
+    """Return the object at dotted name; relative to this module's package, like readers.json, or absolute."""
+    parts = str(name).split('.')
+    for prefix in [_PACKAGE + '.', '']:
+        for i in range(len(parts) - 1, 0, -1):
+            try:
+                obj = __import__(prefix + '.'.join(parts[:i]), fromlist=[parts[i]])
+            except ImportError:
+                continue
+            try:
+                for attr in parts[i:]:
+                    obj = getattr(obj, attr)
+            except AttributeError:
+                break
+            return obj
+    raise PFileError('recon backend %s cannot be imported' % name)
+
+
+class ReconBackend(object):
+
+    """
+    A reconstruction function, and the resources that one run of it needs.
+
+    The function is called as func(ds, filepath, tempdir), where ds is the PFile being
+    reconstructed, and populates ds.data; PFile methods, such as PFile.recon_spirec, qualify.
+    Declaring cores and memory lets a scheduler pack concurrent recons onto a node.
+
+    Parameters
+    ----------
+    func : callable or str
+        recon function, or its dotted name, which is imported when the recon is first needed.
+        names are relative to the package of this module, scitran.data, like the entries of
+        readers.json, or absolute.
+    cores : int [default 1]
+        cores one recon keeps busy
+    memory_mb : int [default 1024]
+        peak memory of one recon, in MB
+
+    """
+
+    def __init__(self, func, cores=1, memory_mb=1024):
+        self._func = func
+        self.cores = cores
+        self.memory_mb = memory_mb
+
+    @property
+    def func(self):
+        if not callable(self._func):
+            self._func = _resolve(self._func)
+        return self._func
+
+
+# recon backends by psd_type, as configured in recons.json
+RECON_BACKENDS = dict((psd_type, ReconBackend(**dict((str(k), v) for k, v in spec.iteritems())))
+                      for psd_type, spec in RECONS.iteritems())
+
+
+def register_recon(psd_type, func, cores=1, memory_mb=1024):
+    """
+    Register func as the recon backend of psd_type, replacing any existing backend.
+
+    Parameters
+    ----------
+    psd_type : str
+        psd_type to reconstruct, as inferred by dcm.mr.ge.infer_psd_type
+    func : callable or str
+        recon function, or its dotted name. see ReconBackend.
+    cores : int [default 1]
+        cores one recon keeps busy
+    memory_mb : int [default 1024]
+        peak memory of one recon, in MB
+
+    """
+    RECON_BACKENDS[psd_type] = ReconBackend(func, cores, memory_mb)
+
+
 class PFile(medimg.MedImgReader):
 
     """
@@ -196,12 +1068,13 @@ class PFile(medimg.MedImgReader):
     parse_priority = 5
     state = ['orig']
 
-    def __init__(self, filepath, load_data=False, timezone=None, full_parse=False, tempdir=None, aux_file=None, num_jobs=4, num_virtual_coils=16, notch_thresh=0, recon_type=None):
+    def __init__(self, filepath, load_data=False, timezone=None, full_parse=False, tempdir=None, aux_file=None, num_jobs=4, num_virtual_coils=16, notch_thresh=0, recon_type=None, mrs_frames=None, mrs_coils=None, mrs_stream=False):
         """
         Read basic sorting information.
 
         There are a lot of parameters; most of the parameters only apply to mux_epi scans. The muxepi only
-        parameters are num_jobs, num_virtual_coils, notch_thresh, recon_type and aux_file.
+        parameters are num_jobs, num_virtual_coils, notch_thresh, recon_type and aux_file.  The mrs
+        only parameters are mrs_frames, mrs_coils and mrs_stream.
 
         Parameters
         ----------
@@ -223,6 +1096,13 @@ class PFile(medimg.MedImgReader):
             muxepi only, if recon_type is 'sense', then run sense recon
         aux_file : None or str
             path to pfile.zip that contains valid vrgf.dat and ref.dat files
+        mrs_frames : None or list
+            mrs only, frames to load. None loads all frames
+        mrs_coils : None or list
+            mrs only, coils to load. None loads all coils
+        mrs_stream : bool [default False]
+            mrs only, hold the loaded data in a file in tempdir, instead of in memory.  The file is
+            removed once the data is released.
 
         """
         super(PFile, self).__init__(filepath, load_data, timezone)       # sets self.filepath
@@ -238,9 +1118,13 @@ class PFile(medimg.MedImgReader):
         self.notch_thresh = notch_thresh
         self.recon_type = recon_type
         self.aux_file = aux_file
+        self.mrs_frames = mrs_frames
+        self.mrs_coils = mrs_coils
+        self.mrs_stream = mrs_stream
         self.tempdir = tempdir
         self.data = None
-
+        self._header = None                             # PFileHeader, shared by all header parsing
+        self.cal_cache = CalibrationCache() if CAL_CACHE_DIR else None
 
         log.debug('parsing %s' % filepath)
         if zipfile.is_zipfile(self.filepath):  # zip; find json header in the comment
@@ -265,14 +1149,69 @@ class PFile(medimg.MedImgReader):
                     self.metadata_status = 'pending'
         else:  # .7 or .7.gz, doing it old world style
             try:
-                self.version = get_version(self.filepath)
+                self.version = get_version(self._open_header(self.filepath))
                 self._full_parse(self.filepath) if full_parse else self._min_parse(self.filepath)  # full_parse arg indicates run full_parse
             except Exception as e:
                 raise PFileError('not a PFile? %s' % str(e))
+            finally:
+                self._release_header()
 
         if load_data:
             self.load_data()
 
+    def _open_header(self, filepath, member=None):
+        """
+        Return the PFileHeader of filepath, reusing the instance's header if it is for the same file.
+
+        Parameters
+        ----------
+        filepath : str
+            path to a pfile.7 or pfile.7.gz, or to a zip that contains one
+        member : str [default None]
+            name of the pfile within the zip at filepath
+
+        Returns
+        -------
+        header : PFileHeader
+            header buffer of filepath, also stored as self._header.
+
+        """
+        if self._header is None or (self._header.filepath, self._header.member) != (filepath, member):
+            if self._header is not None:
+                self._header.close()
+            self._header = PFileHeader(filepath, member)
+        return self._header
+
+    def _release_header(self):
+        """Close the shared PFileHeader, and drop its buffer, once header parsing is done."""
+        if self._header is not None:
+            self._header.close()
+            self._header = None
+
+    def recon_members(self, namelist, pfile_member):
+        """
+        Select the zip members that the recon of this pfile will read.
+
+        Must be called after _full_parse, as the selection depends on psd_type and is_dwi.
+
+        Parameters
+        ----------
+        namelist : list
+            names of all members in the zip
+        pfile_member : str
+            name of the pfile member, as returned by find_pfile_member
+
+        Returns
+        -------
+        members : list
+            pfile_member, followed by any auxiliary members the recon needs.
+
+        """
+        suffixes = list(RECON_AUX_SUFFIXES.get(self.psd_type, []))
+        if self.is_dwi:
+            suffixes.append(TENSOR_SUFFIX)
+        return [pfile_member] + [m for m in namelist if m != pfile_member and m.endswith(tuple(suffixes))]
+
     def infer_psd_type(self):
         """
         Infer the psd type based on self.psd_type.
@@ -307,6 +1246,9 @@ class PFile(medimg.MedImgReader):
         """
         Parse the minimum sorting information from a pfile.7.
 
+        The fields for each pfile version are listed in MIN_PARSE_FIELDS, and are unpacked
+        from a single read of the header region.
+
         Does not work if input file is a zip.  If Pfile was init'd with a zip input, the zip can be
         unpacked into a temporary directory, and then this function can parse the unpacked pfile.
 
@@ -321,42 +1263,15 @@ class PFile(medimg.MedImgReader):
             raise PFileError('_min_parse() expects a .7 or .7.gz')
         log.debug('_min_parse of %s' % filepath)
 
-        fileobj = gzip.open(filepath, 'rb') if is_gzip(self.filepath) else open(filepath, 'rb')
-
-        fileobj.seek(16); self.scan_date = str(struct.unpack("10s", fileobj.read(struct.calcsize("10s")))[0])
-        fileobj.seek(26); self.scan_time = str(struct.unpack("8s", fileobj.read(struct.calcsize("8s")))[0])
-        fileobj.seek(64); self.num_timepoints = struct.unpack("h", fileobj.read(struct.calcsize("h")))[0]
-        fileobj.seek(70); self.num_echos = struct.unpack("h", fileobj.read(struct.calcsize("h")))[0]
-        fileobj.seek(216); self.rec_user0 = struct.unpack("f", fileobj.read(struct.calcsize("f")))[0]
-        fileobj.seek(240); self.rec_user6 = struct.unpack("f", fileobj.read(struct.calcsize("f")))[0]
-        fileobj.seek(244); self.rec_user7 = struct.unpack("f", fileobj.read(struct.calcsize("f")))[0]
-        fileobj.seek(914); self.ileaves = struct.unpack("h", fileobj.read(struct.calcsize("h")))[0]
-        if self.version in [24, 23, 22]:
-            fileobj.seek(143516); self.exam_no = str(struct.unpack("H", fileobj.read(struct.calcsize("H")))[0])
-            fileobj.seek(145622); self.series_no = struct.unpack("h", fileobj.read(struct.calcsize("h")))[0]
-            fileobj.seek(145762); self.series_desc = (struct.unpack("65s", fileobj.read(struct.calcsize("65s")))[0]).split('\0', 1)[0]
-            fileobj.seek(145875); self.series_uid = unpack_uid(struct.unpack("32s", fileobj.read(struct.calcsize("32s")))[0])
-            fileobj.seek(148388); self.im_datetime = struct.unpack("i", fileobj.read(struct.calcsize("i")))[0]
-            fileobj.seek(148396); self.tr = struct.unpack("i", fileobj.read(struct.calcsize("i")))[0] / 1e6
-            fileobj.seek(148834); self.acq_no = struct.unpack("h", fileobj.read(struct.calcsize("h")))[0]
-            fileobj.seek(148972); self.psd_name = os.path.basename(struct.unpack("33s", fileobj.read(struct.calcsize("33s")))[0]).split('\0', 1)[0].lower()
-        if self.version in [24, 23]:
-            fileobj.seek(144248); self.exam_uid = unpack_uid(struct.unpack("32s", fileobj.read(struct.calcsize("32s")))[0])
-            fileobj.seek(144409); self.patient_id = (struct.unpack("65s", fileobj.read(struct.calcsize("65s")))[0]).split('\0', 1)[0]
-        if self.version == 22:
-            fileobj.seek(144240); self.exam_uid = unpack_uid(struct.unpack("32s", fileobj.read(struct.calcsize("32s")))[0])
-            fileobj.seek(144401); self.patient_id = (struct.unpack("65s", fileobj.read(struct.calcsize("65s")))[0]).split('\0', 1)[0]
-        if self.version == 12:
-            fileobj.seek(61576); self.exam_no = str(struct.unpack("H", fileobj.read(struct.calcsize("H")))[0])
-            fileobj.seek(61966); self.exam_uid = unpack_uid(struct.unpack("32s", fileobj.read(struct.calcsize("32s")))[0])
-            fileobj.seek(62127); self.patient_id = (struct.unpack("65s", fileobj.read(struct.calcsize("65s")))[0]).split('\0', 1)[0]
-            fileobj.seek(62710); self.series_no = struct.unpack("h", fileobj.read(struct.calcsize("h")))[0]
-            fileobj.seek(62786); self.series_desc = (struct.unpack("65s", fileobj.read(struct.calcsize("65s")))[0]).split('\0', 1)[0]
-            fileobj.seek(62899); self.series_uid = unpack_uid(struct.unpack("32s", fileobj.read(struct.calcsize("32s")))[0])
-            fileobj.seek(65016); self.im_datetime = struct.unpack("i", fileobj.read(struct.calcsize("i")))[0]
-            fileobj.seek(65024); self.tr = struct.unpack("i", fileobj.read(struct.calcsize("i")))[0] / 1e6
-            fileobj.seek(65328); self.acq_no = struct.unpack("h", fileobj.read(struct.calcsize("h")))[0]
-            fileobj.seek(65374); self.psd_name = os.path.basename(struct.unpack("33s", flleobj.read(struct.calcsize("33s")))[0]).split('\0', 1)[0].lower()
+        layout = MIN_PARSE_LAYOUTS.get(self.version)
+        if layout is None:
+            raise PFileError('_min_parse() does not support v%s' % self.version)
+        with spans.span('header decode', version=self.version) as stats:
+            with self._open_header(filepath) as header:
+                buf = header.head(layout.size)
+            for name, value in layout.unpack(buf).iteritems():
+                setattr(self, name, value)
+            stats.bytes = len(buf)
 
         if self.im_datetime > 0:
             self.timestamp = datetime.datetime.utcfromtimestamp(self.im_datetime)
@@ -394,17 +1309,14 @@ class PFile(medimg.MedImgReader):
         """
         filepath = filepath or self.filepath
         if zipfile.is_zipfile(filepath):
-            log.warning('unpacking zip to full_parse. this may take several minutes.')
-            with tempfile.TemporaryDirectory() as tempdir_path:
-                with zipfile.ZipFile(filepath) as archive:
-                    archive.extractall(path=tempdir_path)
-                subdir = os.listdir(tempdir_path)[0]
-                fpath = glob.glob(os.path.join(tempdir_path, subdir, 'P?????.7*'))[0]
-                self.version = get_version(fpath)
-                self._full_parse(fpath)
-                return
-
-        log.debug('_full_parse of %s' % filepath)
+            with zipfile.ZipFile(filepath) as archive:
+                member = find_pfile_member(archive)
+            log.debug('_full_parse of %s, streamed from %s' % (member, filepath))
+            header = self._open_header(filepath, member)    # read from the zip stream, no extraction
+            self.version = get_version(header)
+        else:
+            log.debug('_full_parse of %s' % filepath)
+            header = self._open_header(filepath)
         try:
             pfile = getattr(__import__('gepfile.pfile%d' % self.version, globals()), 'pfile%d' % self.version)
         except ImportError:
@@ -416,7 +1328,8 @@ class PFile(medimg.MedImgReader):
                 """)
             raise ImportError('no pfile parser for v%d' % self.version)
 
-        with gzip.open(filepath, 'rb') if is_gzip(filepath) else open(filepath, 'rb') as fileobj:
+        with header as fileobj:     # shares bytes already read by get_version
+            fileobj.seek(0)
             self._hdr = pfile.POOL_HEADER(fileobj)
             if not self._hdr:
                 raise PFileError('no pfile was read', log_level=logging.WARNING)
@@ -698,21 +1611,22 @@ class PFile(medimg.MedImgReader):
                 bvecs = np.hstack((np.zeros((3, num_nondwi), dtype=float), bvecs.reshape(self.dwi_numdirs, 3).T))
                 self.bvecs, self.bvals = dcm.mr.mr.adjust_bvecs(bvecs, bvals, self.scanner_type, self.image_rotation)
 
+    @property
+    def recon_backend(self):
+        """Property that returns the ReconBackend registered for the psd_type, or None."""
+        return RECON_BACKENDS.get(self.psd_type)
+
+    @property
+    def recon_resources(self):
+        """Property that returns the cores and memory_mb that the recon needs, or None."""
+        backend = self.recon_backend
+        return {'cores': backend.cores, 'memory_mb': backend.memory_mb} if backend else None
+
     @property
     def recon_func(self):
-        """Property that returns a member function that can then be executed."""
-        if self.psd_type == 'spiral':
-            return self.recon_spirec
-        elif self.psd_type == 'muxepi':
-            return self.recon_muxepi
-        elif self.psd_type == 'mrs':
-            return self.recon_mrs
-        elif self.psd_type == 'hoshim':
-            return self.recon_hoshim
-        elif self.psd_type == 'basic':
-            return self.recon_basic
-        else:
-            return None
+        """Property that returns the recon backend's function, bound to this pfile, that can then be executed."""
+        backend = self.recon_backend
+        return functools.partial(backend.func, self) if backend else None
 
     def do_recon(self, filepath=None, tempdir=None):
         """
@@ -776,47 +1690,44 @@ class PFile(medimg.MedImgReader):
 
         if zipfile.is_zipfile(self.filepath):
             log.debug('loading data from zip %s' % self.filepath)
+            if not self.full_parsed:
+                try:
+                    self._full_parse()      # header is streamed from the zip
+                finally:
+                    self._release_header()
             with tempfile.TemporaryDirectory(dir=self.tempdir) as temp_dirpath:
                 log.debug('now working in temp_dirpath=%s' % temp_dirpath)
                 with zipfile.ZipFile(self.filepath) as archive:
-                    archive.extractall(path=temp_dirpath)
-
-                temp_datadir = os.path.join(temp_dirpath, os.listdir(temp_dirpath)[0])    # zip always has subdir that contains data
-                for f in os.listdir(temp_datadir):
-                    fpath = os.path.join(temp_datadir, f)
-                    try:
-                        self.version = get_version(fpath)
-                    except Exception:
-                        pass
-                    else:
-                        self._full_parse(fpath)  # provide input to parse
-                        break
+                    pfile_member = find_pfile_member(archive)
+                    for member in self.recon_members(archive.namelist(), pfile_member):  # only what the recon reads
+                        log.debug('extracting %s' % member)
+                        archive.extract(member, path=temp_dirpath)
+                fpath = os.path.join(temp_dirpath, pfile_member)
                 self.do_recon(fpath, self.tempdir)
 
             log.debug('closing tempdir %s' % self.tempdir)
         else:
             if not self.full_parsed:
-                self._full_parse()      # parse original input
+                try:
+                    self._full_parse()      # parse original input
+                finally:
+                    self._release_header()
 
             # muxepi recon REQUIRES both the primary and aux data to be uncompressed
             if is_gzip(self.filepath) and self.psd_type == 'muxepi':
                 log.debug('loading data from .7.gz %s' % self.filepath)
                 with tempfile.TemporaryDirectory(dir=self.tempdir) as temp_dirpath:
                     log.debug('now working in temp_dirpath=%s ' % temp_dirpath)
-                    aux_datadir = os.path.dirname(self.filepath)
-                    for f in os.listdir(aux_datadir):
-                        fname = os.path.join(aux_datadir, f)
+                    for fname in related_files(self.filepath):     # skip files that belong to other pfiles
                         if is_gzip(fname):
                             log.debug('uncompressing %s' % fname)
                             newpath = uncompress(fname, temp_dirpath)
-                            if f.startswith('P'):
-                                fpath = newpath
                         else:
-                            newpath = os.path.join(temp_dirpath, f)
+                            newpath = os.path.join(temp_dirpath, os.path.basename(fname))
                             log.debug('creating symlink %s' % newpath)
                             os.symlink(fname, newpath)
-                            if f.startswith('P'):
-                                fpath = newpath
+                        if fname == self.filepath:
+                            fpath = newpath
                     self.do_recon(fpath, self.tempdir)
             else:
                 log.debug('loading data from .7 %s' % self.filepath)
@@ -838,8 +1749,7 @@ class PFile(medimg.MedImgReader):
 
         """
         # TODO confirm that the voxel reordering is necessary
-        import scipy.io
-        mat = scipy.io.loadmat(filepath)
+        mat = read_mat_vars(filepath, ['d', 'd_size', 'sl_loc', 'MIP_res'])
         if 'd' in mat:
             sz = mat['d_size'].flatten().astype(int)
             slice_locs = mat['sl_loc'].flatten().astype(int) - 1
@@ -848,7 +1758,8 @@ class PFile(medimg.MedImgReader):
             if len(slice_locs)<raw.shape[2]:
                 slice_locs = range(raw.shape[2])
                 log.warning('Slice_locs is too short. Assuming slice_locs=[0,1,...,nslices]')
-            imagedata[:,:,slice_locs,...] = raw[::-1,...]
+            for i, loc in enumerate(slice_locs[:raw.shape[2]]):
+                imagedata[:,:,loc,...] = raw[::-1,:,i,...]
         elif 'MIP_res' in mat:
             imagedata = np.atleast_3d(mat['MIP_res'])
             imagedata = imagedata.transpose((1,0,2,3))[::-1,::-1,:,:]
@@ -856,6 +1767,70 @@ class PFile(medimg.MedImgReader):
             imagedata = imagedata.reshape(imagedata.shape + (1,))
         return imagedata
 
+    def merge_imagedata_from_file(self, filepath, imagedata=None):
+        """
+        Add the slices in a single slice recon file into a float32 image volume.
+
+        Only the slice locations held in the file are written, so merging a slice does not
+        cost a full volume allocation.  The volume is allocated from the file's d_size when
+        imagedata is None, and grown along the time axis if the file holds more timepoints.
+        A file that holds a MIP_res volume, rather than slices, is added whole, as
+        load_imagedata_from_file reads it.
+
+        Parameters
+        ----------
+        filepath : str
+            path to *.mat, such as sl_001.mat
+        imagedata : np.array [default None]
+            4D float32 volume to merge into
+
+        Returns
+        -------
+        imagedata : np.array
+            4D float32 volume, x, y, z, time.  may be a new array.
+        num_timepoints : int
+            number of timepoints in the file
+
+        Raises
+        ------
+        PFileError : Exception
+            the file holds neither d nor MIP_res.
+
+        """
+        mat = read_mat_vars(filepath, ['d', 'd_size', 'sl_loc', 'MIP_res'])
+        if 'd' in mat:
+            sz = mat['d_size'].flatten().astype(int)
+            slice_locs = mat['sl_loc'].flatten().astype(int) - 1
+            raw = np.atleast_3d(mat['d'])
+            if raw.ndim == 3:
+                raw = raw.reshape(raw.shape + (1,))
+            if len(slice_locs)<raw.shape[2]:
+                slice_locs = range(raw.shape[2])
+                log.warning('Slice_locs is too short. Assuming slice_locs=[0,1,...,nslices]')
+            t = sz[3] if len(sz) > 3 else 1
+        elif 'MIP_res' in mat:
+            raw = np.atleast_3d(mat['MIP_res'])
+            if raw.ndim == 3:
+                raw = raw.reshape(raw.shape + (1,))
+            raw = raw.transpose((1,0,2,3))[::-1,::-1,:,:]
+            sz = raw.shape
+            t = sz[3]
+        else:
+            raise PFileError('%s holds neither d nor MIP_res' % filepath)
+        if imagedata is None:
+            imagedata = np.zeros(tuple(sz[:3]) + (t,), np.float32)
+        elif imagedata.shape[-1] < t:
+            grown = np.zeros(imagedata.shape[:-1] + (t,), np.float32)
+            grown[...,:imagedata.shape[-1]] = imagedata
+            imagedata = grown
+        if 'd' in mat:
+            # one slice at a time, so the flipped slices are added in place without temporaries
+            for i, loc in enumerate(slice_locs[:raw.shape[2]]):
+                imagedata[:,:,loc,:t] += raw[::-1,:,i,:t]
+        else:
+            imagedata[...,:t] += raw
+        return imagedata, t
+
     def update_imagedata(self, imagedata, key=''):
         """
         Insert imagedata into self.data dictionary under the specified key.
@@ -915,10 +1890,7 @@ class PFile(medimg.MedImgReader):
         with tempfile.TemporaryDirectory(dir=tempdir) as temp_dirpath:
             log.debug('working in tempdir: %s' % temp_dirpath)
             if is_gzip(filepath):
-                pfile_path = os.path.join(temp_dirpath, self.basename)
-                with open(pfile_path, 'wb') as fd:
-                    with gzip.open(self.filepath, 'rb') as gzfile:
-                        fd.writelines(gzfile)
+                pfile_path = uncompress(filepath, temp_dirpath)
             else:
                 pfile_path = filepath
             recon_path = os.path.abspath(os.path.join(os.path.dirname(__file__), 'spiral_recon'))
@@ -928,7 +1900,10 @@ class PFile(medimg.MedImgReader):
             log.debug(cmd)
             subprocess.call(shlex.split(cmd), cwd=temp_dirpath, stdout=open('/dev/null', 'w'))  # run spirec to generate .mag and fieldmap files
             log.debug(os.listdir(temp_dirpath))
-            self.data = {'': np.fromfile(file=basepath+'.mag_float', dtype=np.float32).reshape([self.size[0],self.size[1],self.num_timepoints,self.num_echos,self.num_slices],order='F').transpose((0,1,4,2,3))}
+            # map the magnitudes, rather than reading them; x, y, slice, time, echo
+            mag = np.memmap(basepath+'.mag_float', dtype=np.float32, mode='r', order='F',
+                            shape=(self.size[0],self.size[1],self.num_timepoints,self.num_echos,self.num_slices)).transpose((0,1,4,2,3))
+            self.data = {}
             if os.path.exists(basepath+'.B0freq2') and os.path.getsize(basepath+'.B0freq2')>0:
                 self.data['fieldmap'] = np.fromfile(file=basepath+'.B0freq2', dtype=np.float32).reshape([self.size[0],self.size[1],self.num_echos,self.num_slices],order='F').transpose((0,1,3,2))
 
@@ -936,17 +1911,22 @@ class PFile(medimg.MedImgReader):
                 # FIXME: Do a more robust test for spiralio!
                 # FIXME: should do a quick motion correction here
                 # Assume spiralio, so do a weighted average of the two echos.
-                w_in = np.mean(self.data[''][:,:,:,:,0], 3)
-                w_out = np.mean(self.data[''][:,:,:,:,1], 3)
+                spiral_in, spiral_out = mag[...,0], mag[...,1]
+                w_in = np.mean(spiral_in, 3, dtype=np.float32)
+                w_out = np.mean(spiral_out, 3, dtype=np.float32)
                 # self.data['w_in'] = w_in    # uncomment to save spiral_in
                 # self.data['w_out'] = w_out  # uncomment to save spiral_out
-                inout_sum = w_in + w_out
-                w_in = w_in / inout_sum
-                w_out = w_out / inout_sum
-                avg = np.zeros(self.data[''].shape[0:4])
-                for tp in range(self.data[''].shape[3]):
-                    avg[:,:,:,tp] = w_in*self.data[''][:,:,:,tp,0] + w_out*self.data[''][:,:,:,tp,1]
+                w_in /= (w_in + w_out)
+                # w_in*in + w_out*out == out + w_in*(in - out), as the weights sum to 1; computed in
+                # place, so the only full size array is the result
+                avg = np.subtract(spiral_in, spiral_out)
+                avg *= w_in[...,np.newaxis]
+                avg += spiral_out
                 self.data[''] = avg
+                del spiral_in, spiral_out
+            else:
+                self.data[''] = np.array(mag)
+            del mag                                 # unmap before the tempdir is removed
 
     def prep_convert(self):
         """
@@ -961,10 +1941,75 @@ class PFile(medimg.MedImgReader):
         # some mux scans don't have their own calibration, and require fetching calibration a scan with the same psd_name.
         if self.psd_type=='muxepi' and (self.num_mux_cal_cycle<2 or (self.psd_name=='mux_epi2' and self.ti>0)):
             aux_data = { 'psd': self.psd_name }
+            cal_file = self.cached_calibration()
+            if cal_file:
+                aux_data['cal_file'] = cal_file     # calibration of aux_file already extracted
         else:
             aux_data = None
         return aux_data
 
+    def cached_calibration(self):
+        """
+        Return the cached cal_file of aux_file, or None.
+
+        The cache is looked up by the calibration_key of aux_file, so a cached calibration is only
+        used for the scan it was extracted from.  Without an aux_file or a cache, or if either
+        cannot be read, there is no cached calibration.
+
+        Returns
+        -------
+        cal_file : str or None
+            path that, suffixed with '_ref.dat' and '_vrgf.dat', names the cached calibration files.
+
+        """
+        if not (self.aux_file and self.cal_cache):
+            return None
+        try:
+            return self.cal_cache.get(calibration_key(self.aux_file))
+        except PFileError as e:
+            log.warning('cannot identify aux file %s; %s' % (self.aux_file, e))
+        except (IOError, OSError) as e:
+            log.warning('cannot use calibration cache %s; %s' % (self.cal_cache.dirpath, e))
+        return None
+
+    def find_calibration(self, dirpath):
+        """
+        Return the cal_file of the calibration scan for a muxepi without its own calibration.
+
+        The calibration files of aux_file are taken from self.cal_cache, or extracted into it.
+        Without a cache, or if the cache cannot be read or written, the files of aux_file are
+        extracted into dirpath.  Without an aux_file, there is no calibration; cached calibrations
+        are only used for the aux_file they were extracted from.
+
+        Parameters
+        ----------
+        dirpath : str
+            directory to extract calibration files into, if they are not cached
+
+        Returns
+        -------
+        cal_file : str or None
+            path that, suffixed with '_ref.dat' and '_vrgf.dat', names the calibration files.
+
+        """
+        if self.aux_file:
+            if self.cal_cache:
+                try:
+                    key = calibration_key(self.aux_file)
+                except PFileError as e:
+                    log.warning('cannot identify aux file %s, not caching its calibration; %s' % (self.aux_file, e))
+                else:
+                    try:
+                        cal_file = self.cal_cache.get(key)
+                        if cal_file:
+                            log.debug('using cached calibration of %s' % self.aux_file)
+                            return cal_file
+                        return self.cal_cache.add(key, self.aux_file)
+                    except (IOError, OSError) as e:
+                        log.warning('cannot use calibration cache %s; %s' % (self.cal_cache.dirpath, e))
+            return extract_calibration(self.aux_file, dirpath)
+        return None
+
     def recon_muxepi(self, filepath, tempdir=None, timepoints=[], octave_bin='octave'):
         """
         Do mux_epi image reconstruction and populate self.data.
@@ -1014,39 +2059,7 @@ class PFile(medimg.MedImgReader):
             # even scans without num_mux_cal_cycles will still have ref/vrgf files that exceed 64 bytes
             if self.num_mux_cal_cycle < 2:
                 log.debug('num_mux_cal_cycle: %d. looking for calibration from a different acq.' % self.num_mux_cal_cycle)
-                if self.aux_file:
-                    if zipfile.is_zipfile(self.aux_file):
-                        with zipfile.ZipFile(self.aux_file) as aux_archive:
-                            log.debug('inspecting aux file: %s' % self.aux_file)
-                            aux_archive.extractall(path=temp_dirpath)
-                        aux_subdir = os.listdir(temp_dirpath)[0]
-                        aux_datadir = os.path.join(temp_dirpath, aux_subdir)
-                        for f in os.listdir(aux_datadir):
-                            if f.endswith('_ref.dat'):
-                                cal_ref_file = os.path.join(aux_datadir, f)
-                                log.debug('_ref.dat found, %s' % cal_ref_file)
-                            elif f.endswith('_vrgf.dat'):
-                                cal_vrgf_file = os.path.join(aux_datadir, f)
-                                log.debug('_vrgf.dat found, %s' % cal_vrgf_file)
-                        if cal_ref_file and cal_vrgf_file:
-                            if cal_ref_file.rsplit('_', 1)[0] == cal_vrgf_file.rsplit('_', 1)[0]:
-                                cal_file = cal_ref_file.rsplit('_', 1)[0]
-                    elif is_gzip(self.aux_file):
-                        for f in os.listdir(os.path.dirname(self.aux_file)):
-                            fname = os.path.join(os.path.dirname(self.aux_file), f)
-                            if is_gzip(fname):
-                                log.debug('uncompressing %s' % fname)
-                                newpath = uncompress(fname, temp_dirpath)
-                            if fname.endswith('_ref.dat'):
-                                cal_ref_file = os.path.join(temp_dirpath, f)
-                                os.symlink(fname, cal_ref_file)
-                                log.debug('_ref.dat found, %s' % cal_ref_file)
-                            elif fname.endswith('_vrgf.dat'):
-                                cal_vrgf_file = os.path.join(temp_dirpath, f)
-                                os.symlink(fname, cal_vrgf_file)
-                                log.debug('_vrgf.dat found, %s' % cal_vrgf_file)
-                        if cal_ref_file and cal_vrgf_file:
-                            cal_file = newpath
+                cal_file = self.find_calibration(temp_dirpath) or ''
                 if cal_file != '':
                     log.info('ref/vrgf.dat not found-- using calibration ref/vrgf from %s' % cal_file)
                 else:
@@ -1060,34 +2073,26 @@ class PFile(medimg.MedImgReader):
             recon_path = os.path.abspath(os.path.join(os.path.dirname(__file__), 'mux_epi_recon'))
             outname = os.path.join(temp_dirpath, 'sl')
 
+            # Recon each slice separately. Note the slice_num+1 to deal with matlab's 1-indexing.
+            # Use 'str' on timepoints so that an empty array will produce '[]'
             mux_recon_jobs = []
-            slice_num = 0
-            while slice_num < self.num_slices:
-                num_running_jobs = sum([job.poll()==None for job in mux_recon_jobs])
-                if num_running_jobs < self.num_jobs:
-                    # Recon each slice separately. Note the slice_num+1 to deal with matlab's 1-indexing.
-                    # Use 'str' on timepoints so that an empty array will produce '[]'
-                    cmd = ('%s --no-window-system -p %s --eval \'mux_epi_main("%s", "%s_%03d.mat", "%s", %d, %s, %d, 0, "%s", %s, %s, %s);\''
-                        % (octave_bin, recon_path, filepath, outname, slice_num, cal_file, slice_num + 1, str(timepoints), self.num_vcoils, recon_type, str(fermi_filt), str(homodyne), str(self.notch_thresh)))
-                    log.debug(cmd)
-                    mux_recon_jobs.append(subprocess.Popen(args=shlex.split(cmd), stdout=open('/dev/null', 'w')))
-                    slice_num += 1
-                else:
-                    time.sleep(1.)
+            for slice_num in range(self.num_slices):
+                cmd = ('%s --no-window-system -p %s --eval \'mux_epi_main("%s", "%s_%03d.mat", "%s", %d, %s, %d, 0, "%s", %s, %s, %s);\''
+                    % (octave_bin, recon_path, filepath, outname, slice_num, cal_file, slice_num + 1, str(timepoints), self.num_vcoils, recon_type, str(fermi_filt), str(homodyne), str(self.notch_thresh)))
+                mux_recon_jobs.append(('slice %d' % slice_num, shlex.split(cmd)))
+
+            # Merge each slice into the image as soon as its job finishes, while the rest run.
+            # The output has as many timepoints as slice 0; this allows for a partial last
+            # timepoint, which sometimes happens when the user aborts.
+            merged = {'img': None}
+            def merge_slice(key):
+                slice_num = int(key.split()[-1])
+                merged['img'], t = self.merge_imagedata_from_file("%s_%03d.mat" % (outname, slice_num), merged['img'])
+                if slice_num == 0:
+                    merged['num_timepoints'] = t
+            run_jobs(mux_recon_jobs, self.num_jobs, merge_slice)
+            img = merged['img'][...,:merged['num_timepoints']]
 
-            # Now wait for all the jobs to finish
-            for job in mux_recon_jobs:
-                job.wait()
-
-            # Load the first slice to initialize the image array
-            img = self.load_imagedata_from_file("%s_%03d.mat" % (outname, 0))
-            for slice_num in range(1, self.num_slices):
-                new_img = self.load_imagedata_from_file("%s_%03d.mat" % (outname, slice_num))
-                # Allow for a partial last timepoint. This sometimes happens when the user aborts.
-                t = min(img.shape[-1], new_img.shape[-1])
-                img[...,0:t] += new_img[...,0:t]
-
-            img = img.astype(np.float32)
             self.update_imagedata(img)
             elapsed = time.time() - start_sec
             log.info('Mux recon of %s with %d v-coils finished in %0.2f minutes using %d jobs.'
@@ -1098,45 +2103,95 @@ class PFile(medimg.MedImgReader):
         Load raw spectro data.
 
         Currently just loads raw spectro data into self.data dictionary, to
-        prepare for writing to nifti.
+        prepare for writing to nifti.  The data is written directly in its final
+        axis order, one echo at a time, as complex64.  Subsets of frames and coils
+        are loaded if mrs_frames and mrs_coils are set, and if mrs_stream is set
+        the data is held in a file in tempdir, instead of in memory.
 
         Parameters
         ----------
         filepath : str
             path to input file, can be .7, .7.gz.  cannot be 7.zip.
+        tempdir : str
+            path to base of temporary directory, used if mrs_stream is set
 
         Returns
         -------
         None : NoneType
-            loads spectro data into self.data['']
+            loads spectro data into self.data[''], as frame_size, passes, slices, frames, echos, coils
 
         """
         log.debug('MRS recon started')
-        self.data = {'': self.get_rawdata(filepath).transpose([0,5,3,1,2,4])}
+        slices, passes, coils, echos, frames = self._rawdata_selection(coils=self.mrs_coils, frames=self.mrs_frames)
+        shape = (self._hdr.rec.frame_size, len(passes), len(slices), len(frames), len(echos), len(coils))
+        if self.mrs_stream:
+            data = stream_array(shape, np.complex64, tempdir)   # file is removed when the data is released
+        else:
+            data = np.empty(shape, dtype=np.complex64)
+        for pi, ci, si, ei, echo in self.iter_rawdata(filepath, slices, passes, coils, echos, frames, np.complex64):
+            data[:, pi, si, :, ei, ci] = echo
+        self.data = {'': data}
 
-    def get_rawdata(self, filepath, slices=None, passes=None, coils=None, echos=None, frames=None):
+    def _rawdata_selection(self, slices=None, passes=None, coils=None, echos=None, frames=None):
         """
-        Read and return a chunck of data from the p-file.
+        Return the slices, passes, coils, echos and frames to read, where None means all of them.
 
-        Specify the slices, timepoints, coils, and echos that you want.
-        None means you get all of them. The default of all Nones will
-        return all data.
-        (based on https://github.com/cni/MRS/blob/master/MRS/files.py)
+        Raises PFileError if a selection is empty, or has an index that is not in the data.
+
+        """
+        n_slices = self._hdr.rec.nslices / self._hdr.rec.npasses
+        n_frames = self._hdr.rec.nframes + self._hdr.rec.hnover
+        selection = []
+        for name, indices, count in [('slices', slices, n_slices), ('passes', passes, self._hdr.rec.npasses),
+                                     ('coils', coils, self.num_receivers), ('echos', echos, self._hdr.rec.nechoes),
+                                     ('frames', frames, n_frames)]:
+            if indices is None:
+                indices = range(count)
+            elif len(indices) == 0:
+                raise PFileError('no %s selected' % name)
+            elif not all([0 <= i < count for i in indices]):
+                raise PFileError('%s %s out of range; the data has %d' % (name, list(indices), count))
+            selection.append(indices)
+        return tuple(selection)
+
+    def iter_rawdata(self, filepath, slices=None, passes=None, coils=None, echos=None, frames=None, dtype=np.complex128):
+        """
+        Read the p-file data one echo at a time.
+
+        Specify the slices, timepoints, coils, echos and frames that you want.
+        None means you get all of them.  The selected frames of each echo are
+        read with a single read, and yielded without holding the rest of the data.
+
+        Parameters
+        ----------
+        filepath : str
+            path to input file, can be .7, .7.gz.  cannot be 7.zip.
+        slices, passes, coils, echos, frames : list [default None]
+            indices of the data to read
+        dtype : np.dtype [default np.complex128]
+            complex type of the yielded echos.  np.complex64 halves their memory, and is exact for
+            16 bit samples.
+
+        Yields
+        ------
+        pi, ci, si, ei : int
+            positions of the echo in passes, coils, slices and echos
+        echo : np.array
+            frames of the echo, as frame_size, frames
+
+        Raises
+        ------
+        PFileError
+            if a selection is empty, or has an index that is not in the data.
 
         """
+        slices, passes, coils, echos, frames = self._rawdata_selection(slices, passes, coils, echos, frames)
         n_frames = self._hdr.rec.nframes + self._hdr.rec.hnover
         n_echos = self._hdr.rec.nechoes
         n_slices = self._hdr.rec.nslices / self._hdr.rec.npasses
         n_coils = self.num_receivers
-        n_passes = self._hdr.rec.npasses
         frame_sz = self._hdr.rec.frame_size
 
-        if passes == None: passes = range(n_passes)
-        if coils == None: coils = range(n_coils)
-        if slices == None: slices = range(n_slices)
-        if echos == None: echos = range(n_echos)
-        if frames == None: frames = range(n_frames)
-
         # Size (in bytes) of each sample:
         ptsize = self._hdr.rec.point_size
         data_type = [np.int16, np.int32][ptsize/2 - 1]
@@ -1149,21 +2204,47 @@ class PFile(medimg.MedImgReader):
         coilsz = slicesz * n_slices
         passsz = coilsz * n_coils
 
+        # read the span of the selected frames; the first frame of each echo is a baseline
+        first, last = min(frames), max(frames)
+        selection = np.asarray(frames) - first
+        span_bytes = (last - first + 1) * frame_bytes
+
         # Byte-offset to get to the data:
-        offset = self._hdr.rec.off_data
-        fp = gzip.open(filepath, 'rb') if is_gzip(filepath) else open(filepath, 'rb')
-        data = np.zeros((frame_sz, len(frames), len(echos), len(slices), len(coils), len(passes)), dtype=np.complex)
-        for pi,passidx in enumerate(passes):
-            for ci,coilidx in enumerate(coils):
-                for si,sliceidx in enumerate(slices):
-                    for ei,echoidx in enumerate(echos):
-                        for fi,frameidx in enumerate(frames):
-                            fp.seek(passidx*passsz + coilidx*coilsz + sliceidx*slicesz + echoidx*echosz + (frameidx+1)*frame_bytes + offset)
-                            # Unfortunately, numpy fromfile doesn't like gzip file objects. But we can
-                            # safely load each chunk into RAM, since frame_sz is never very big.
-                            #dr = np.fromfile(fp, data_type, frame_sz * 2)
-                            dr = np.fromstring(fp.read(frame_bytes), data_type)
-                            dr = np.reshape(dr, (-1, 2)).T
-                            data[:, fi, ei, si, ci, pi] = dr[0] + dr[1]*1j
-        fp.close()
+        offset = self._hdr.rec.off_data + (first + 1) * frame_bytes
+        with gzip.open(filepath, 'rb') if is_gzip(filepath) else open(filepath, 'rb') as fp:
+            for pi,passidx in enumerate(passes):
+                for ci,coilidx in enumerate(coils):
+                    for si,sliceidx in enumerate(slices):
+                        for ei,echoidx in enumerate(echos):
+                            fp.seek(passidx*passsz + coilidx*coilsz + sliceidx*slicesz + echoidx*echosz + offset)
+                            raw = np.frombuffer(fp.read(span_bytes), data_type).reshape(-1, frame_sz, 2)[selection]
+                            echo = np.empty((frame_sz, len(frames)), dtype=dtype)
+                            echo.real = raw[..., 0].T
+                            echo.imag = raw[..., 1].T
+                            yield pi, ci, si, ei, echo
+
+    def get_rawdata(self, filepath, slices=None, passes=None, coils=None, echos=None, frames=None, dtype=np.complex128):
+        """
+        Read and return a chunck of data from the p-file.
+
+        Specify the slices, timepoints, coils, and echos that you want.
+        None means you get all of them. The default of all Nones will
+        return all data, as frame_size, frames, echos, slices, coils, passes.
+        (based on https://github.com/cni/MRS/blob/master/MRS/files.py)
+
+        Parameters
+        ----------
+        filepath : str
+            path to input file, can be .7, .7.gz.  cannot be 7.zip.
+        slices, passes, coils, echos, frames : list [default None]
+            indices of the data to read
+        dtype : np.dtype [default np.complex128]
+            complex type of the returned data.  np.complex64 halves its memory, and is exact for
+            16 bit samples.
+
+        """
+        slices, passes, coils, echos, frames = self._rawdata_selection(slices, passes, coils, echos, frames)
+        data = np.zeros((self._hdr.rec.frame_size, len(frames), len(echos), len(slices), len(coils), len(passes)), dtype=dtype)
+        for pi, ci, si, ei, echo in self.iter_rawdata(filepath, slices, passes, coils, echos, frames, dtype):
+            data[:, :, ei, si, ci, pi] = echo
         return data
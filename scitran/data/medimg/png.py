@@ -16,6 +16,7 @@ from PIL import Image
 import numpy as np
 
 import medimg
+from .. import spans
 
 log = logging.getLogger(__name__)
 
@@ -71,14 +72,17 @@ class PNG(medimg.MedImgWriter):
             data = [image.squeeze() for image in data]  # squeeze; remove axis with 1 val
             for i, data in enumerate(data):
                 filepath = outname + '_%d' % (i + 1) + '.png'
-                if data.ndim == 2:
-                    data = data.astype(np.int32)
-                    data = data.clip(0, (data * (data != (2**15 - 1))).max())  # -32768->0; 32767->brain.max
-                    data = data * (2**8 - 1) / data.max()  # scale to full 8-bit range
-                    Image.fromarray(data.astype(np.uint8), 'L').save(filepath, optimize=True)
-                elif data.ndim == 3:
-                    data = data.reshape((data.shape[1], data.shape[2], data.shape[0]))
-                    Image.fromarray(data, 'RGB').save(filepath, optimize=True)
+                with spans.span('encode', filename=os.path.basename(filepath)) as stats:
+                    if data.ndim == 2:
+                        data = data.astype(np.int32)
+                        data = data.clip(0, (data * (data != (2**15 - 1))).max())  # -32768->0; 32767->brain.max
+                        data = data * (2**8 - 1) / data.max()  # scale to full 8-bit range
+                        Image.fromarray(data.astype(np.uint8), 'L').save(filepath, optimize=True)
+                    elif data.ndim == 3:
+                        data = data.reshape((data.shape[1], data.shape[2], data.shape[0]))
+                        Image.fromarray(data, 'RGB').save(filepath, optimize=True)
+                    if os.path.isfile(filepath):
+                        stats.bytes = os.path.getsize(filepath)
                 log.debug('generated %s' % os.path.basename(filepath))
                 results.append(filepath)
             log.debug('returning:  %s' % filepath)
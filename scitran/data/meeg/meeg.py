@@ -15,8 +15,6 @@ from os import path as op
 from datetime import datetime, date
 import shutil
 
-from mne.io import read_raw_fif
-
 from .. import data
 
 log = logging.getLogger(__name__)  # root logger already configured
@@ -93,6 +91,11 @@ class MEEGReader(data.Reader):
     filetype = u'meeg'
     state = ['orig']
 
+    @classmethod
+    def preload(cls):
+        """Import mne.io, which is otherwise imported by the first parse."""
+        import mne.io
+
     def __init__(self, path, load_data=False, timezone=None):
         super(MEEGReader, self).__init__(path, load_data, timezone)
 
@@ -112,6 +115,7 @@ class MEEGReader(data.Reader):
             raise MEEGError(e)
 
         # load information and optionally data from the files
+        from mne.io import read_raw_fif     # slow to import; module_by_type only needs the schema
         with warnings.catch_warnings(record=True):
             self._raws = [read_raw_fif(fname, allow_maxshield=True,
                                        preload=load_data)
@@ -156,7 +160,10 @@ class MEEGReader(data.Reader):
     def load_data(self):
         super(MEEGReader, self).load_data()
         for raw in self._raws:
-            raw.preload_data()
+            if hasattr(raw, 'load_data'):   # mne 0.10 renamed preload_data to load_data
+                raw.load_data()
+            else:
+                raw.preload_data()
 
     @property
     def nims_group_id(self):
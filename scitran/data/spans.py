@@ -0,0 +1,171 @@
+"""
+scitran.data.spans
+==================
+
+Named spans around the stages of parse, load_data and write, such as zip open, header decode,
+parse_one, member decode, parse_all, convert, reorient, compress and encode.
+
+Each span records its wall time, the CPU time of the process, the bytes it read or wrote, and how
+far it raised the peak RSS of the process, and is handed to every registered sink.  A sink is any
+callable that takes a Span; LoggingSink and JsonSink are provided.  With no sinks registered, a
+span only creates its SpanStats.
+
+Sinks can be registered with add_sink, or at import with the SCITRAN_SPANS environment variable,
+set to 'log' for a LoggingSink, or to the path of a json lines file for a JsonSink.
+
+Examples
+--------
+    from scitran.data import spans
+    spans.add_sink(lambda s: totals.setdefault(s.name, []).append(s.wall))
+
+    with spans.span('member decode', filename=filename) as stats:
+        content = zip_content.read()
+        stats.bytes += len(content)
+
+"""
+
+import os
+import json
+import time
+import logging
+import resource
+import threading
+import contextlib
+import collections
+
+log = logging.getLogger(__name__)
+
+SPANS = os.environ.get('SCITRAN_SPANS', '')  # 'log', or path of a json lines file
+
+# name, name of the enclosing span or None, wall and cpu seconds, bytes read or written,
+# growth of the peak rss in KB, and the keyword arguments given to span
+Span = collections.namedtuple('Span', ['name', 'parent', 'wall', 'cpu', 'bytes', 'peak_rss_kb', 'attrs'])
+
+_sinks = []
+_local = threading.local()
+
+
+class SpanStats(object):
+
+    """What the code inside a span reports about its work: bytes read or written, and attrs."""
+
+    __slots__ = ('bytes', 'attrs')
+
+    def __init__(self, attrs):
+        self.bytes = 0
+        self.attrs = attrs
+
+
+class LoggingSink(object):
+
+    """
+    Log each span as one line.
+
+    Parameters
+    ----------
+    logger : logging.Logger [default scitran.data.spans]
+        logger to log to.
+    level : int [default logging.INFO]
+        level to log at.
+
+    """
+
+    def __init__(self, logger=log, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, span):
+        self.logger.log(self.level, '%-14s %9.1f ms wall %9.1f ms cpu %10d bytes %+8d KB peak rss %s' % (
+                        span.name, span.wall * 1000, span.cpu * 1000, span.bytes, span.peak_rss_kb,
+                        ' '.join(['%s=%s' % item for item in sorted(span.attrs.iteritems())])))
+
+
+class JsonSink(object):
+
+    """
+    Append each span to a json lines file, as an object of the Span fields.
+
+    Parameters
+    ----------
+    path : str
+        path of the json lines file; created if it does not exist.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, span):
+        line = json.dumps(dict(span._asdict(), timestamp=time.time()), default=str) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as fp:
+                fp.write(line)
+
+
+def add_sink(sink):
+    """Register sink, a callable that takes a Span, and return it."""
+    _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    """Unregister sink."""
+    _sinks.remove(sink)
+
+
+def _usage():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """
+    Measure the enclosed block as the span name, and hand the Span to each sink.
+
+    A span that raises is still recorded, with the exception's class name as attrs['error'].
+
+    Parameters
+    ----------
+    name : str
+        name of the stage, such as 'header decode'.
+    attrs : dict
+        keyword arguments recorded with the span, such as the filename.
+
+    Yields
+    ------
+    stats : SpanStats
+        add the bytes read or written to stats.bytes, and any results to stats.attrs.
+
+    """
+    stats = SpanStats(attrs)
+    if not _sinks:
+        yield stats
+        return
+    stack = _local.__dict__.setdefault('stack', [])
+    parent = stack[-1] if stack else None
+    stack.append(name)
+    cpu_start, peak_start = _usage()
+    start = time.time()
+    try:
+        yield stats
+    except Exception as e:
+        stats.attrs['error'] = type(e).__name__
+        raise
+    finally:
+        wall = time.time() - start
+        cpu_end, peak_end = _usage()
+        stack.pop()
+        record = Span(name, parent, wall, cpu_end - cpu_start, stats.bytes, peak_end - peak_start, stats.attrs)
+        for sink in list(_sinks):
+            try:
+                sink(record)
+            except Exception as e:
+                log.warning('span sink %r failed: %s' % (sink, e))
+
+
+if SPANS == 'log':
+    add_sink(LoggingSink())
+elif SPANS:
+    add_sink(JsonSink(SPANS))
@@ -0,0 +1,240 @@
+"""
+Synthetic inputs for the tests, built offline.
+
+    - dicom: zips of GE MR dicoms, and GE MR series with the geometry and pixel data that dcmstack
+      stacks, as multicoil and fastcard series
+    - records: ReaderRecords with realistic values
+    - bvecs: dwi gradient tables, and the per-bvec loops that mr.adjust_bvecs replaced
+    - meeg: zips of a fif recording of eeg channels
+
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import warnings
+import zipfile
+import datetime
+import cStringIO
+import numpy as np
+
+import scitran.data as scidata
+
+MR_IMAGE_STORAGE = '1.2.840.10008.5.1.4.1.1.4'
+EXPLICIT_VR_LITTLE_ENDIAN = '1.2.840.10008.1.2.1'
+
+
+def dicom_dataset(series, instance):
+    """Return a FileDataset of a GE MR image, with only the study and series identifiers set."""
+    from dicom.dataset import Dataset, FileDataset
+    meta = Dataset()
+    meta.MediaStorageSOPClassUID = MR_IMAGE_STORAGE
+    meta.MediaStorageSOPInstanceUID = '1.2.3.%d.%d' % (series, instance)
+    meta.TransferSyntaxUID = EXPLICIT_VR_LITTLE_ENDIAN
+    meta.ImplementationClassUID = '1.2.3.4'
+    dcm = FileDataset('%04d.dcm' % instance, {}, file_meta=meta, preamble='\0' * 128)
+    dcm.is_little_endian = True
+    dcm.is_implicit_VR = False
+    dcm.SOPClassUID = meta.MediaStorageSOPClassUID
+    dcm.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    dcm.Manufacturer = 'GE MEDICAL SYSTEMS'
+    dcm.ImageType = ['ORIGINAL', 'PRIMARY', 'OTHER']
+    dcm.PatientID = 'ex1234@scitran/tests'
+    dcm.StudyID = '1234'
+    dcm.StudyInstanceUID = '1.2.3'
+    dcm.StudyDate = '20150101'
+    dcm.StudyTime = '101010'
+    dcm.SeriesInstanceUID = '1.2.3.%d' % series
+    dcm.SeriesNumber = str(series)
+    dcm.SeriesDescription = 'series %d' % series
+    dcm.InstanceNumber = str(instance)
+    return dcm
+
+
+def write_dicom_zip(path, series, num_images=4, num_tags=0):
+    """Write a zip of num_images GE MR dicoms of series, with num_tags filler private tags each."""
+    with zipfile.ZipFile(path, 'w') as archive:
+        for i in range(num_images):
+            dcm = dicom_dataset(series, i + 1)
+            for tag in range(num_tags):
+                dcm.add_new((0x0043, 0x1000 + tag), 'LO', 'filler %d' % tag)
+            buf = cStringIO.StringIO()
+            dcm.save_as(buf)
+            archive.writestr('%04d.dcm' % i, buf.getvalue())
+        archive.comment = json.dumps({'filetype': 'dicom'})
+    return path
+
+
+def mr_series(order, num_slices, matrix=16):
+    """
+    Return the dicoms of a GE MR series, one per (volume, slice) of order.
+
+    Slices are axial, 2 mm in plane and 3 mm apart.
+
+    """
+    rng = np.random.RandomState(num_slices)
+    dcms = []
+    for i, (volume, slice_) in enumerate(order):
+        dcm = dicom_dataset(1, i + 1)
+        dcm.TemporalPositionIdentifier = str(volume + 1)
+        dcm.PixelSpacing = ['2', '2']
+        dcm.SliceThickness = '3'
+        dcm.ImageOrientationPatient = ['1', '0', '0', '0', '1', '0']
+        z = 3. * slice_ - 1.5 * num_slices
+        dcm.ImagePositionPatient = [str(-matrix), str(-matrix), str(z)]
+        dcm.SliceLocation = str(z)
+        dcm.TriggerTime = str(100. * slice_)
+        dcm.Rows = dcm.Columns = matrix
+        dcm.SamplesPerPixel = 1
+        dcm.PhotometricInterpretation = 'MONOCHROME2'
+        dcm.BitsAllocated = dcm.BitsStored = 16
+        dcm.HighBit = 15
+        dcm.PixelRepresentation = 1
+        dcm.add_new((0x7fe0, 0x0010), 'OW', rng.randint(0, 1000, size=(matrix, matrix)).astype('<i2').tostring())
+        dcms.append(dcm)
+    return dcms
+
+
+class Series(object):
+
+    """What ge.stack_groups needs of a Dicom: num_slices and filepath."""
+
+    def __init__(self, num_slices):
+        self.num_slices = num_slices
+        self.filepath = 'series'
+
+
+def coil_groups(num_coils, num_slices, matrix=16):
+    """Return the dicoms of a multicoil series, grouped by coil as ge.parse_all does."""
+    from scitran.data.medimg.dcm import dcm
+    # the combined image and each coil, interleaved at every slice
+    dcm_list = mr_series([(0, s) for s in range(num_slices) for _ in range(num_coils + 1)], num_slices, matrix)
+    geometry = dcm.geometry_table(dcm_list)
+    return [(dcm_list[x::num_coils + 1], geometry[x::num_coils + 1]) for x in xrange(num_coils + 1)]
+
+
+def fastcard_groups(cardiac_images, num_slices, matrix=16):
+    """Return the dicoms of a fastcard series, in the 5 groups that ge.fastcard_convert stacks."""
+    from scitran.data.medimg.dcm import dcm
+    order = [(t, s) for _ in range(5) for t in range(cardiac_images) for s in range(num_slices)]
+    dcm_list = mr_series(order, num_slices, matrix)
+    geometry = dcm.geometry_table(dcm_list)
+    size = cardiac_images * num_slices
+    return [(dcm_list[i:i + size], geometry[i:i + size]) for i in range(0, len(dcm_list), size)]
+
+
+def stack_groups_sequence(self, groups, label):
+    """ge.stack_groups, as multicoil_convert did it, with a NiftiWrapper per group."""
+    from scitran.data.medimg.dcm import dcm
+    _, dcmstack = dcm.import_dicom_stack()
+    stacks = []
+    for group, geometry in groups:
+        stack = dcmstack.DicomStack()
+        for d in group:
+            stack.add_dcm(d, dcm.MetaExtractor(d))
+        stacks.append(stack.to_nifti_wrapper())
+    nii = dcmstack.dcmmeta.NiftiWrapper.from_sequence(stacks).nii_img
+    return nii.get_data(), nii.get_affine()
+
+
+def make_records(num_records):
+    """Return num_records ReaderRecords with realistic values."""
+    start = datetime.datetime(2015, 1, 1, 8, 0, 0, 123000)
+    records = []
+    for i in range(num_records):
+        values = {
+            'filepath': '/scratch/reap/ex%d/%d_1_dicom.zip' % (1000 + i // 20, i),
+            'failure_reason': None,
+            'nims_group_id': u'lab',
+            'nims_project': u'project',
+            'nims_session_id': u'1.2.840.113619.2.%d' % (i // 20),
+            'nims_session_label': u'2015-01-01 08:00',
+            'nims_session_subject': u'ex%d' % (1000 + i // 20),
+            'nims_acquisition_id': u'1.2.840.113619.2.%d.%d_1' % (i // 20, i),
+            'nims_acquisition_label': u'%d.1' % (i % 20),
+            'nims_acquisition_description': u'fMRI run %d' % (i % 20),
+            'nims_file_name': u'%d_1_dicom' % i,
+            'nims_file_ext': u'.zip',
+            'nims_file_domain': u'mr',
+            'nims_file_type': u'dicom',
+            'nims_file_kinds': [u'functional'],
+            'nims_file_state': [u'orig'],
+            'nims_metadata_status': u'complete',
+            'nims_timestamp': start + datetime.timedelta(minutes=i),
+            'nims_timezone': u'America/Los_Angeles',
+        }
+        records.append(scidata.ReaderRecord(**values))
+    return records
+
+
+def gradient_table(num_directions, decimals=4, seed=0):
+    """Return (bvecs, bvals) of num_directions, as stored in dicoms: 3xN bvecs scaled by shell."""
+    rng = np.random.RandomState(seed)
+    bvecs = rng.normal(size=(3, num_directions))
+    bvecs /= np.sqrt((bvecs ** 2).sum(axis=0))
+    bvals = np.repeat([0., 1000., 2000., 3000.], num_directions // 4 + 1)[:num_directions]
+    bvecs *= np.sqrt(bvals / bvals.max())   # scanners store the shell in the bvec magnitude
+    return bvecs.round(decimals), np.repeat(bvals.max(), num_directions)
+
+
+def rotation_matrix(seed=0):
+    """Return a random 3x3 rotation, as the image orientation of an oblique acquisition."""
+    q, _ = np.linalg.qr(np.random.RandomState(seed).normal(size=(3, 3)))
+    return q
+
+
+def scale_bvals_loop(bvecs, bvals):
+    """mr.scale_bvals, as it was before vectorization."""
+    if np.count_nonzero(bvecs) != 0 and np.count_nonzero(bvals) != 0:
+        sqmag = np.array([bv.dot(bv) for bv in bvecs.T])
+        try:
+            num_decimals = np.nonzero([np.max(np.abs(bvecs - bvecs.round(decimals=d))) for d in range(9)])[0][-1] + 1
+        except IndexError:
+            num_decimals = 1
+        sqmag = np.around(sqmag, decimals=num_decimals - 1)
+        bvals *= sqmag
+        sqmag[sqmag == 0] = np.inf
+        bvecs /= np.sqrt(sqmag)
+    return bvecs, bvals
+
+
+def rotate_bvecs_loop(bvecs, bvals, rotation):
+    """mr.rotate_bvecs, as it was before vectorization."""
+    bvecs = np.array(np.matrix(rotation) * bvecs)
+    norm = np.sqrt(np.array([bv.dot(bv) for bv in bvecs.T]))
+    norm[norm == 0] = np.inf
+    bvecs /= norm
+    return bvecs, bvals
+
+
+def adjust_bvecs_loop(bvecs, bvals, rotation):
+    """mr.adjust_bvecs of GE dwi, as it was before vectorization."""
+    bvecs, bvals = scale_bvals_loop(bvecs, bvals)
+    return rotate_bvecs_loop(bvecs, bvals, rotation)
+
+
+def write_meeg_zip(path, num_channels=4, num_samples=100, sfreq=1000.):
+    """Write a zip of a fif recording of num_channels eeg channels, as MEEGReader reads them."""
+    import mne
+    info = mne.create_info(['EEG%03d' % c for c in range(num_channels)], sfreq, 'eeg')
+    info['meas_date'] = (1420103700, 0)
+    info['experimenter'] = 'neuromag'
+    info['proj_name'] = 'tests'
+    info['description'] = 'resting state'
+    info['subject_info'] = {
+        'his_id': 'ex1234', 'first_name': 'first', 'last_name': 'last',
+        'birthday': (1980, 1, 2), 'hand': 1, 'sex': 2,
+    }
+    raw = mne.io.RawArray(np.random.RandomState(0).normal(scale=1e-5, size=(num_channels, num_samples)), info, verbose=False)
+    dirpath = tempfile.mkdtemp()
+    try:
+        fif = os.path.join(dirpath, 'test_raw.fif')
+        with warnings.catch_warnings(record=True):
+            raw.save(fif, verbose=False)
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.write(fif, 'reap/test_raw.fif')
+            archive.comment = json.dumps({'filetype': 'meeg'})
+    finally:
+        shutil.rmtree(dirpath)
+    return path
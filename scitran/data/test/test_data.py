@@ -4,6 +4,13 @@
 
 import os
 import glob
+import pytz
+import datetime
+import types
+import pstats
+import cProfile
+import cStringIO
+import json
 import numpy as np
 
 from nose.plugins.attrib import attr
@@ -12,6 +19,11 @@ from nose.tools import ok_, eq_, raises, assert_raises
 
 import scitran.data as scidata
 import scitran.data.tempdir as tempfile
+from scitran.data import spans
+from scitran.data.bench import synth
+from scitran.data.bench import suite
+
+import fixtures
 
 # data is stored separately in nimsdata_testdata
 # located at the top level of the testing directory
@@ -52,6 +64,16 @@ class test_properties_by_type_list(object):
     def test_project(self):
         ok_(scidata.project_properties_by_type_list(self.type_list))
 
+    def test_memoized(self):
+        merged = scidata.dict_merge([scidata.data.module_by_type(t).acquisition_properties for t in sorted(self.type_list)])
+        eq_(scidata.acquisition_properties_by_type_list(self.type_list), merged)
+        eq_(scidata.acquisition_properties_by_type_list(self.type_list[::-1] * 2), merged)
+
+    def test_memoized_copy(self):
+        props = scidata.session_properties_by_type_list(self.type_list)
+        props['subject']['properties'].clear()
+        ok_(scidata.session_properties_by_type_list(self.type_list)['subject']['properties'])
+
 
 # Test the parse interface, without getting into any of the parsers
 # make sure errors are being raised in the right places
@@ -126,6 +148,295 @@ class test_write(object):
     def test_empty_data(self):
         eq_(scidata.write(self.ds, None, filetype='nifti', outbase='trashme'), [])
 
+
+class test_reader_record(object):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, 'series.zip')
+        fixtures.write_dicom_zip(self.path, 3, num_images=2, num_tags=10)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_compact_parse(self):
+        ds = scidata.parse(self.path)
+        rec = scidata.parse(self.path, compact=True)
+        ok_(isinstance(rec, scidata.ReaderRecord))
+        eq_(type(rec).__slots__, ())
+        eq_(rec.filepath, ds.filepath)
+        for name in scidata.data.NIMS_FIELDS:
+            eq_(getattr(rec, name), getattr(ds, name))
+        eq_(rec.nims_acquisition_description, 'series 3')
+
+    def test_immutable(self):
+        rec = scidata.parse(self.path, compact=True)
+        assert_raises(AttributeError, setattr, rec, 'nims_project', 'other')
+
+    def test_schema_fields(self):
+        ds = scidata.parse(self.path)
+        fields = dict(type(ds).schema_fields())
+        eq_(fields['session.subject.code'], 'nims_session_subject')
+        eq_(fields['acquisition.label'], 'nims_acquisition_label')
+        ok_(scidata.data.Reader._class_schema() is not type(ds)._class_schema())
+
+    def test_nims_dict(self):
+        ds = scidata.parse(self.path)
+        nims = ds.nims_dict()
+        eq_(sorted(nims), sorted(n for n in dir(ds) if n.startswith('nims_') and n != 'nims_dict'))
+        for name, value in nims.iteritems():
+            eq_(value, getattr(ds, name))
+
+    def test_compact_with_load_data(self):
+        assert_raises(scidata.DataError, scidata.parse, self.path, load_data=True, compact=True)
+
+
+class test_parse_cache(object):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, 'series.zip')
+        fixtures.write_dicom_zip(self.path, 3, num_images=2)
+        self.cache = scidata.ParseCache(os.path.join(self.tempdir.name, 'cache'))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_hit(self):
+        ds = scidata.parse(self.path, cache=self.cache)
+        cached = scidata.parse(self.path, cache=self.cache)
+        eq_(self.cache.stats(), {'hits': 1, 'misses': 1, 'evictions': 0})
+        ok_(isinstance(cached, scidata.data.CachedReader))
+        for name in scidata.data.NIMS_FIELDS:
+            eq_(getattr(cached, name), getattr(ds, name))
+        eq_(cached.series_desc, ds.series_desc)
+        eq_(cached.timestamp, ds.timestamp)
+        assert_raises(scidata.DataError, cached.load_data)
+        eq_(cached.nims_dict(), ds.nims_dict())
+        ok_('%-30s: %s' % ('nims_acquisition_description', 'series 3') in str(cached).splitlines())
+        rec = scidata.parse(self.path, compact=True, cache=self.cache)
+        eq_(rec, scidata.ReaderRecord.from_reader(ds))
+
+    def test_changed_input(self):
+        scidata.parse(self.path, cache=self.cache)
+        fixtures.write_dicom_zip(self.path, 4, num_images=2)
+        ds = scidata.parse(self.path, cache=self.cache)
+        eq_(self.cache.stats()['misses'], 2)
+        eq_(ds.nims_acquisition_description, 'series 4')
+
+    def test_key_arguments(self):
+        key = self.cache.key(self.path)
+        scidata.parse(self.path, cache=self.cache)
+        ok_(self.cache.get(key))
+        eq_(self.cache.key(self.path, 'dicom'), self.cache.key(self.path, 'dicom'))
+        ok_(self.cache.key(self.path, 'dicom') != key)
+
+    def test_content_hash_prefix(self):
+        path = os.path.join(self.tempdir.name, 'P00000.7')
+        header = 'h' * scidata.data.PARSE_CACHE_HASH_BYTES
+        with open(path, 'wb') as fp:
+            fp.write(header + 'a' * 1024)
+        digest = self.cache.content_hash(path)
+        with open(path, 'wb') as fp:
+            fp.write(header + 'b' * 1024)
+        eq_(self.cache.content_hash(path), digest)
+        with open(path, 'wb') as fp:
+            fp.write('H' + header[1:] + 'a' * 1024)
+        ok_(self.cache.content_hash(path) != digest)
+
+    def test_evict(self):
+        paths = []
+        for series in range(4):
+            paths.append(os.path.join(self.tempdir.name, '%d.zip' % series))
+            fixtures.write_dicom_zip(paths[-1], series + 1, num_images=1)
+        self.cache.max_bytes = 1
+        for path in paths:
+            scidata.parse(path, cache=self.cache)
+        eq_(len(self.cache._entries()), 1)
+        eq_(self.cache.evictions, 3)
+        ok_(self.cache.get(self.cache.key(paths[-1])))
+
+    def test_replaced_entry(self):
+        ds = scidata.parse(self.path, cache=self.cache)
+        key = self.cache.key(self.path)
+        self.cache.add(key, ds)
+        self.cache.add(key, ds)
+        eq_(self.cache._total_bytes, sum([os.path.getsize(e) for e in self.cache._entries()]))
+
+    def test_unwritable_cache(self):
+        blocker = os.path.join(self.tempdir.name, 'blocker')
+        open(blocker, 'w').close()
+        cache = scidata.ParseCache(os.path.join(blocker, 'cache'))     # under a file, so never writable
+        ds = scidata.parse(self.path, cache=cache)
+        eq_(ds.nims_acquisition_description, 'series 3')
+        eq_(scidata.parse(self.path, cache=cache).nims_acquisition_description, 'series 3')
+        eq_(cache.stats(), {'hits': 0, 'misses': 2, 'evictions': 0})
+
+    def test_corrupt_zip(self):
+        path = os.path.join(self.tempdir.name, 'corrupt.zip')
+        with open(self.path, 'rb') as fp:
+            content = fp.read()
+        with open(path, 'wb') as fp:
+            fp.write(content.replace('PK\x01\x02', 'PK\x00\x00'))   # corrupt central directory
+        eq_(self.cache.key(path), None)
+
+
+class test_jsonl(object):
+
+    def test_epoch_ms(self):
+        for dt in [datetime.datetime(2015, 1, 1, 8, 0, 0, 123999),
+                   datetime.datetime(1969, 7, 20, 20, 17, 40, 500),
+                   pytz.timezone('America/Los_Angeles').localize(datetime.datetime(2015, 6, 1, 12))]:
+            eq_(scidata.util.epoch_ms(dt), scidata.util.datetime_encoder(dt)['$date'])
+        eq_(scidata.util.from_epoch_ms(scidata.util.epoch_ms(datetime.datetime(2015, 1, 1, 8, 0, 0, 123999))),
+            datetime.datetime(2015, 1, 1, 8, 0, 0, 123000))
+
+    def test_roundtrip(self):
+        recs = fixtures.make_records(5)
+        buf = cStringIO.StringIO()
+        eq_(scidata.dump_jsonl(recs, buf), 5)
+        lines = buf.getvalue().splitlines()
+        eq_(len(lines), 5)
+        for line, rec in zip(lines, recs):
+            eq_(json.loads(line), json.loads(json.dumps(scidata.data.export_fields(rec), default=scidata.util.datetime_encoder)))
+        loaded = scidata.load_jsonl(cStringIO.StringIO(buf.getvalue()))
+        eq_([r['nims_timestamp'] for r in loaded], [r.nims_timestamp for r in recs])
+        eq_(loaded[0]['filepath'], recs[0].filepath)
+        ok_('failure_reason' not in loaded[0])
+
+
+class test_spans(object):
+
+    def setUp(self):
+        self.spans = []
+        self.sink = spans.add_sink(self.spans.append)
+
+    def tearDown(self):
+        spans.remove_sink(self.sink)
+
+    def test_nested(self):
+        with spans.span('outer', label='a'):
+            with spans.span('inner') as stats:
+                stats.bytes += 10
+        eq_([(s.name, s.parent, s.bytes) for s in self.spans], [('inner', 'outer', 10), ('outer', None, 0)])
+        eq_(self.spans[1].attrs, {'label': 'a'})
+        ok_(self.spans[1].wall >= self.spans[0].wall >= 0)
+
+    def test_error(self):
+        def fail():
+            with spans.span('failing'):
+                raise ValueError('failed')
+        assert_raises(ValueError, fail)
+        eq_(self.spans[0].attrs, {'error': 'ValueError'})
+
+    def test_parse(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'series.zip')
+            fixtures.write_dicom_zip(path, 3, num_images=2)
+            scidata.parse(path, cache=False)
+            size = os.path.getsize(path)
+        eq_([s.name for s in self.spans], ['zip open', 'header decode', 'parse_one', 'parse'])
+        eq_(set([s.parent for s in self.spans[:-1]]), set(['parse']))
+        eq_(self.spans[-1].attrs['size'], size)
+        eq_(self.spans[-1].bytes, 0)
+        ok_(0 < self.spans[1].bytes < size)
+
+    def test_json_sink(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            sink = spans.add_sink(spans.JsonSink(os.path.join(tempdir, 'spans.jsonl')))
+            try:
+                with spans.span('one', filename='a.dcm') as stats:
+                    stats.bytes = 5
+            finally:
+                spans.remove_sink(sink)
+            with open(sink.path) as fp:
+                lines = [json.loads(line) for line in fp]
+        eq_(len(lines), 1)
+        eq_((lines[0]['name'], lines[0]['bytes'], lines[0]['attrs']), ('one', 5, {'filename': 'a.dcm'}))
+
+
+def composed_parse_all(self):
+    return sum(range(1000))
+
+
+class test_cli_reports(object):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tempdir.name, 'series.zip')
+        fixtures.write_dicom_zip(path, 3, num_images=2)
+        self.ds = scidata.parse(path, cache=False)
+        self.ds.parse_all = types.MethodType(composed_parse_all, self.ds)   # as a composer would
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_composed_functions(self):
+        from scitran.data.medimg.dcm.mr import ge
+        eq_(scidata.data.composed_functions(self.ds),
+            [('parse_one', ge.parse_one), ('parse_all', composed_parse_all), ('convert', ge.convert)])
+
+    def test_profile_report(self):
+        profiler = cProfile.Profile()
+        profiler.runcall(self.ds.parse_all)
+        report = scidata.data.profile_report(pstats.Stats(profiler), self.ds, top=5)
+        line = [l for l in report.splitlines() if l.startswith('parse_all')][0]
+        eq_(line.split()[1:3], ['%s.composed_parse_all' % __name__, '1'])
+
+    def test_memory_report(self):
+        stage_spans = [spans.Span('parse_all', None, .1, .1, 0, 1024, {}), spans.Span('write', None, .2, .2, 10, 0, {})]
+        lines = scidata.data.memory_report(stage_spans, self.ds).splitlines()
+        eq_(len(lines), 3)
+        ok_(lines[1].startswith('parse_all') and lines[1].endswith('composed_parse_all'))
+        ok_('+1024' in lines[1])
+
+
+class test_preload(object):
+
+    def test_preload(self):
+        handlers = scidata.preload(['dicom', 'nifti'])
+        eq_(handlers[0], scidata.get_reader('dicom'))
+        eq_(handlers[1:], [scidata.get_reader('nifti'), scidata.get_writer('nifti')])
+        ok_(scidata.get_reader('dicom') is handlers[0])
+
+    def test_preload_unknown(self):
+        assert_raises(scidata.DataError, scidata.preload, ['fake'])
+
+    def test_composer_cache(self):
+        from scitran.data.medimg.dcm import dcm
+        scidata.preload(['dicom'])
+        ok_(dcm.get_composer('mr.ge') is dcm._composers['mr.ge'])
+        ok_(dcm.get_composer('mr.ge').parse_one)
+        eq_(dcm.get_composer('None.ge'), None)
+
+
+class test_bench_suite(object):
+
+    def test_mr_series(self):
+        eq_(len(synth.mr_series(num_slices=4, num_timepoints=3)), 12)
+        eq_(len(synth.mr_series(num_slices=4, dwi_dirs=6)), 28)
+        eq_(len(synth.mr_series(num_slices=4, num_coils=2)), 12)
+        eq_(len(synth.mr_series(num_slices=4, cardiac_images=3)), 60)
+        dcms = synth.mr_series(manufacturer='SIEMENS', matrix=8, num_slices=5, num_timepoints=2, mosaic=True)
+        eq_(len(dcms), 2)
+        eq_((dcms[0].Rows, dcms[0].Columns), (24, 24))
+
+    def check_case(self, case):
+        results = suite.run_case(case)
+        eq_([(stage, r['error']) for stage, r in sorted(results.iteritems()) if 'error' in r], [])
+        ok_('seconds' in results['write' if case.split()[0] in ['dicom', 'writer'] else 'parse'])
+
+    def test_cases(self):
+        for case in sorted(suite.CASES):
+            yield self.check_case, case
+
+    def test_compare(self):
+        old = {'cases': {'pfile': {'parse': {'seconds': 1.}, 'load_data': {'error': 'ImportError'}}}}
+        new = {'cases': {'pfile': {'parse': {'seconds': 1.5}, 'load_data': {'seconds': 1.}}}}
+        eq_(list(suite.compare(old, new)), [('pfile', 'parse', 1., 1.5, True)])
+        eq_(list(suite.compare(old, new, threshold=2.)), [('pfile', 'parse', 1., 1.5, False)])
+
+
 # how to write tests for the abstract classes NIMSReader and NIMSWriter
 # they are non instantiable, and have no class methods that can be tested
 # XXX. i'm not sure what the best approcah is.
@@ -9,6 +9,9 @@ from numpy.testing.decorators import skipif
 from nose.tools import ok_, eq_, raises, assert_raises
 
 import scitran.data as scidata
+import scitran.data.tempdir as tempfile
+
+import fixtures
 
 # data is stored separately in nimsdata_testdata
 # located at the top level of the testing directory
@@ -85,3 +88,150 @@ class Test_Dicom(object):
     def test_dcm_sr_ge(self):
         """dcm.sr.ge"""
         pass
+
+
+class Test_SOP_Class(object):
+
+    """SOP Class UID of a parsed dicom, and the composer it selects."""
+
+    def setUp(self):
+        from scitran.data.medimg.dcm import dcm
+        self.dcm = dcm
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = fixtures.write_dicom_zip(os.path.join(self.tempdir.name, 'dicom.zip'), 3, num_images=2)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_dotted_uid(self):
+        eq_(self.dcm.dotted_uid('MR Image Storage'), '1.2.840.10008.5.1.4.1.1.4')
+        eq_(self.dcm.dotted_uid('1.2.840.10008.5.1.4.1.1.4'), '1.2.840.10008.5.1.4.1.1.4')
+        eq_(self.dcm.dotted_uid('1.2.3.4'), '1.2.3.4')
+
+    def test_composer(self):
+        # pydicom 0.9 gives the SOP Class UID by name; the composer is looked up by dotted UID
+        ds = scidata.parse(self.path)
+        eq_(ds.sop_class_uid, '1.2.840.10008.5.1.4.1.1.4')
+        ok_('parse_all' in vars(ds))
+
+class Test_MR_Geometry(object):
+
+    """Per-series geometry table, and the batched checks shared by dcm.mr.ge and dcm.mr.siemens."""
+
+    def setUp(self):
+        from scitran.data.medimg.dcm import dcm
+        from scitran.data.medimg.dcm.mr import mr
+        self.dcm, self.mr = dcm, mr
+        axial = [1., 0., 0., 0., 1., 0.]
+        # 3 slices x 2 volumes, at z = 0, 5, 10
+        self.dcm_list = [{'ImageOrientationPatient': axial, 'ImagePositionPatient': [-100., -100., z], 'SliceLocation': z,
+                          'TriggerTime': 100. * i, 'InstanceNumber': i + 1} for i, z in enumerate([0., 5., 10.] * 2)]
+        self.geometry = dcm.geometry_table(self.dcm_list)
+
+    def test_geometry_table(self):
+        geometry = self.dcm.geometry_table(self.dcm_list + [{'ImageOrientationPatient': [1., 0.], 'TriggerTime': ''}])
+        eq_(geometry.shape, (7,))
+        eq_(geometry['orientation'].shape, (7, 6))
+        eq_(geometry['position'].shape, (7, 3))
+        eq_(list(geometry['position'][:3, 2]), [0., 5., 10.])
+        eq_(list(geometry['instance_number'][:6]), range(1, 7))
+        ok_(np.isnan(geometry[-1]['orientation']).all())
+        ok_(np.isnan([geometry[-1][f] for f in ['trigger_time', 'slice_location', 'instance_number']]).all())
+
+    def test_is_localizer(self):
+        orientations = self.geometry['orientation']
+        ok_(not self.mr.is_localizer(orientations))
+        # flipped normals are still parallel
+        ok_(not self.mr.is_localizer(np.vstack([orientations, [[1., 0., 0., 0., -1., 0.]]])))
+        ok_(self.mr.is_localizer(np.vstack([orientations, [[0., 1., 0., 0., 0., -1.]]])))
+
+    def test_count_at_position(self):
+        positions = self.geometry['position']
+        eq_(self.mr.count_at_position(positions, [-100., -100., 5.]), 2)
+        eq_(self.mr.count_at_position(positions, [-100., -100., 5. + 1e-9]), 2)
+        eq_(self.mr.count_at_position(positions, [-100., -100., 2.5]), 0)
+
+
+class Test_MR_Bvecs(object):
+
+    """Vectorized bvec and bval adjustment, against the per-bvec loops it replaced."""
+
+    def setUp(self):
+        from scitran.data.medimg.dcm.mr import mr
+        self.mr = mr
+
+    def check_adjust(self, num_directions, decimals):
+        bvecs, bvals = fixtures.gradient_table(num_directions, decimals, seed=num_directions)
+        rotation = fixtures.rotation_matrix(num_directions)
+        expected = fixtures.adjust_bvecs_loop(bvecs.copy(), bvals.copy(), rotation)
+        result = self.mr.adjust_bvecs(bvecs.copy(), bvals.copy(), 'GE MEDICAL SYSTEMS', rotation)
+        ok_(np.array_equal(expected[0], result[0]))
+        ok_(np.array_equal(expected[1], result[1]))
+
+    def test_adjust_bvecs(self):
+        for num_directions in [2, 7, 64, 1000]:
+            for decimals in [0, 3, 4, 6, 12]:
+                yield self.check_adjust, num_directions, decimals
+
+    def test_count_decimals(self):
+        for decimals in range(12):
+            values = np.random.RandomState(decimals).normal(size=(3, 50)).round(decimals)
+            expected = np.nonzero([np.max(np.abs(values - values.round(decimals=d))) for d in range(9)])[0]
+            eq_(self.mr.count_decimals(values), expected[-1] + 1 if expected.size else 1)
+        eq_(self.mr.count_decimals(np.array([[1., np.inf], [0., 2.]])), 9)
+
+    def test_count_decimals_nonfinite(self):
+        # raise, rather than warn, as another import may have set numpy to ignore invalid values
+        with np.errstate(invalid='raise'):
+            eq_(self.mr.count_decimals(np.array([[1., np.nan], [0., 2.]])), 9)
+            eq_(self.mr.count_decimals(np.array([[1., -np.inf], [np.nan, 2.]])), 9)
+
+    def test_siemens_flip(self):
+        bvecs, bvals = fixtures.gradient_table(30)
+        result, _ = self.mr.adjust_bvecs(bvecs.copy(), bvals.copy(), 'SIEMENS')
+        expected, _ = fixtures.rotate_bvecs_loop(*fixtures.scale_bvals_loop(bvecs.copy(), bvals.copy()) + (np.diag((-1., -1., 1.)),))
+        ok_(np.array_equal(result, expected))
+
+
+class Test_GE_Stack_Groups(object):
+
+    """Multicoil and fastcard groups stacked into one preallocated array, against NiftiWrapper.from_sequence."""
+
+    def setUp(self):
+        from scitran.data.medimg.dcm import dcm
+        from scitran.data.medimg.dcm.mr import ge
+        self.dcm, self.ge = dcm, ge
+        self.threads = ge.STACK_THREADS
+
+    def tearDown(self):
+        self.ge.STACK_THREADS = self.threads
+
+    def groups(self, kind):
+        if kind == 'multicoil':
+            return fixtures.Series(6), fixtures.coil_groups(4, num_slices=6)
+        return fixtures.Series(4), fixtures.fastcard_groups(3, num_slices=4)
+
+    def check_stack_groups(self, kind, threads):
+        self.ge.STACK_THREADS = threads
+        series, groups = self.groups(kind)
+        expected = fixtures.stack_groups_sequence(series, groups, 'coil')
+        result = self.ge.stack_groups(series, groups, 'coil')
+        eq_(result[0].shape, expected[0].shape)
+        eq_(result[0].dtype, expected[0].dtype)
+        ok_(np.array_equal(result[0], expected[0]))
+        ok_(np.array_equal(result[1], expected[1]))
+
+    def test_stack_groups(self):
+        for kind in ['multicoil', 'fastcard']:
+            for threads in [1, 3, 8]:
+                yield self.check_stack_groups, kind, threads
+
+    def test_missing_positions(self):
+        groups = fixtures.coil_groups(2, num_slices=6)
+        groups[2] = (groups[2][0][:-1], groups[2][1][:-1])
+        assert_raises(self.dcm.DicomError, self.ge.stack_groups, fixtures.Series(6), groups, 'coil')
+
+    def test_mismatched_shape(self):
+        groups = fixtures.coil_groups(2, num_slices=6)
+        groups[1] = fixtures.coil_groups(2, num_slices=6, matrix=8)[1]
+        assert_raises(self.dcm.DicomError, self.ge.stack_groups, fixtures.Series(6), groups, 'coil')
@@ -0,0 +1,30 @@
+import os
+
+from nose.tools import ok_, eq_
+
+import scitran.data as scidata
+import scitran.data.tempdir as tempfile
+
+import fixtures
+
+
+class Test_MEEG(object):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = fixtures.write_meeg_zip(os.path.join(self.tempdir.name, 'meeg.zip'))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_parse(self):
+        ds = scidata.parse(self.path, filetype='meeg')
+        eq_(ds.session_subject, 'ex1234')
+        eq_(ds.acquisition, 'resting state')
+        ok_(not ds._raws[0].preload)
+
+    def test_load_data(self):
+        ds = scidata.parse(self.path, filetype='meeg')
+        ds.load_data()
+        ok_(ds._raws[0].preload)
+        eq_(ds._raws[0]._data.shape, (4, 100))
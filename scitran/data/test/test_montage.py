@@ -56,3 +56,28 @@ class Test_Montage(object):
             scidata.write(self.ds, self.ds.data, outbase=outbase, filetype='montage')
             outfile = os.path.join(tempdir, os.listdir(tempdir)[0])
             ok_(scidata.medimg.montage.get_tile(outfile, 0, 0, 0))     # all montage have 0, 0, 0
+
+
+class Test_Generate_Montage(object):
+
+    def setUp(self):
+        from scitran.data.medimg import montage
+        self.montage = montage
+
+    def test_single_slice(self):
+        montage = self.montage.generate_montage(np.arange(24, dtype=np.int16).reshape(4, 6))
+        eq_(montage.shape, (6, 4))
+        eq_(montage.dtype, np.uint8)
+
+    def test_timeseries(self):
+        # (x, y, z, t) is tiled with one row per timepoint and one column per slice
+        imagedata = np.zeros((4, 6, 3, 2), dtype=np.int16)
+        imagedata[..., 1] = 1000
+        montage = self.montage.generate_montage(imagedata)
+        eq_(montage.shape, (2 * 6, 3 * 4))
+        eq_(montage[:6].max(), 0)
+        eq_(montage[6:].min(), 255)
+
+    def test_timepoints(self):
+        montage = self.montage.generate_montage(np.arange(144, dtype=np.int16).reshape(4, 6, 3, 2, 1), timepoints=[0, 1, 2])
+        eq_(montage.shape, (6, 3 * 4))
@@ -11,6 +11,7 @@ import dicom
 import nibabel
 
 import scitran.data as scidata
+import scitran.data.tempdir as tempfile
 
 
 DATADIR = os.path.join(os.path.dirname(__file__), 'testdata')
@@ -29,6 +30,19 @@ class Test_Nifti(object):
 
         pass
 
+    def test_load_data(self):
+        """load_data takes no arguments, as Reader.load_data, and labels the voxels ''"""
+        voxels = np.arange(4 * 5 * 3, dtype=np.int16).reshape(4, 5, 3, 1)
+        affine = np.diag([2., 2., 3., 1.])
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'image.nii.gz')
+            nibabel.save(nibabel.Nifti1Image(voxels, affine), path)
+            ds = scidata.get_reader('nifti')(path)     # parse only takes zips and pfiles
+            ds.load_data()
+        eq_(ds.data.keys(), [''])
+        ok_(np.array_equal(ds.data[''], voxels.squeeze()))
+        ok_(np.array_equal(ds.qto_xyz, affine))
+
     def test_writing(self):
         """
         Write pixeldata and metadata to nifti
@@ -0,0 +1,752 @@
+import os
+import sys
+import gzip
+import struct
+import zipfile
+import subprocess
+import datetime
+import numpy as np
+
+from nose.tools import ok_, eq_, raises, assert_raises
+
+import scitran.data as scidata
+import scitran.data.tempdir as tempfile
+from scitran.data.medimg import pfile
+
+# min parse header fields as (struct format, byte offset by pfile version), from the GE rdbm
+# headers.  Deliberately not derived from pfile.MIN_PARSE_FIELDS, so that a wrong offset there
+# cannot round trip through the fixtures.
+HEADER_FIELDS = {
+    'scan_date':        ('10s', {24: 16, 23: 16, 22: 16, 12: 16}),
+    'scan_time':        ('8s', {24: 26, 23: 26, 22: 26, 12: 26}),
+    'num_timepoints':   ('h', {24: 64, 23: 64, 22: 64, 12: 64}),
+    'num_echos':        ('h', {24: 70, 23: 70, 22: 70, 12: 70}),
+    'rec_user0':        ('f', {24: 216, 23: 216, 22: 216, 12: 216}),
+    'rec_user6':        ('f', {24: 240, 23: 240, 22: 240, 12: 240}),
+    'rec_user7':        ('f', {24: 244, 23: 244, 22: 244, 12: 244}),
+    'ileaves':          ('h', {24: 914, 23: 914, 22: 914, 12: 914}),
+    'exam_no':          ('H', {24: 143516, 23: 143516, 22: 143516, 12: 61576}),
+    'exam_uid':         ('32s', {24: 144248, 23: 144248, 22: 144240, 12: 61966}),
+    'patient_id':       ('65s', {24: 144409, 23: 144409, 22: 144401, 12: 62127}),
+    'series_no':        ('h', {24: 145622, 23: 145622, 22: 145622, 12: 62710}),
+    'series_desc':      ('65s', {24: 145762, 23: 145762, 22: 145762, 12: 62786}),
+    'series_uid':       ('32s', {24: 145875, 23: 145875, 22: 145875, 12: 62899}),
+    'im_datetime':      ('i', {24: 148388, 23: 148388, 22: 148388, 12: 65016}),
+    'tr':               ('i', {24: 148396, 23: 148396, 22: 148396, 12: 65024}),
+    'acq_no':           ('h', {24: 148834, 23: 148834, 22: 148834, 12: 65328}),
+    'psd_name':         ('33s', {24: 148972, 23: 148972, 22: 148972, 12: 65374}),
+}
+
+VERSION_BYTES = {
+    24: '\x00\x00\xc0A',
+    23: 'V\x0e\xa0A',
+    22: 'J\x0c\xa0A',
+    12: '\x00\x000A',
+}
+
+HEADER_VALUES = {
+    'scan_date': '01/02/115\0',
+    'scan_time': '13:45\0\0\0',
+    'num_timepoints': 10,
+    'num_echos': 1,
+    'rec_user0': 0.,
+    'rec_user6': 3.,
+    'rec_user7': 2.,
+    'ileaves': 1,
+    'exam_no': 1234,
+    'exam_uid': '\x2b\x34',         # packed '1.23'
+    'patient_id': 'ex1234@scitran/scidata',
+    'series_no': 5,
+    'series_desc': 'mux3 epi',
+    'series_uid': '\x2b\x35',       # packed '1.24'
+    'im_datetime': 1420070400,
+    'tr': 2000000,
+    'acq_no': 1,
+    'psd_name': '/usr/g/bin/mux_epi2',
+}
+
+
+def write_fake_pfile(path, version, values=HEADER_VALUES, compress=False, data_size=0):
+    """Write the minimum header needed to min parse a pfile of the given version, at the offsets of HEADER_FIELDS."""
+    fields = [(struct.Struct(fmt), offsets[version], values[name]) for name, (fmt, offsets) in HEADER_FIELDS.iteritems()]
+    buf = bytearray(max([offset + st.size for st, offset, _ in fields]))
+    buf[0:4] = VERSION_BYTES[version]
+    buf[34:44] = 'GE_MED_NMR'
+    for st, offset, value in fields:
+        st.pack_into(buf, offset, value)
+    with gzip.open(path, 'wb') if compress else open(path, 'wb') as fp:
+        fp.write(str(buf))
+        fp.write('\0' * data_size)
+    return path
+
+
+class test_min_parse(object):
+
+    def check_min_parse(self, version, compress=False):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'P12345.7' + ('.gz' if compress else ''))
+            write_fake_pfile(path, version, compress=compress)
+            ds = pfile.PFile(path)
+        eq_(ds.version, version)
+        eq_(ds.exam_no, '1234')
+        eq_(ds.exam_uid, '1.23')
+        eq_(ds.series_uid, '1.24')
+        eq_(ds.series_no, 5)
+        eq_(ds.series_desc, 'mux3 epi')
+        eq_(ds.acq_no, 1)
+        eq_(ds.tr, 2.)
+        eq_(ds.psd_name, 'mux_epi2')
+        eq_(ds.psd_type, 'muxepi')
+        eq_(ds.num_timepoints, 10 + 3 * 1 * (2 - 1))
+        eq_(ds.timestamp, datetime.datetime(2015, 1, 1))
+        eq_((ds.subj_code, ds.group_name, ds.project_name), ('ex1234', 'scitran', 'scidata'))
+        eq_(ds.metadata_status, 'pending')
+
+    def test_v24(self):
+        self.check_min_parse(24)
+
+    def test_v23(self):
+        self.check_min_parse(23)
+
+    def test_v22(self):
+        self.check_min_parse(22)
+
+    def test_v12(self):
+        self.check_min_parse(12)
+
+    def test_gzip(self):
+        self.check_min_parse(24, compress=True)
+        self.check_min_parse(12, compress=True)
+
+    def test_scan_date_fallback(self):
+        values = dict(HEADER_VALUES, im_datetime=0)
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = write_fake_pfile(os.path.join(tempdir, 'P12345.7'), 12, values)
+            ds = pfile.PFile(path)
+        eq_(ds.timestamp, datetime.datetime(2015, 1, 2, 13, 45))
+
+    def test_truncated_header(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = write_fake_pfile(os.path.join(tempdir, 'P12345.7'), 24)
+            with open(path, 'r+b') as fp:
+                fp.truncate(145000)
+            assert_raises(pfile.PFileError, pfile.PFile, path)
+
+    def test_layout_size(self):
+        for version, layout in pfile.MIN_PARSE_LAYOUTS.iteritems():
+            eq_(layout.size, max([offset + struct.calcsize(fmt) for _, offset, fmt, _ in pfile.MIN_PARSE_FIELDS[version]]))
+
+    def test_layout_offsets(self):
+        for version, fields in pfile.MIN_PARSE_FIELDS.iteritems():
+            eq_(sorted([(name, (fmt, offset)) for name, offset, fmt, _ in fields]),
+                sorted([(name, (fmt, offsets[version])) for name, (fmt, offsets) in HEADER_FIELDS.iteritems()]))
+
+
+class test_pfile_header(object):
+
+    PFileHeader = pfile.PFileHeader
+
+    def test_read_seek(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'P12345.7.gz')
+            with gzip.open(path, 'wb') as fp:
+                fp.write(''.join([chr(i % 256) for i in range(100000)]))
+            header = pfile.PFileHeader(path)
+            ok_(header.compressed)
+            eq_(header.read(4), '\x00\x01\x02\x03')
+            header.seek(300)
+            eq_(header.tell(), 300)
+            eq_(header.read(2), '\x2c\x2d')
+            header.seek(-1, 2)
+            eq_(header.read(), '\x9f')
+            eq_(len(header.head(200000)), 100000)
+            header.close()
+
+    def test_header_read_once(self):
+        # the header is shared by get_version and _min_parse, and decompression stops
+        # shortly after the end of the header region, not at the end of the file
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'P12345.7.gz')
+            write_fake_pfile(path, 24, compress=True, data_size=10 * 1024 * 1024)
+            header_size = pfile.MIN_PARSE_LAYOUTS[24].size
+            headers = self.record_headers()
+            try:
+                pfile.PFile(path)
+            finally:
+                pfile.PFileHeader = self.PFileHeader
+        eq_([h.name for h in headers], [path])
+        ok_(header_size <= len(headers[0]._buf) < header_size + pfile.HEADER_READ_BLOCK)
+        ok_(headers[0]._fileobj is None)
+
+    def record_headers(self):
+        """Replace pfile.PFileHeader with a subclass that records its instances, and return the record."""
+        headers = []
+
+        class RecordedHeader(self.PFileHeader):
+            def __init__(self, *args, **kwargs):
+                super(RecordedHeader, self).__init__(*args, **kwargs)
+                headers.append(self)
+
+        pfile.PFileHeader = RecordedHeader
+        return headers
+
+    def test_header_released(self):
+        # the header buffer is not kept for the life of the PFile, whether parsing succeeds or not
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = write_fake_pfile(os.path.join(tempdir, 'P12345.7'), 24)
+            ds = pfile.PFile(path)
+            ok_(ds._header is None)
+            headers = self.record_headers()
+            try:
+                with open(path, 'r+b') as fp:
+                    fp.truncate(145000)
+                assert_raises(pfile.PFileError, pfile.PFile, path)
+                with open(path, 'wb') as fp:
+                    fp.write('not a pfile')
+                assert_raises(pfile.PFileError, pfile.PFile, path)
+            finally:
+                pfile.PFileHeader = self.PFileHeader
+        eq_(len(headers), 2)
+        ok_(all([h._fileobj is None for h in headers]))
+
+
+class test_uncompress(object):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.dirpath = self.tempdir.name
+        self.content = os.urandom(3 * 1024 * 1024 + 17)
+        self.gzpath = os.path.join(self.dirpath, 'P12345 (copy).7.gz')
+        with gzip.open(self.gzpath, 'wb') as fp:
+            fp.write(self.content)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def check_uncompress(self):
+        outdir = os.path.join(self.dirpath, 'out')
+        os.mkdir(outdir)
+        newpath = pfile.uncompress(self.gzpath, outdir, chunk_size=65536)
+        eq_(newpath, os.path.join(outdir, 'P12345 (copy).7'))
+        with open(newpath, 'rb') as fp:
+            ok_(fp.read() == self.content)
+
+    def test_uncompress(self):
+        self.check_uncompress()
+
+    def test_uncompress_in_process(self):
+        find_executable = pfile.distutils.spawn.find_executable
+        pfile.distutils.spawn.find_executable = lambda name: None
+        try:
+            self.check_uncompress()
+        finally:
+            pfile.distutils.spawn.find_executable = find_executable
+
+    def test_related_files(self):
+        for f in ['P12345.7_ref.dat', 'P12345.7_vrgf.dat', 'P54321.7.gz', 'P54321.7_ref.dat']:
+            open(os.path.join(self.dirpath, f), 'w').close()
+        pfilepath = os.path.join(self.dirpath, 'P12345.7.gz')
+        eq_(pfile.pfile_prefix(pfilepath), 'P12345.7')
+        eq_([os.path.basename(f) for f in pfile.related_files(pfilepath)],
+            ['P12345.7_ref.dat', 'P12345.7_vrgf.dat'])
+
+
+class test_zip_input(object):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        dirpath = self.tempdir.name
+        self.pfilepath = write_fake_pfile(os.path.join(dirpath, 'P12345.7'), 24, data_size=1024 * 1024)
+        with open(self.pfilepath, 'rb') as fp:
+            self.content = fp.read()
+        self.zippath = os.path.join(dirpath, 'pfile.zip')
+        with zipfile.ZipFile(self.zippath, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.write(self.pfilepath, 'arc/P12345.7')
+            zf.writestr('arc/P12345.7_ref.dat', 'ref')
+            zf.writestr('arc/P12345.7_vrgf.dat', 'vrgf')
+            zf.writestr('arc/P12345.7_tensor.dat', 'tensor')
+            zf.writestr('arc/P12345.7_other.dat', 'other')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_find_pfile_member(self):
+        with zipfile.ZipFile(self.zippath) as zf:
+            eq_(pfile.find_pfile_member(zf), 'arc/P12345.7')
+        with zipfile.ZipFile(os.path.join(self.tempdir.name, 'empty.zip'), 'w') as zf:
+            zf.writestr('arc/P12345.7_ref.dat', 'ref')
+        with zipfile.ZipFile(os.path.join(self.tempdir.name, 'empty.zip')) as zf:
+            assert_raises(pfile.PFileError, pfile.find_pfile_member, zf)
+
+    def test_stream_header_from_zip(self):
+        header = pfile.PFileHeader(self.zippath, 'arc/P12345.7')
+        ok_(not header.compressed)
+        eq_(pfile.get_version(header), 24)
+        eq_(header.head(150000), self.content[:150000])
+        header.close()
+        header.seek(200000)                 # reopens the member, and skips the buffered bytes
+        eq_(header.read(100), self.content[200000:200100])
+        header.close()
+        ok_(len(header._buf) < len(self.content))
+
+    def test_stream_gzip_header_from_zip(self):
+        gzpath = self.pfilepath + '.gz'
+        with gzip.open(gzpath, 'wb') as fp:
+            fp.write(self.content)
+        with zipfile.ZipFile(self.zippath, 'a') as zf:
+            zf.write(gzpath, 'gz/P12345.7.gz')
+        header = pfile.PFileHeader(self.zippath, 'gz/P12345.7.gz')
+        ok_(header.compressed)
+        eq_(header.head(150000), self.content[:150000])
+        header.close()
+        header.seek(160000)
+        eq_(header.read(10), self.content[160000:160010])
+        header.close()
+
+    def test_recon_members(self):
+        ds = pfile.PFile(self.pfilepath)
+        with zipfile.ZipFile(self.zippath) as zf:
+            namelist = zf.namelist()
+        ds.psd_type, ds.is_dwi = 'muxepi', False
+        eq_(ds.recon_members(namelist, 'arc/P12345.7'),
+            ['arc/P12345.7', 'arc/P12345.7_ref.dat', 'arc/P12345.7_vrgf.dat'])
+        ds.psd_type, ds.is_dwi = 'spiral', True
+        eq_(ds.recon_members(namelist, 'arc/P12345.7'), ['arc/P12345.7', 'arc/P12345.7_tensor.dat'])
+        ds.psd_type, ds.is_dwi = 'mrs', False
+        eq_(ds.recon_members(namelist, 'arc/P12345.7'), ['arc/P12345.7'])
+
+
+class test_run_jobs(object):
+
+    # jobs are ordered by an event log and by release files, not by how long they take
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.events = []
+        self.procs = {}
+        self.subprocess = pfile.subprocess
+        pfile.subprocess = Struct(Popen=self.popen)
+
+    def tearDown(self):
+        pfile.subprocess = self.subprocess
+        for proc in self.procs.itervalues():
+            if proc.poll() is None:
+                proc.kill()
+        self.tempdir.cleanup()
+
+    def popen(self, args, **kwargs):
+        """subprocess.Popen, recording when each job is started and terminated."""
+        events, key = self.events, args[-1]
+
+        class Popen(self.subprocess.Popen):
+            def terminate(self):
+                events.append(('terminate', key))
+                super(Popen, self).terminate()
+
+        events.append(('start', key))
+        self.procs[key] = Popen(args, **kwargs)
+        return self.procs[key]
+
+    def on_complete(self, key):
+        self.events.append(('done', key))
+
+    def release(self, key):
+        open(os.path.join(self.tempdir.name, key + '.release'), 'w').close()
+
+    def job(self, key, wait=False, status=0):
+        """A job that exits with status, after its release file exists if wait is set."""
+        release = os.path.join(self.tempdir.name, key + '.release')
+        code = ('import os, sys, time\n'
+                'deadline = time.time() + 30\n'
+                'while %r and not os.path.exists(%r):\n'
+                '    if time.time() > deadline:\n'
+                '        sys.exit(99)\n'
+                '    time.sleep(0.01)\n'
+                'sys.exit(%d)' % (wait, release, status))
+        return (key, [sys.executable, '-c', code, key])
+
+    def test_refill_on_exit(self):
+        # one held job and many short ones; the short ones should all run, one after another, in the second slot
+        def on_complete(key):
+            self.on_complete(key)
+            if key == 'short3':
+                self.release('held')
+        jobs = [self.job('held', wait=True)] + [self.job('short%d' % i) for i in range(4)]
+        pfile.run_jobs(jobs, 2, on_complete)
+        eq_(self.events, [('start', 'held'), ('start', 'short0'), ('done', 'short0'),
+                          ('start', 'short1'), ('done', 'short1'), ('start', 'short2'), ('done', 'short2'),
+                          ('start', 'short3'), ('done', 'short3'), ('done', 'held')])
+
+    def test_failure(self):
+        # the held job is never released; it is terminated when the bad job fails, and the last job never starts
+        jobs = [self.job('held', wait=True), self.job('bad', status=3), self.job('never')]
+        assert_raises(pfile.PFileError, pfile.run_jobs, jobs, 2, self.on_complete)
+        eq_(self.events, [('start', 'held'), ('start', 'bad'), ('terminate', 'held')])
+
+
+class test_merge_imagedata(object):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.ds = pfile.PFile(write_fake_pfile(os.path.join(self.tempdir.name, 'P12345.7'), 24))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def write_slice(self, slice_num, data, sz):
+        import scipy.io
+        path = os.path.join(self.tempdir.name, 'sl_%03d.mat' % slice_num)
+        scipy.io.savemat(path, {'d': data, 'd_size': np.array(sz), 'sl_loc': np.array([slice_num + 1, slice_num + 4])})
+        return path
+
+    def test_merge(self):
+        data = np.random.rand(4, 5, 2, 3)
+        img, t = self.ds.merge_imagedata_from_file(self.write_slice(1, data, [4, 5, 6, 3]))
+        eq_((img.shape, img.dtype, t), ((4, 5, 6, 3), np.float32, 3))
+        ok_(np.allclose(img[:, :, [1, 4]], data[::-1]))
+        eq_(np.count_nonzero(img[:, :, [0, 2, 3, 5]]), 0)
+        # a partial slice leaves the trailing timepoints alone, a longer one grows the volume
+        img, t = self.ds.merge_imagedata_from_file(self.write_slice(0, data[..., :2], [4, 5, 6, 2]), img)
+        eq_((img.shape, t), ((4, 5, 6, 3), 2))
+        ok_(np.allclose(img[:, :, [0, 3], :2], data[::-1, ..., :2]))
+        eq_(np.count_nonzero(img[:, :, [0, 3], 2]), 0)
+        longer = np.random.rand(4, 5, 2, 4)
+        img, t = self.ds.merge_imagedata_from_file(self.write_slice(2, longer, [4, 5, 6, 4]), img)
+        eq_((img.shape, t), ((4, 5, 6, 4), 4))
+        ok_(np.allclose(img[:, :, [2, 5]], longer[::-1]))
+        ok_(np.allclose(img[:, :, [1, 4], :3], data[::-1]))
+
+    def test_merge_mip(self):
+        import scipy.io
+        path = os.path.join(self.tempdir.name, 'sl_000.mat')
+        mip = np.random.rand(5, 4, 6, 2)
+        scipy.io.savemat(path, {'MIP_res': mip})
+        img, t = self.ds.merge_imagedata_from_file(path)
+        eq_((img.shape, img.dtype, t), ((4, 5, 6, 2), np.float32, 2))
+        ok_(np.allclose(img, self.ds.load_imagedata_from_file(path)))
+
+    def test_merge_neither(self):
+        import scipy.io
+        path = os.path.join(self.tempdir.name, 'sl_000.mat')
+        scipy.io.savemat(path, {'x': np.zeros(3)})
+        assert_raises(pfile.PFileError, self.ds.merge_imagedata_from_file, path)
+
+
+class test_calibration_cache(object):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        dirpath = self.tempdir.name
+        os.mkdir(os.path.join(dirpath, 'cal'))
+        self.calpath = write_fake_pfile(os.path.join(dirpath, 'cal', 'P11111.7'), 24)
+        for suffix in ['_ref.dat', '_vrgf.dat']:
+            with open(self.calpath + suffix, 'w') as fp:
+                fp.write(suffix * 100)
+        self.zippath = os.path.join(dirpath, 'cal.zip')
+        with zipfile.ZipFile(self.zippath, 'w') as zf:
+            for f in os.listdir(os.path.join(dirpath, 'cal')):
+                zf.write(os.path.join(dirpath, 'cal', f), 'P11111/' + f)
+        self.cache = pfile.CalibrationCache(os.path.join(dirpath, 'cache'))
+        self.key = ('1.23', '1.24', 'mux_epi2')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def check_cal_file(self, cal_file):
+        eq_(os.path.basename(cal_file), 'P11111.7')
+        with open(cal_file + '_ref.dat') as fp:
+            eq_(fp.read(), '_ref.dat' * 100)
+        with open(cal_file + '_vrgf.dat') as fp:
+            eq_(fp.read(), '_vrgf.dat' * 100)
+
+    def test_calibration_key(self):
+        eq_(pfile.calibration_key(self.calpath), self.key)
+        eq_(pfile.calibration_key(self.zippath), self.key)
+
+    def test_extract_calibration(self):
+        for aux_file in [self.zippath, self.calpath]:
+            with tempfile.TemporaryDirectory() as dirpath:
+                cal_file = pfile.extract_calibration(aux_file, dirpath)
+                eq_(os.path.dirname(cal_file), dirpath)
+                self.check_cal_file(cal_file)
+        os.remove(self.calpath + '_vrgf.dat')
+        with tempfile.TemporaryDirectory() as dirpath:
+            eq_(pfile.extract_calibration(self.calpath, dirpath), None)
+
+    def test_add_get(self):
+        eq_(self.cache.get(self.key), None)
+        cal_file = self.cache.add(self.key, self.calpath)
+        os.remove(self.calpath + '_ref.dat')          # cached copies do not depend on the aux file
+        self.check_cal_file(cal_file)
+        eq_(self.cache.get(self.key), cal_file)
+        eq_(self.cache.add(('1.23', '1.25', 'mux_epi2'), self.calpath), None)
+
+    def test_evict(self):
+        first = self.cache.add(self.key, self.zippath)
+        os.utime(os.path.dirname(first), (0, 0))
+        self.cache.max_bytes = 2000
+        second = self.cache.add(('1.23', '1.25', 'mux_epi2'), self.zippath)
+        eq_(self.cache.get(self.key), None)
+        eq_(self.cache.get(('1.23', '1.25', 'mux_epi2')), second)
+
+    def test_find_calibration(self):
+        ds = pfile.PFile(write_fake_pfile(os.path.join(self.tempdir.name, 'P22222.7'), 24))
+        ds.cal_cache = self.cache
+        eq_(ds.find_calibration(self.tempdir.name), None)
+        ds.aux_file = self.zippath
+        cal_file = ds.find_calibration(self.tempdir.name)
+        eq_(self.cache.get(self.key), cal_file)
+        eq_(ds.find_calibration(self.tempdir.name), cal_file)
+        ds.aux_file = None                              # cached calibrations need their aux file
+        eq_(ds.find_calibration(self.tempdir.name), None)
+        ds.cal_cache, ds.aux_file = None, self.calpath
+        self.check_cal_file(ds.find_calibration(self.tempdir.name))
+
+    def test_prep_convert(self):
+        ds = pfile.PFile(write_fake_pfile(os.path.join(self.tempdir.name, 'P22222.7'), 24))
+        ds.cal_cache, ds.num_mux_cal_cycle, ds.ti = self.cache, 0, 0.
+        eq_(ds.prep_convert(), {'psd': 'mux_epi2'})
+        ds.aux_file = self.zippath
+        eq_(ds.prep_convert(), {'psd': 'mux_epi2'})     # not cached yet
+        cal_file = ds.find_calibration(self.tempdir.name)
+        eq_(ds.prep_convert(), {'psd': 'mux_epi2', 'cal_file': cal_file})
+        ds.aux_file = None                              # cached calibrations need their aux file
+        eq_(ds.prep_convert(), {'psd': 'mux_epi2'})
+        other = write_fake_pfile(os.path.join(self.tempdir.name, 'P33333.7'), 24, dict(HEADER_VALUES, series_uid='\x2b\x36'))
+        ds.aux_file = other                             # same exam and psd, another calibration scan
+        eq_(ds.prep_convert(), {'psd': 'mux_epi2'})
+        ds.aux_file = os.path.join(self.tempdir.name, 'missing.7')
+        eq_(ds.prep_convert(), {'psd': 'mux_epi2'})
+
+    def test_unwritable_cache(self):
+        ds = pfile.PFile(write_fake_pfile(os.path.join(self.tempdir.name, 'P22222.7'), 24))
+        with open(os.path.join(self.tempdir.name, 'file'), 'w'):
+            pass
+        ds.cal_cache = pfile.CalibrationCache(os.path.join(self.tempdir.name, 'file', 'cache'))
+        ds.aux_file = self.zippath
+        with tempfile.TemporaryDirectory() as dirpath:
+            cal_file = ds.find_calibration(dirpath)
+            eq_(os.path.dirname(cal_file), dirpath)
+            self.check_cal_file(cal_file)
+
+
+class test_recon_spirec(object):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.ds = pfile.PFile(write_fake_pfile(os.path.join(self.tempdir.name, 'P12345.7'), 24))
+        self.ds.size, self.ds.num_timepoints, self.ds.num_slices = [6, 5], 4, 3
+        self.call = pfile.subprocess.call
+
+    def tearDown(self):
+        pfile.subprocess.call = self.call
+        self.tempdir.cleanup()
+
+    def recon(self, num_echos):
+        # stand in for spirec, writing x, y, time, echo, slice magnitudes in fortran order
+        self.ds.num_echos = num_echos
+        mag = np.random.rand(6, 5, 4, num_echos, 3).astype(np.float32) + 1.
+        def spirec(args, **kwargs):
+            basepath = args[args.index('-t') + 1]
+            mag.ravel(order='F').tofile(basepath + '.mag_float')
+            return 0
+        pfile.subprocess.call = spirec
+        self.ds.recon_spirec(self.ds.filepath, self.tempdir.name)
+        return mag.transpose((0, 1, 4, 2, 3))
+
+    def test_one_echo(self):
+        mag = self.recon(1)
+        eq_(self.ds.data[''].shape, (6, 5, 3, 4, 1))
+        ok_(np.array_equal(self.ds.data[''], mag))
+        ok_(not isinstance(self.ds.data[''], np.memmap))
+
+    def test_spiral_in_out(self):
+        mag = self.recon(2)
+        w_in, w_out = mag[..., 0].mean(3), mag[..., 1].mean(3)
+        w_in, w_out = w_in / (w_in + w_out), w_out / (w_in + w_out)
+        expected = np.zeros(mag.shape[:4])
+        for tp in range(mag.shape[3]):
+            expected[:, :, :, tp] = w_in * mag[:, :, :, tp, 0] + w_out * mag[:, :, :, tp, 1]
+        eq_(self.ds.data[''].dtype, np.float32)
+        ok_(np.allclose(self.ds.data[''], expected, rtol=1e-5))
+
+
+class test_read_mat_vars(object):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.mat = {
+            'd': np.random.rand(6, 5, 3, 4),
+            'd_size': np.array([[6, 5, 3, 4]], np.float64),
+            'sl_loc': np.array([2, 4, 6], np.uint8),
+            'cplx': np.random.rand(3, 4) + 1j * np.random.rand(3, 4),
+            'single': np.random.rand(7).astype(np.float32),
+            'a_long_variable_name': np.arange(12, dtype=np.int16).reshape(3, 4),
+            'skipped_text': 'not numeric',
+        }
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def check_read(self, **kwargs):
+        import scipy.io
+        path = os.path.join(self.tempdir.name, 'sl_000.mat')
+        scipy.io.savemat(path, self.mat, **kwargs)
+        names = ['d', 'd_size', 'sl_loc', 'cplx', 'single', 'a_long_variable_name', 'missing']
+        arrays = pfile.read_mat_vars(path, names)
+        expected = scipy.io.loadmat(path)
+        eq_(sorted(arrays), sorted(names[:-1]))
+        for name, array in arrays.iteritems():
+            eq_(array.shape, expected[name].shape)
+            eq_(array.dtype, expected[name].dtype)
+            ok_(np.array_equal(array, expected[name]))
+            ok_(array.flags.writeable)
+
+    def test_uncompressed(self):
+        self.check_read()
+
+    def test_compressed(self):
+        self.check_read(do_compression=True)
+
+    def test_v4_fallback(self):
+        del self.mat['skipped_text']
+        self.mat['d'] = self.mat['d'].reshape(30, 12)
+        self.check_read(format='4')
+
+    def test_struct_fallback(self):
+        self.mat['d'] = {'field': np.arange(3)}
+        path = os.path.join(self.tempdir.name, 'sl_000.mat')
+        import scipy.io
+        scipy.io.savemat(path, self.mat)
+        arrays = pfile.read_mat_vars(path, ['d', 'd_size'])
+        eq_(arrays['d'].dtype.names, ('field',))
+        ok_(np.array_equal(arrays['d_size'], self.mat['d_size']))
+
+
+def recon_stub(ds, filepath, tempdir=None):
+    ds.data = {'': filepath}
+
+
+class test_recon_backends(object):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.ds = pfile.PFile(write_fake_pfile(os.path.join(self.tempdir.name, 'P12345.7'), 24))
+        self.backends = dict(pfile.RECON_BACKENDS)
+
+    def tearDown(self):
+        pfile.RECON_BACKENDS.clear()
+        pfile.RECON_BACKENDS.update(self.backends)
+        self.tempdir.cleanup()
+
+    def test_configured(self):
+        eq_(sorted(pfile.RECON_BACKENDS), sorted(pfile.RECONS))
+        for psd_type, backend in pfile.RECON_BACKENDS.iteritems():
+            ok_(callable(backend.func))
+        eq_(pfile.RECON_BACKENDS['spiral'].func, pfile.PFile.recon_spirec)
+        eq_(pfile.RECON_BACKENDS['basic'].func, pfile.PFile.recon_basic)
+        self.ds.psd_type = 'muxepi'
+        eq_(self.ds.recon_resources, {'cores': 4, 'memory_mb': 16384})
+        self.ds.psd_type = 'unknown'
+        eq_((self.ds.recon_func, self.ds.recon_resources, self.ds.priority), (None, None, -1))
+
+    def test_register(self):
+        pfile.register_recon('epi', recon_stub, cores=2)
+        self.ds.psd_type = 'epi'
+        eq_(self.ds.recon_resources, {'cores': 2, 'memory_mb': 1024})
+        eq_(self.ds.priority, 1)
+        self.ds.recon_func('P12345.7')
+        eq_(self.ds.data, {'': 'P12345.7'})
+        eq_(pfile.ReconBackend('os.path.join').func, os.path.join)
+        pfile.register_recon('epi', 'no.such.module.recon')
+        assert_raises(pfile.PFileError, lambda: self.ds.recon_func)
+
+    def test_cli_script(self):
+        # data.py, run as a script, imports the package as data rather than scitran.data; the recon
+        # backend must still be a method of the PFile class that the script's reader is.  There is
+        # no gepfile here for a full parse, so _full_parse is skipped, and sprl_hos is a hoshim
+        # recon, which needs no recon tools.
+        path = write_fake_pfile(os.path.join(self.tempdir.name, 'P22222.7'), 24, dict(HEADER_VALUES, psd_name='sprl_hos'))
+        script = os.path.abspath(os.path.join(os.path.dirname(pfile.__file__), os.pardir, 'data.py'))
+        code = '; '.join([
+            'import sys, runpy',
+            'sys.path.insert(0, %r)' % os.path.dirname(script),                   # as python does for a script
+            'sys.path.insert(0, %r)' % os.path.dirname(os.path.dirname(script)),  # as data.py then does
+            'import data.medimg.pfile',
+            'data.medimg.pfile.PFile._full_parse = lambda self, filepath=None: None',
+            'sys.argv = [%r, %r, "-p", "pfile", "-i", "-v"]' % (script, path),
+            'runpy.run_path(%r, run_name="__main__")' % script,
+        ])
+        proc = subprocess.Popen([sys.executable, '-c', code], cwd=self.tempdir.name, stderr=subprocess.PIPE)
+        _, stderr = proc.communicate()
+        ok_('HOSHIM recon not implemented' in stderr, stderr)
+        ok_('pixel data could not be loaded' not in stderr, stderr)
+
+
+class Struct(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class test_rawdata(object):
+
+    def setUp(self):
+        # pass, coil, slice, echo, baseline + frames, frame_size, real/imag
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.raw = np.random.randint(-1000, 1000, (2, 3, 1, 2, 1 + 5, 8, 2)).astype(np.int16)
+        self.offset = 1000
+        self.ds = pfile.PFile(write_fake_pfile(os.path.join(self.tempdir.name, 'P12345.7'), 24))
+        with open(self.ds.filepath + '.raw', 'wb') as fp:
+            fp.write('\0' * self.offset + self.raw.tostring())
+        self.ds._hdr = Struct(rec=Struct(nframes=4, hnover=1, nechoes=2, nslices=2, npasses=2, frame_size=8, point_size=2, off_data=self.offset))
+        self.ds.num_receivers = 3
+        # frame_size, passes, slices, frames, echos, coils
+        self.expected = (self.raw[..., 0] + 1j * self.raw[..., 1])[:, :, :, :, 1:].transpose((5, 0, 2, 4, 3, 1))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_recon_mrs(self):
+        self.ds.recon_mrs(self.ds.filepath + '.raw')
+        eq_(self.ds.data[''].dtype, np.complex64)
+        ok_(self.ds.data[''].flags.c_contiguous)
+        ok_(np.array_equal(self.ds.data[''], self.expected))
+
+    def test_recon_mrs_subset(self):
+        self.ds.mrs_frames, self.ds.mrs_coils, self.ds.mrs_stream = [3, 1], [2], True
+        self.ds.recon_mrs(self.ds.filepath + '.raw', self.tempdir.name)
+        ok_(isinstance(self.ds.data[''], np.memmap))
+        ok_(np.array_equal(self.ds.data[''], self.expected[:, :, :, [3, 1]][..., [2]]))
+
+    def test_stream_lifetime(self):
+        # the backing file stays in the caller's tempdir while the data, or a view of it, is in use
+        self.ds.mrs_stream = True
+        self.ds.recon_mrs(self.ds.filepath + '.raw', self.tempdir.name)
+        path = self.ds.data[''].filename
+        eq_(os.path.dirname(os.path.dirname(path)), os.path.abspath(self.tempdir.name))
+        view = self.ds.data[''][:, 1]
+        self.ds.data = None
+        ok_(os.path.isfile(path))
+        ok_(np.array_equal(view, self.expected[:, 1]))
+        del view
+        ok_(not os.path.exists(os.path.dirname(path)))
+
+    def test_bad_selection(self):
+        path = self.ds.filepath + '.raw'
+        assert_raises(pfile.PFileError, self.ds.get_rawdata, path, frames=[])
+        assert_raises(pfile.PFileError, self.ds.get_rawdata, path, coils=[3])
+        assert_raises(pfile.PFileError, self.ds.get_rawdata, path, passes=[-1])
+        assert_raises(pfile.PFileError, list, self.ds.iter_rawdata(path, frames=[5]))
+        self.ds.mrs_frames = []
+        assert_raises(pfile.PFileError, self.ds.recon_mrs, path)
+
+    def test_get_rawdata(self):
+        with open(self.ds.filepath + '.raw', 'rb') as fp, gzip.open(self.ds.filepath + '.raw.gz', 'wb') as gz:
+            gz.write(fp.read())
+        for path in [self.ds.filepath + '.raw', self.ds.filepath + '.raw.gz']:
+            data = self.ds.get_rawdata(path, passes=[1], echos=[1, 0])
+            eq_(data.shape, (8, 5, 2, 1, 3, 1))
+            eq_(data.dtype, np.complex128)
+            ok_(np.array_equal(data, self.expected[:, [1]][..., [1, 0], :].transpose((0, 3, 4, 2, 5, 1))))
+        eq_(self.ds.get_rawdata(path, passes=[1], dtype=np.complex64).dtype, np.complex64)
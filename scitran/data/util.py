@@ -16,3 +16,20 @@ def datetime_decoder(dct):
     if "$date" in dct:
         return datetime.datetime.utcfromtimestamp(float(dct["$date"]) / 1000.0)
     return dct
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def epoch_ms(o):
+    """Milliseconds since the epoch of datetime o, the same value as datetime_encoder's $date."""
+    if o.utcoffset() is not None:
+        o = (o - o.utcoffset()).replace(tzinfo=None)
+    td = o - EPOCH
+    return (td.days * 86400 + td.seconds) * 1000 + td.microseconds // 1000
+
+
+def from_epoch_ms(ms):
+    """Naive UTC datetime of ms milliseconds since the epoch."""
+    return EPOCH + datetime.timedelta(milliseconds=ms)
+